@@ -1,5 +1,4 @@
 import os
-import shotgun_api3
 import slack_shotgun_bot
 import random
 
@@ -24,7 +23,7 @@ def registerCallbacks(reg):
         "query_statuses": ["cmpt"],
     }
     # Grab an sg connection for the validator.
-    sg = shotgun_api3.Shotgun(server, script_name=script_name, api_key=script_key)
+    sg = reg.getShotgun(script_name, script_key, server)
 
     # Bail if our validator fails.
     if not is_valid(sg, reg.logger):
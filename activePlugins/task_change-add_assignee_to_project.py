@@ -8,7 +8,6 @@
 # See docs folder for detailed usage info.
 
 import os
-import shotgun_api3
 
 
 def registerCallbacks(reg):
@@ -25,7 +24,7 @@ def registerCallbacks(reg):
     script_key = os.environ["SG_SCRIPT_KEY"]
 
     # Grab an sg connection for the validator.
-    sg = shotgun_api3.Shotgun(server, script_name=script_name, api_key=script_key)
+    sg = reg.getShotgun(script_name, script_key, server)
 
     # Bail if our validator fails.
     if not is_valid(sg, reg.logger):
@@ -1,5 +1,4 @@
 import os
-import shotgun_api3
 import slack_shotgun_bot
 
 __SG_SITE = os.environ["SG_SERVER"]
@@ -19,7 +18,7 @@ def registerCallbacks(reg):
     script_key = os.environ["SG_SCRIPT_KEY"]
 
     # Grab an sg connection for the validator.
-    sg = shotgun_api3.Shotgun(server, script_name=script_name, api_key=script_key)
+    sg = reg.getShotgun(script_name, script_key, server)
 
     # Bail if our validator fails.
     if not is_valid(sg, reg.logger):
@@ -97,36 +96,25 @@ def task_assignment_alert(sg, logger, event, args):
         if task_assignee["type"] == "HumanUser":
             users.append(task_assignee)
 
-    for user in users:
-        slack_id = slack_shotgun_bot.get_slack_user_id(sg, user["id"])
-        if slack_id:
-            data = {
-                "project": "<{}/page/project_overview?project_id={}|{}>".format(
-                    __SG_SITE, proj_data.get("id"), proj_data.get("code")
-                ),
-                "task": "<{}/detail/Task/{}|{}>".format(
-                    __SG_SITE, task_data.get("id"), task_data.get("content")
-                ),
-            }
-            message = "You've been assigned {project} / {task}".format(**data)
-
-            if task_link:
-                data["task_link"] = "<{}/detail/{}/{}|{}>".format(
-                    __SG_SITE,
-                    task_link.get("type"),
-                    task_link.get("id"),
-                    task_link.get("name"),
-                )
-                message = "You've been assigned {project} / {task_link} / {task}".format(
-                    **data
-                )
-
-            slack_message = slack_shotgun_bot.send_message(slack_id, message)
-            if slack_message["ok"]:
-                logger.info("New assignment alert sent to {}.".format(user["name"]))
-            elif slack_message["error"]:
-                logger.warning(
-                    "New assignment alert to {} failed to send with error: {}".format(
-                        user["name"], slack_message["error"]
-                    )
-                )
+    data = {
+        "project": "<{}/page/project_overview?project_id={}|{}>".format(
+            __SG_SITE, proj_data.get("id"), proj_data.get("code")
+        ),
+        "task": "<{}/detail/Task/{}|{}>".format(
+            __SG_SITE, task_data.get("id"), task_data.get("content")
+        ),
+    }
+    message = "You've been assigned {project} / {task}".format(**data)
+
+    if task_link:
+        data["task_link"] = "<{}/detail/{}/{}|{}>".format(
+            __SG_SITE, task_link.get("type"), task_link.get("id"), task_link.get("name")
+        )
+        message = "You've been assigned {project} / {task_link} / {task}".format(
+            **data
+        )
+
+    # Send all the alerts at once, then check how each of them went.
+    slack_shotgun_bot.send_user_messages(
+        sg, users, logger, "New assignment alert", message
+    )
@@ -1,5 +1,4 @@
 import os
-import shotgun_api3
 import slack_shotgun_bot
 
 __SG_SITE = os.environ["SG_SERVER"]
@@ -24,7 +23,7 @@ def registerCallbacks(reg):
     }
 
     # Grab an sg connection for the validator.
-    sg = shotgun_api3.Shotgun(server, script_name=script_name, api_key=script_key)
+    sg = reg.getShotgun(script_name, script_key, server)
 
     # Bail if our validator fails.
     if not is_valid(sg, reg.logger):
@@ -190,17 +189,7 @@ def ticket_status_alert(sg, logger, event, args):
                 else:
                     users.append(group_user)
 
-    for user in users:
-        slack_id = slack_shotgun_bot.get_slack_user_id(sg, user["id"])
-        if slack_id:
-            slack_message = slack_shotgun_bot.send_message(
-                slack_id, None, attachments=attachments
-            )
-            if slack_message["ok"]:
-                logger.info("Ticket status alert sent to {}.".format(user["name"]))
-            elif slack_message["error"]:
-                logger.warning(
-                    "Ticket status alert to {} failed to send with error: {}".format(
-                        user["name"], slack_message["error"]
-                    )
-                )
+    # Send all the alerts at once, then check how each of them went.
+    slack_shotgun_bot.send_user_messages(
+        sg, users, logger, "Ticket status alert", attachments=attachments
+    )
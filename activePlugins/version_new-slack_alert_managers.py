@@ -1,5 +1,4 @@
 import os
-import shotgun_api3
 import slack_shotgun_bot
 
 __SG_SITE = os.environ["SG_SERVER"]
@@ -19,7 +18,7 @@ def registerCallbacks(reg):
     script_key = os.environ["SG_SCRIPT_KEY"]
 
     # Grab an sg connection for the validator.
-    sg = shotgun_api3.Shotgun(server, script_name=script_name, api_key=script_key)
+    sg = reg.getShotgun(script_name, script_key, server)
 
     # Bail if our validator fails.
     if not is_valid(sg, reg.logger):
@@ -139,17 +138,7 @@ def new_version_alert(sg, logger, event, args):
         }
     ]
 
-    for manager in managers:
-        slack_id = slack_shotgun_bot.get_slack_user_id(sg, manager["id"])
-        if slack_id:
-            slack_message = slack_shotgun_bot.send_message(
-                slack_id, None, attachments=attachments
-            )
-            if slack_message["ok"]:
-                logger.info("New verison alert sent to {}.".format(manager["name"]))
-            elif slack_message["error"]:
-                logger.warning(
-                    "New version alert to {} failed to send with error: {}".format(
-                        manager["name"], slack_message["error"]
-                    )
-                )
+    # Send all the alerts at once, then check how each of them went.
+    slack_shotgun_bot.send_user_messages(
+        sg, managers, logger, "New version alert", attachments=attachments
+    )
@@ -0,0 +1,4 @@
+"""
+Benchmarks of the Shotgun event daemon, run against a local mock Shotgun
+server, see runBenchmark.py.
+"""
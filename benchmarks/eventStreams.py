@@ -0,0 +1,193 @@
+"""
+Synthetic streams of Shotgun events for benchmarks.
+
+A stream mixes several kinds of events in given proportions. It is driven by
+a seeded random generator, so the same parameters always give the same
+events and runs of a benchmark can be compared with each other.
+"""
+
+import random
+import uuid
+
+
+TASK_STATUSES = ["wtg", "rdy", "ip", "rev", "cmpt"]
+TICKET_STATUSES = ["opn", "ip", "res", "clsd"]
+TICKET_FIELDS = ["sg_status_list", "description", "addressings_cc", "title"]
+
+
+class EventStream(object):
+    """
+    Generates events of these kinds:
+    - task: a Task's status changes.
+    - version: a Version is created.
+    - ticket: a field of a Ticket changes. Ids are skipped before some of
+      these events, like the gaps left in the event log by events which are
+      not visible to the daemon's script or by transactions rolled back.
+    - note: a Note's content changes. The benchmark plugin doesn't register
+      for these, like the events of the many entity types a site's plugins
+      ignore, see L{IGNORED_EVENT_TYPES}.
+    """
+
+    KINDS = ("task", "version", "ticket", "note")
+
+    # The types of the events the benchmark plugin doesn't process.
+    IGNORED_EVENT_TYPES = ("Shotgun_Note_Change",)
+
+    # Chance of a gap in the ids before a ticket event, and its largest size.
+    TICKET_GAP_RATE = 0.2
+    TICKET_GAP_SIZE = 3
+
+    def __init__(
+        self, mix, seed=0, firstId=1, projects=5, tasks=2000, tickets=500, notes=1000
+    ):
+        """
+        @param mix: The weight of each kind of event.
+        @type mix: I{dict} of I{str} to I{float}
+        @param seed: The seed of the random generator.
+        @type seed: I{int}
+        @param firstId: The id of the first event.
+        @type firstId: I{int}
+        @param projects: The number of projects the events are spread across.
+        @type projects: I{int}
+        @param tasks: The number of Tasks whose status changes.
+        @type tasks: I{int}
+        @param tickets: The number of Tickets which change.
+        @type tickets: I{int}
+        @param notes: The number of Notes which change.
+        @type notes: I{int}
+        """
+        unknown = set(mix) - set(self.KINDS)
+        if unknown:
+            raise ValueError(
+                "Unknown kinds of events: %s." % ", ".join(sorted(unknown))
+            )
+
+        self._kinds = [kind for kind in self.KINDS if mix.get(kind, 0) > 0]
+        self._weights = [mix[kind] for kind in self._kinds]
+        if not self._kinds:
+            raise ValueError("The mix has no events.")
+
+        self._random = random.Random(seed)
+        self._nextId = firstId
+        self._projects = projects
+        self._tasks = tasks
+        self._tickets = tickets
+        self._notes = notes
+        self._nextVersionId = 1
+        self._sessions = [
+            str(uuid.UUID(int=self._random.getrandbits(128))) for i in range(20)
+        ]
+
+    def generate(self, count):
+        """
+        Generate the next events of the stream.
+
+        @param count: The number of events.
+        @type count: I{int}
+
+        @return: The events, ordered by id.
+        @rtype: I{list} of Shotgun event dictionaries.
+        """
+        events = []
+        total = sum(self._weights)
+        for i in range(count):
+            pick = self._random.uniform(0, total)
+            for kind, weight in zip(self._kinds, self._weights):
+                pick -= weight
+                if pick <= 0:
+                    break
+            events.append(getattr(self, "_%sEvent" % kind)())
+        return events
+
+    def _taskEvent(self):
+        taskId = self._random.randint(1, self._tasks)
+        oldStatus, newStatus = self._random.sample(TASK_STATUSES, 2)
+        return self._event(
+            "Shotgun_Task_Change",
+            "sg_status_list",
+            "Task",
+            taskId,
+            {
+                "type": "attribute_change",
+                "attribute_name": "sg_status_list",
+                "old_value": oldStatus,
+                "new_value": newStatus,
+            },
+        )
+
+    def _versionEvent(self):
+        versionId = self._nextVersionId
+        self._nextVersionId += 1
+        return self._event(
+            "Shotgun_Version_New", None, "Version", versionId, {"type": "new_entity"}
+        )
+
+    def _ticketEvent(self):
+        if self._random.random() < self.TICKET_GAP_RATE:
+            self._nextId += self._random.randint(1, self.TICKET_GAP_SIZE)
+
+        ticketId = self._random.randint(1, self._tickets)
+        field = self._random.choice(TICKET_FIELDS)
+        meta = {"type": "attribute_change", "attribute_name": field}
+        if field == "sg_status_list":
+            meta["old_value"], meta["new_value"] = self._random.sample(
+                TICKET_STATUSES, 2
+            )
+        return self._event("Shotgun_Ticket_Change", field, "Ticket", ticketId, meta)
+
+    def _noteEvent(self):
+        noteId = self._random.randint(1, self._notes)
+        return self._event(
+            "Shotgun_Note_Change",
+            "content",
+            "Note",
+            noteId,
+            {"type": "attribute_change", "attribute_name": "content"},
+        )
+
+    def _event(self, eventType, attributeName, entityType, entityId, meta):
+        eventId = self._nextId
+        self._nextId += 1
+
+        projectId = entityId % self._projects + 1
+        meta = dict(meta, entity_type=entityType, entity_id=entityId)
+        return {
+            "type": "EventLogEntry",
+            "id": eventId,
+            "event_type": eventType,
+            "attribute_name": attributeName,
+            "meta": meta,
+            "entity": {
+                "type": entityType,
+                "id": entityId,
+                "name": "%s %d" % (entityType, entityId),
+            },
+            "user": {
+                "type": "HumanUser",
+                "id": self._random.randint(1, 50),
+                "name": "User",
+            },
+            "project": {
+                "type": "Project",
+                "id": projectId,
+                "name": "Project %d" % projectId,
+            },
+            "session_uuid": self._random.choice(self._sessions),
+            "created_at": None,
+        }
+
+
+def parseMix(text):
+    """
+    Parse a mix of events given as kind=weight pairs separated by commas,
+    like task=6,version=3,ticket=1.
+
+    @rtype: I{dict} of I{str} to I{float}
+    """
+    mix = {}
+    for item in text.split(","):
+        kind, sep, weight = item.partition("=")
+        if not sep:
+            raise ValueError("Invalid mix item %s, expected kind=weight." % item)
+        mix[kind.strip()] = float(weight)
+    return mix
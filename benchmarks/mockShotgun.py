@@ -0,0 +1,430 @@
+"""
+A local stand-in for the Shotgun JSON API.
+
+It implements enough of the API for shotgun_api3 to run the event daemon and
+typical plugins against it: the info, read, create, update, delete and batch
+methods, over HTTP with keep-alive. Every entity, events included, is kept in
+memory. Each call is answered after a configurable latency, which stands in
+for the round trip to a real site.
+
+Two more methods, not part of the Shotgun API, drive a benchmark:
+benchmark_publish adds events to the EventLogEntry table and benchmark_stats
+reports the number of calls made, the number of entities and field values
+read and when the plugins processed each event.
+A plugin reports that it processed an event by updating an entity with the
+id of the event in the L{PROCESSED_FIELD} field.
+"""
+
+import bisect
+import datetime
+import json
+import multiprocessing
+import threading
+import time
+
+try:
+    import BaseHTTPServer as httpServer
+    import SocketServer as socketServer
+except ImportError:
+    import http.server as httpServer
+    import socketserver as socketServer
+
+try:
+    import urllib2 as urlRequest
+except ImportError:
+    import urllib.request as urlRequest
+
+
+PROCESSED_FIELD = "sg_benchmark_event_id"
+
+SERVER_VERSION = [8, 50, 0]
+
+_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+class MockShotgunServer(object):
+    """
+    Runs a L{MockSite} behind an HTTP server in a separate process, so the
+    cost of serving the requests isn't accounted to the process being
+    benchmarked.
+    """
+
+    def __init__(self, latency=0.0):
+        """
+        @param latency: The number of seconds each API call takes.
+        @type latency: I{float}
+        """
+        self._latency = latency
+        self._process = None
+        self.url = None
+
+    def start(self):
+        """
+        Start the server, on a free port of the local host.
+        """
+        parentConn, childConn = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_serve, args=(childConn, self._latency), name="MockShotgunServer"
+        )
+        self._process.daemon = True
+        self._process.start()
+        self.url = "http://127.0.0.1:%d" % parentConn.recv()
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    def publish(self, events):
+        """
+        Add events to the EventLogEntry table. They're created now, whatever
+        their created_at value. Entities they are about are created if they
+        don't exist.
+
+        @param events: The events, ordered by id.
+        @type events: I{list} of Shotgun event dictionaries.
+        """
+        return self._call("benchmark_publish", {"events": events})
+
+    def getStats(self, details=False):
+        """
+        Get the number of calls made to the server and how many events were
+        processed.
+
+        @param details: Also return when each event was published and last
+            processed.
+        @type details: I{bool}
+
+        @return: See L{MockSite.benchmark_stats}.
+        @rtype: I{dict}
+        """
+        return self._call("benchmark_stats", {"details": details})
+
+    def _call(self, method, params):
+        payload = json.dumps({"method_name": method, "params": [{}, params]})
+        request = urlRequest.Request(
+            self.url + "/api3/json",
+            payload.encode("utf-8"),
+            {"content-type": "application/json"},
+        )
+        response = urlRequest.urlopen(request)
+        try:
+            return json.loads(response.read().decode("utf-8"))["results"]
+        finally:
+            response.close()
+
+
+class MockSite(object):
+    """
+    The entities of a mock Shotgun site and the implementation of the API
+    methods.
+
+    Entities are stored per type, by id. Ids of the entities of a type are
+    kept sorted so filters on the id, like the event daemon's, don't scan
+    the whole table.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables = {}
+        self._ids = {}
+        self._calls = {}
+        self._transferred = {}
+        self._published = {}
+        self._processed = {}
+
+    def call(self, method, params):
+        """
+        Run an API method.
+
+        @param method: The name of the method.
+        @type method: I{str}
+        @param params: The parameters of the call, auth parameters first.
+        @type params: I{list}
+
+        @return: The result of the call.
+
+        @raise MockSiteFault: If the method isn't supported or fails.
+        """
+        func = getattr(self, method, None)
+        if func is None or method.startswith("_") or method == "call":
+            raise MockSiteFault("Unknown method %s." % method)
+
+        with self._lock:
+            self._calls[method] = self._calls.get(method, 0) + 1
+            result = func(params[-1] if len(params) > 1 else None)
+            if method == "read":
+                key = "read:%s" % params[-1]["type"]
+                self._calls[key] = self._calls.get(key, 0) + 1
+                transferred = self._transferred.setdefault(
+                    params[-1]["type"], [0, 0]
+                )
+                transferred[0] += len(result["entities"])
+                transferred[1] += sum(len(e) - 2 for e in result["entities"])
+            return result
+
+    def info(self, params):
+        return {
+            "version": SERVER_VERSION,
+            "full_version": SERVER_VERSION + [0],
+            "user_authentication_method": "default",
+        }
+
+    def read(self, params):
+        entityType = params["type"]
+        records = [
+            record
+            for record in self._candidates(entityType, params["filters"])
+            if self._match(record, params["filters"])
+        ]
+
+        for sort in reversed(params.get("sorts") or []):
+            field = sort["field_name"]
+            records.sort(
+                key=lambda record: record.get(field),
+                reverse=sort.get("direction") == "desc",
+            )
+
+        paging = params.get("paging") or {}
+        perPage = paging.get("entities_per_page") or 500
+        page = paging.get("current_page") or 1
+        start = (page - 1) * perPage
+        entities = [
+            self._project(record, params.get("return_fields"))
+            for record in records[start : start + perPage]
+        ]
+        return {
+            "entities": entities,
+            "paging_info": {
+                "entity_count": len(records),
+                "has_next_page": start + perPage < len(records),
+            },
+        }
+
+    def create(self, params):
+        fields = dict((f["field_name"], f["value"]) for f in params["fields"])
+        record = self._insert(params["type"], None, fields)
+        return [self._project(record, params.get("return_fields"))]
+
+    def update(self, params):
+        record = self._get(params["type"], params["id"])
+        fields = dict((f["field_name"], f["value"]) for f in params["fields"])
+        record.update(fields)
+
+        eventId = fields.get(PROCESSED_FIELD)
+        if eventId is not None:
+            processed = self._processed.setdefault(eventId, [0, None])
+            processed[0] += 1
+            processed[1] = time.time()
+
+        result = {"type": record["type"], "id": record["id"]}
+        result.update(fields)
+        return result
+
+    def delete(self, params):
+        self._get(params["type"], params["id"])
+        del self._tables[params["type"]][params["id"]]
+        ids = self._ids[params["type"]]
+        ids.pop(bisect.bisect_left(ids, params["id"]))
+        return True
+
+    def batch(self, params):
+        results = []
+        for request in params:
+            requestType = request["request_type"]
+            if requestType == "create":
+                results.append(self.create(request)[0])
+            elif requestType == "update":
+                results.append(self.update(request))
+            elif requestType == "delete":
+                results.append(self.delete(request))
+            else:
+                raise MockSiteFault("Unknown batch request type %s." % requestType)
+        return results
+
+    def benchmark_publish(self, params):
+        now = time.time()
+        createdAt = datetime.datetime.utcnow().strftime(_DATE_FORMAT)
+        for event in params["events"]:
+            for link in (event.get("entity"), event.get("project"), event.get("user")):
+                if link and link["id"] not in self._tables.get(link["type"], {}):
+                    self._insert(link["type"], link["id"], {"name": link.get("name")})
+
+            event = dict(event, created_at=createdAt)
+            self._insert("EventLogEntry", event["id"], event)
+            self._published[event["id"]] = now
+        return len(params["events"])
+
+    def benchmark_stats(self, params):
+        """
+        @return: The number of calls per method and per entity type read, the
+            number of entities and field values read per entity type, and for
+            each event the number of times it was reported as
+            processed. With details, the time each event was published and
+            last reported as processed.
+        @rtype: I{dict}
+        """
+        stats = {
+            "calls": dict(self._calls),
+            "transferred": dict(self._transferred),
+            "processed": dict(
+                (str(eventId), processed[0])
+                for eventId, processed in self._processed.items()
+            ),
+        }
+        if params.get("details"):
+            stats["published"] = dict(
+                (str(eventId), published)
+                for eventId, published in self._published.items()
+            )
+            stats["processedAt"] = dict(
+                (str(eventId), processed[1])
+                for eventId, processed in self._processed.items()
+            )
+        return stats
+
+    def _insert(self, entityType, entityId, fields):
+        table = self._tables.setdefault(entityType, {})
+        ids = self._ids.setdefault(entityType, [])
+        if entityId is None:
+            entityId = ids[-1] + 1 if ids else 1
+
+        record = dict(fields, type=entityType, id=entityId)
+        if entityId not in table:
+            bisect.insort(ids, entityId)
+        table[entityId] = record
+        return record
+
+    def _get(self, entityType, entityId):
+        record = self._tables.get(entityType, {}).get(entityId)
+        if record is None:
+            raise MockSiteFault("%s %s does not exist." % (entityType, entityId))
+        return record
+
+    def _candidates(self, entityType, filters):
+        """
+        Get the records which can match filters, using the conditions on the
+        id of the top level of the filters.
+        """
+        table = self._tables.get(entityType, {})
+        ids = self._ids.get(entityType, [])
+        start, end = 0, len(ids)
+        if filters.get("logical_operator") == "and":
+            for condition in filters["conditions"]:
+                if condition.get("path") != "id":
+                    continue
+                relation = condition["relation"]
+                values = condition["values"]
+                if relation == "greater_than":
+                    start = max(start, bisect.bisect_right(ids, values[0]))
+                elif relation == "less_than":
+                    end = min(end, bisect.bisect_left(ids, values[0]))
+                elif relation == "between":
+                    start = max(start, bisect.bisect_left(ids, values[0]))
+                    end = min(end, bisect.bisect_right(ids, values[1]))
+                elif relation == "is":
+                    start = max(start, bisect.bisect_left(ids, values[0]))
+                    end = min(end, bisect.bisect_right(ids, values[0]))
+        return [table[entityId] for entityId in ids[start:end]]
+
+    def _match(self, record, filters):
+        if "conditions" in filters:
+            results = (self._match(record, c) for c in filters["conditions"])
+            if filters["logical_operator"] == "or":
+                return any(results)
+            return all(results)
+
+        value = _key(record.get(filters["path"]))
+        values = [_key(v) for v in filters["values"]]
+        relation = filters["relation"]
+        if relation == "is":
+            return value == values[0]
+        if relation == "is_not":
+            return value != values[0]
+        if relation == "in":
+            return value in values
+        if relation == "not_in":
+            return value not in values
+        if relation == "greater_than":
+            return value is not None and value > values[0]
+        if relation == "less_than":
+            return value is not None and value < values[0]
+        if relation == "between":
+            return value is not None and values[0] <= value <= values[1]
+        if relation == "contains":
+            return value is not None and values[0] in value
+        raise MockSiteFault("Unsupported filter relation %s." % relation)
+
+    def _project(self, record, fields):
+        result = {"type": record["type"], "id": record["id"]}
+        for field in fields or []:
+            result[field] = record.get(field)
+        return result
+
+
+class MockShotgunHandler(httpServer.BaseHTTPRequestHandler):
+    """
+    Answers the API calls posted by shotgun_api3.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    # Headers and body are written separately, which would otherwise wait
+    # for the client's delayed acknowledgment on kept alive connections.
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("content-length") or 0)
+        payload = json.loads(self.rfile.read(length).decode("utf-8"))
+        method = payload.get("method_name")
+
+        if not method.startswith("benchmark_"):
+            time.sleep(self.server.latency)
+
+        try:
+            response = {"results": self.server.site.call(method, payload["params"])}
+        except MockSiteFault as err:
+            response = {"exception": True, "message": str(err), "error_code": 0}
+
+        body = json.dumps(response).encode("utf-8")
+        self.send_response(200)
+        self.send_header("content-type", "application/json; charset=utf-8")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockShotgunHTTPServer(socketServer.ThreadingMixIn, httpServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency):
+        httpServer.HTTPServer.__init__(self, address, MockShotgunHandler)
+        self.latency = latency
+        self.site = MockSite()
+
+
+class MockSiteFault(Exception):
+    """
+    Returned to the client as an API error.
+    """
+
+    pass
+
+
+def _key(value):
+    """
+    Compare entity links by type and id only.
+    """
+    if isinstance(value, dict):
+        return (value.get("type"), value.get("id"))
+    return value
+
+
+def _serve(conn, latency):
+    server = MockShotgunHTTPServer(("127.0.0.1", 0), latency)
+    conn.send(server.server_address[1])
+    server.serve_forever()
@@ -0,0 +1,79 @@
+"""
+Plugin run by the benchmarks, see runBenchmark.py.
+
+It makes the kind of calls typical plugins make for each event: it reads the
+entity of the event, then updates it, and creates a Note on new Versions in
+the same batch. Every update writes the id of the event to the field the mock
+Shotgun server watches, to know when the event was processed.
+"""
+
+import os
+
+import mockShotgun
+
+
+def registerCallbacks(reg):
+    """
+    Register our callbacks.
+
+    :param reg: A Registrar instance provided by the event loop handler.
+    """
+    eventFilter = {
+        "Shotgun_Task_Change": ["sg_status_list"],
+        "Shotgun_Version_New": None,
+        "Shotgun_Ticket_Change": None,
+    }
+    reg.registerCallback(
+        os.environ.get("SG_SCRIPT_NAME", "benchmark"),
+        os.environ.get("SG_SCRIPT_KEY", "benchmark"),
+        process_event,
+        eventFilter,
+        None,
+    )
+
+
+def process_event(sg, logger, event, args):
+    """
+    Read the entity of an event and update it.
+
+    :param sg: Shotgun API handle.
+    :param logger: Logger instance.
+    :param event: A Shotgun EventLogEntry entity dictionary.
+    :param args: Any additional misc arguments passed through this plugin.
+    """
+    entity = event["entity"]
+    record = sg.find_one(
+        entity["type"],
+        [["id", "is", entity["id"]]],
+        ["project", "sg_status_list", "description"],
+    )
+    if not record:
+        logger.warning("%s %d does not exist.", entity["type"], entity["id"])
+        return
+
+    data = {
+        "description": "Updated by event %d." % event["id"],
+        mockShotgun.PROCESSED_FIELD: event["id"],
+    }
+    if event["event_type"] == "Shotgun_Version_New":
+        sg.batch(
+            [
+                {
+                    "request_type": "update",
+                    "entity_type": entity["type"],
+                    "entity_id": entity["id"],
+                    "data": data,
+                },
+                {
+                    "request_type": "create",
+                    "entity_type": "Note",
+                    "data": {
+                        "subject": "New version %s" % entity["name"],
+                        "project": event["project"],
+                        "note_links": [entity],
+                    },
+                },
+            ]
+        )
+    else:
+        sg.update(entity["type"], entity["id"], data)
@@ -0,0 +1,454 @@
+#!/usr/bin/env python
+"""
+Measure the event daemon's throughput against a local mock Shotgun server.
+
+    python benchmarks/runBenchmark.py [--events 10000]
+        [--mix task=6,version=3,ticket=1] [--rate 0] [--latency 10]
+        [--plugins 1] [--seed 0] [--set [section.]option=value ...]
+        [--output results.json] [--compare previous.json]
+
+A stream of synthetic events, see L{eventStreams.EventStream}, is published
+to a L{mockShotgun.MockShotgunServer}, all at once or at a given rate. An
+L{Engine} runs against it, from the first event on, with the given number
+of copies of the benchmark plugin, until each copy has processed every
+event it registered for. The daemon settings can be changed with --set, e.g.
+--set dispatch_mode=threaded --set entity_workers=4.
+
+The report gives:
+- the number of events processed per second, from the start of the engine
+  to the last event processed,
+- percentiles of the dispatch latency, from the time an event is published
+  to the time the last plugin is done with it,
+- the number of API calls per event, in total and per method,
+- the number of EventLogEntry rows and field values read per event, the
+  type and id of the rows not included,
+- the high-water mark of the memory used by this process, which runs the
+  engine, and what it used before starting the engine. Plugin processes of
+  the process dispatch mode are not included.
+
+With the same parameters the same events are generated, so the results of
+several runs can be compared. Use --output to save them and --compare to
+show the changes from a previous run.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCHMARKS_PATH, os.path.join(os.path.dirname(BENCHMARKS_PATH), "src")]
+
+import eventStreams
+import mockShotgun
+import shotgunEventDaemon
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+DEFAULT_CONFIG = {
+    "daemon": {
+        "logMode": "0",
+        "logging": "30",
+        "timing_log": "off",
+        "conn_retry_sleep": "1",
+        "max_conn_retries": "5",
+        "fetch_interval": "1",
+        "min_fetch_interval": "0.1",
+        "max_event_batch_size": "500",
+    },
+    "shotgun": {
+        "name": "benchmark",
+        "key": "benchmark",
+        "proxy_server": "",
+        "use_session_uuid": "True",
+    },
+    "plugins": {},
+    "emails": {"server": "", "from": "", "to": "", "subject": ""},
+}
+
+# Results shown when comparing runs, and whether higher is better.
+COMPARED_RESULTS = [
+    ("eventsPerSecond", True),
+    ("latencyP50", False),
+    ("latencyP90", False),
+    ("latencyP99", False),
+    ("latencyMax", False),
+    ("callsPerEvent", False),
+    ("eventLogReadsPerEvent", False),
+    ("eventLogRowsPerEvent", False),
+    ("eventLogValuesPerEvent", False),
+    ("memoryPeakMB", False),
+]
+
+# The daemon takes a last event id of 0 for no id at all, so the stream
+# starts further on.
+FIRST_EVENT_ID = 1000
+
+PUBLISH_CHUNK_SIZE = 5000
+PUBLISH_INTERVAL = 0.05
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the event daemon's throughput against a local mock "
+        "Shotgun server."
+    )
+    parser.add_argument(
+        "--events",
+        type=int,
+        default=10000,
+        help="the number of events (default: 10000)",
+    )
+    parser.add_argument(
+        "--mix",
+        default="task=6,version=3,ticket=1",
+        help="the weight of each kind of event, among %s (default: %%(default)s)"
+        % ", ".join(eventStreams.EventStream.KINDS),
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0,
+        help="the number of events published per second, 0 to publish them all "
+        "before starting the engine (default: 0)",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=10,
+        help="the milliseconds each API call takes (default: 10)",
+    )
+    parser.add_argument(
+        "--plugins",
+        type=int,
+        default=1,
+        help="the number of copies of the benchmark plugin (default: 1)",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="the seed of the event stream (default: 0)"
+    )
+    parser.add_argument(
+        "--set",
+        dest="settings",
+        action="append",
+        default=[],
+        metavar="[SECTION.]OPTION=VALUE",
+        help="a setting of the daemon configuration, in the daemon section unless "
+        "specified",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=600,
+        help="the seconds after which the benchmark is stopped (default: 600)",
+    )
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--compare", help="compare with the results in this JSON file")
+    options = parser.parse_args()
+
+    try:
+        mix = eventStreams.parseMix(options.mix)
+        config = _getConfig(options.settings)
+        stream = eventStreams.EventStream(mix, options.seed, FIRST_EVENT_ID)
+    except ValueError as err:
+        parser.error(str(err))
+
+    server = mockShotgun.MockShotgunServer(options.latency / 1000.0)
+    server.start()
+    workDir = tempfile.mkdtemp(prefix="shotgunEventsBenchmark")
+    try:
+        results = runBenchmark(server, workDir, config, stream, options)
+    finally:
+        server.stop()
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    for line in formatResults(results):
+        print(line)
+
+    if options.compare:
+        with open(options.compare) as fh:
+            previous = json.load(fh)
+        print()
+        for line in compareResults(previous, results):
+            print(line)
+
+    if options.output:
+        with open(options.output, "w") as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+
+    return 0 if results["results"]["complete"] else 1
+
+
+def runBenchmark(server, workDir, config, stream, options):
+    """
+    Run the engine over a stream of events.
+
+    @return: The parameters and results of the benchmark.
+    @rtype: I{dict}
+    """
+    events = stream.generate(options.events)
+    # The events the plugins process, the other ones are filtered out.
+    processedEvents = [
+        event
+        for event in events
+        if event["event_type"] not in stream.IGNORED_EVENT_TYPES
+    ]
+
+    pluginsPath = os.path.join(workDir, "plugins")
+    os.makedirs(pluginsPath)
+    for i in range(options.plugins):
+        shutil.copy(
+            os.path.join(BENCHMARKS_PATH, "plugins", "benchmarkPlugin.py"),
+            os.path.join(pluginsPath, "benchmarkPlugin%d.py" % (i + 1)),
+        )
+
+    config["daemon"].update(
+        {
+            "pidFile": os.path.join(workDir, "shotgunEventDaemon.pid"),
+            "eventIdFile": os.path.join(workDir, "shotgunEventDaemon.id"),
+            "logPath": workDir,
+            "logFile": "shotgunEventDaemon.log",
+        }
+    )
+    config["shotgun"]["server"] = server.url
+    config["plugins"]["paths"] = pluginsPath
+    configPath = os.path.join(workDir, "shotgunEventDaemon.conf")
+    with open(configPath, "w") as fh:
+        for section in ("daemon", "shotgun", "plugins", "emails"):
+            fh.write("[%s]\n" % section)
+            for option, value in sorted(config[section].items()):
+                fh.write("%s: %s\n" % (option, value))
+            fh.write("\n")
+
+    # Start right before the first event.
+    with open(config["daemon"]["eventIdFile"], "w") as fh:
+        fh.write("%d\n" % (events[0]["id"] - 1))
+
+    if options.rate <= 0:
+        for i in range(0, len(events), PUBLISH_CHUNK_SIZE):
+            server.publish(events[i : i + PUBLISH_CHUNK_SIZE])
+        publisher = None
+    else:
+        publisher = threading.Thread(
+            target=_publish, args=(server, events, options.rate), name="Publisher"
+        )
+        publisher.daemon = True
+
+    memoryBaseline = _getMemoryHighWater()
+    engine = shotgunEventDaemon.Engine(configPath)
+    engineThread = threading.Thread(target=engine.start, name="Engine")
+    start = time.time()
+    if publisher:
+        publisher.start()
+    engineThread.start()
+
+    processed = 0
+    while time.time() - start < options.timeout:
+        time.sleep(0.2)
+        counts = server.getStats()["processed"]
+        processed = sum(1 for count in counts.values() if count >= options.plugins)
+        if processed >= len(processedEvents):
+            break
+
+    engine.stop()
+    engineThread.join()
+    memoryPeak = _getMemoryHighWater()
+
+    stats = server.getStats(details=True)
+    latencies = []
+    lastProcessed = start
+    for event in processedEvents:
+        eventId = str(event["id"])
+        if stats["processed"].get(eventId, 0) < options.plugins:
+            continue
+        processedAt = stats["processedAt"][eventId]
+        latencies.append(processedAt - stats["published"][eventId])
+        lastProcessed = max(lastProcessed, processedAt)
+    latencies.sort()
+
+    duration = lastProcessed - start
+    calls = dict(
+        (method, count)
+        for method, count in stats["calls"].items()
+        if not method.startswith("benchmark_")
+    )
+    totalCalls = sum(count for method, count in calls.items() if ":" not in method)
+    eventLogRows, eventLogValues = stats["transferred"].get("EventLogEntry", (0, 0))
+    count = len(latencies) or 1
+
+    return {
+        "parameters": {
+            "events": options.events,
+            "mix": options.mix,
+            "rate": options.rate,
+            "latency": options.latency,
+            "plugins": options.plugins,
+            "seed": options.seed,
+            "settings": sorted(options.settings),
+            "python": sys.version.split()[0],
+            "shotgun_api3": shotgunEventDaemon.sg.__version__,
+        },
+        "results": {
+            "complete": len(latencies) == len(processedEvents),
+            "processedEvents": len(latencies),
+            "duration": duration,
+            "eventsPerSecond": len(latencies) / duration if duration > 0 else 0.0,
+            "latencyP50": _percentile(latencies, 50),
+            "latencyP90": _percentile(latencies, 90),
+            "latencyP99": _percentile(latencies, 99),
+            "latencyMax": latencies[-1] if latencies else 0.0,
+            "calls": calls,
+            "callsPerEvent": float(totalCalls) / count,
+            "eventLogReadsPerEvent": float(calls.get("read:EventLogEntry", 0)) / count,
+            "eventLogRowsPerEvent": float(eventLogRows) / count,
+            "eventLogValuesPerEvent": float(eventLogValues) / count,
+            "memoryBaselineMB": memoryBaseline,
+            "memoryPeakMB": memoryPeak,
+        },
+    }
+
+
+def formatResults(results):
+    """
+    @return: The lines of the report of a benchmark.
+    @rtype: I{list} of I{str}
+    """
+    parameters = results["parameters"]
+    values = results["results"]
+    lines = [
+        "%d events (%s), %d plugins, %.1f ms latency, %s."
+        % (
+            parameters["events"],
+            parameters["mix"],
+            parameters["plugins"],
+            parameters["latency"],
+            "rate %.1f events/s" % parameters["rate"]
+            if parameters["rate"] > 0
+            else "published up front",
+        )
+    ]
+    if parameters["settings"]:
+        lines.append("Settings: %s" % ", ".join(parameters["settings"]))
+    if not values["complete"]:
+        lines.append(
+            "Timed out, only %d events were processed." % values["processedEvents"]
+        )
+    lines.extend(
+        [
+            "Throughput: %.1f events/s over %.2f seconds."
+            % (values["eventsPerSecond"], values["duration"]),
+            "Dispatch latency: p50 %.3fs, p90 %.3fs, p99 %.3fs, max %.3fs."
+            % (
+                values["latencyP50"],
+                values["latencyP90"],
+                values["latencyP99"],
+                values["latencyMax"],
+            ),
+            "API calls: %.2f per event, %.4f EventLogEntry reads per event."
+            % (values["callsPerEvent"], values["eventLogReadsPerEvent"]),
+            "EventLogEntry rows read: %.2f per event, %.1f field values per event."
+            % (values["eventLogRowsPerEvent"], values["eventLogValuesPerEvent"]),
+        ]
+    )
+    for method, count in sorted(values["calls"].items()):
+        lines.append("  %s: %d" % (method, count))
+    lines.append(
+        "Memory high-water: %.1f MB, %.1f MB before starting the engine."
+        % (values["memoryPeakMB"], values["memoryBaselineMB"])
+    )
+    return lines
+
+
+def compareResults(previous, results):
+    """
+    @return: The lines of the comparison of two benchmarks.
+    @rtype: I{list} of I{str}
+    """
+    lines = []
+    if previous["parameters"] != results["parameters"]:
+        lines.append("Warning: the benchmarks were run with different parameters.")
+
+    for name, higherIsBetter in COMPARED_RESULTS:
+        before = previous["results"].get(name)
+        after = results["results"].get(name)
+        if before is None or after is None:
+            continue
+        if before:
+            change = "%+.1f%%" % ((after - before) * 100.0 / before)
+        else:
+            change = "n/a"
+        better = after > before if higherIsBetter else after < before
+        lines.append(
+            "%-22s %12.4f -> %12.4f  %8s%s"
+            % (name, before, after, change, " (better)" if better else "")
+        )
+    return lines
+
+
+def _getConfig(settings):
+    config = dict(
+        (section, dict(options)) for section, options in DEFAULT_CONFIG.items()
+    )
+    for setting in settings:
+        option, sep, value = setting.partition("=")
+        if not sep:
+            raise ValueError("Invalid setting %s, expected option=value." % setting)
+        section, dot, name = option.strip().rpartition(".")
+        section = section or "daemon"
+        if section not in config:
+            raise ValueError("Unknown configuration section %s." % section)
+        config[section][name] = value.strip()
+    return config
+
+
+def _publish(server, events, rate):
+    """
+    Publish events at a steady rate.
+    """
+    start = time.time()
+    published = 0
+    while published < len(events):
+        due = min(len(events), int((time.time() - start) * rate) + 1)
+        if due > published:
+            server.publish(events[published:due])
+            published = due
+        time.sleep(PUBLISH_INTERVAL)
+
+
+def _percentile(values, percent):
+    """
+    Get a percentile of sorted values, by the nearest rank method.
+    """
+    if not values:
+        return 0.0
+    rank = max(1, int(round(percent / 100.0 * len(values))))
+    return values[min(rank, len(values)) - 1]
+
+
+def _getMemoryHighWater():
+    """
+    Get the most memory this process used so far, in megabytes.
+    """
+    if resource is None:
+        return 0.0
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # Bytes rather than kilobytes.
+        return maxRss / (1024.0 * 1024.0)
+    return maxRss / 1024.0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
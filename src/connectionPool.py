@@ -0,0 +1,198 @@
+"""
+Pool of the Shotgun connections used by plugins.
+
+Creating a Shotgun connection costs a round trip to the server, for its info,
+and every connection keeps its own HTTP connection alive. Plugins register
+many callbacks with the same script credentials, so rather than having one
+connection each, callbacks and registration code lease connections from this
+pool for the time they need them.
+"""
+
+import threading
+import time
+
+import shotgun_api3 as sg
+
+
+class ConnectionPool(object):
+    """
+    Shotgun connections, pooled by server, script name, script key and proxy.
+
+    A connection can't be used by several threads at once. It is leased to a
+    single user with L{acquire} until it's given back with L{release}, so the
+    pool never holds more idle connections per key than the largest number
+    of users at once, and at most maxIdle of them.
+
+    The number of users at once is bounded by the number of threads
+    processing events. With maxConnections, at most that many connections
+    per key are leased at once, L{acquire} waits for one to be released
+    otherwise.
+
+    Connections idle for longer than checkInterval seconds are checked with a
+    call to the server before being leased again, a connection which fails
+    the check is replaced by a new one.
+    """
+
+    def __init__(self, maxIdle, checkInterval, logger, maxConnections=0, timeout=0):
+        """
+        @param maxIdle: The number of idle connections kept per key, others
+            are closed when they're released.
+        @type maxIdle: I{int}
+        @param checkInterval: The number of seconds a connection can stay
+            idle before it's checked, or 0 to never check connections.
+        @type checkInterval: I{float}
+        @param logger: The logger failed checks are reported to.
+        @type logger: L{logging.Logger}
+        @param maxConnections: The number of connections leased at once per
+            key, or 0 for no limit.
+        @type maxConnections: I{int}
+        @param timeout: The number of seconds L{acquire} waits for a
+            connection to be released, or 0 to wait for as long as it takes.
+        @type timeout: I{float}
+        """
+        self._maxIdle = maxIdle
+        self._checkInterval = checkInterval
+        self._logger = logger
+        self._maxConnections = maxConnections
+        self._timeout = timeout
+        self.reset()
+
+    def reset(self):
+        """
+        Forget every connection without closing them.
+
+        Used after forking, the child process must not use the connections of
+        its parent, which share their sockets with it.
+        """
+        self._lock = threading.Condition(threading.Lock())
+        self._idle = {}
+        self._leased = {}
+        self._leasedCounts = {}
+
+    def acquire(self, server, scriptName, scriptKey, proxy=None):
+        """
+        Lease a connection, idle in the pool or new.
+
+        @param server: The url of the Shotgun server.
+        @type server: I{str}
+        @param scriptName: The name of the script to connect as.
+        @type scriptName: I{str}
+        @param scriptKey: The key of the script.
+        @type scriptKey: I{str}
+        @param proxy: The proxy server to connect through, if any.
+        @type proxy: I{str}
+
+        @return: A connection for the exclusive use of the caller until it's
+            released.
+        @rtype: L{sg.Shotgun}
+
+        @raise ConnectionPoolError: If maxConnections connections stayed
+            leased for timeout seconds.
+        """
+        key = (server, scriptName, scriptKey, proxy)
+        deadline = time.time() + self._timeout
+        while True:
+            with self._lock:
+                while not self._canConnect(key):
+                    remaining = deadline - time.time()
+                    if self._timeout and remaining <= 0:
+                        raise ConnectionPoolError(
+                            "No connection to %s as %s was released in %s seconds."
+                            % (server, scriptName, self._timeout)
+                        )
+                    self._lock.wait(remaining if self._timeout else None)
+
+                self._leasedCounts[key] = self._leasedCounts.get(key, 0) + 1
+                idle = self._idle.get(key)
+                if not idle:
+                    break
+                connection, releaseTime = idle.pop()
+                self._leased[id(connection)] = key
+
+            if not self._checkInterval or (
+                time.time() - releaseTime < self._checkInterval
+            ):
+                return connection
+            if self._check(connection):
+                return connection
+            self.release(connection, discard=True)
+
+        try:
+            connection = sg.Shotgun(server, scriptName, scriptKey, http_proxy=proxy)
+        except:
+            with self._lock:
+                self._unlease(key)
+            raise
+        with self._lock:
+            self._leased[id(connection)] = key
+        return connection
+
+    def release(self, connection, discard=False):
+        """
+        Give back a leased connection.
+
+        @param connection: The connection, as returned by L{acquire}.
+        @type connection: L{sg.Shotgun}
+        @param discard: Close the connection rather than keeping it, e.g. when
+            it's in an unknown state.
+        @type discard: I{bool}
+        """
+        # Don't let the next user send events on behalf of this session.
+        connection.set_session_uuid(None)
+
+        with self._lock:
+            key = self._leased.pop(id(connection), None)
+            if key is not None:
+                self._unlease(key)
+            if key is not None and not discard:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self._maxIdle:
+                    idle.append((connection, time.time()))
+                    return
+        connection.close()
+
+    def clear(self):
+        """
+        Close the idle connections.
+        """
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+        for connections in idle.values():
+            for connection, releaseTime in connections:
+                connection.close()
+
+    def _canConnect(self, key):
+        return (
+            not self._maxConnections
+            or self._leasedCounts.get(key, 0) < self._maxConnections
+        )
+
+    def _unlease(self, key):
+        """
+        Count a connection of a key as given back, the lock being held.
+        """
+        self._leasedCounts[key] -= 1
+        if not self._leasedCounts[key]:
+            del self._leasedCounts[key]
+        self._lock.notify_all()
+
+    def _check(self, connection):
+        try:
+            connection.info()
+        except Exception as err:
+            self._logger.warning(
+                "Dropping a connection to %s which failed its check: %s",
+                connection.base_url,
+                err,
+            )
+            return False
+        return True
+
+
+class ConnectionPoolError(Exception):
+    """
+    Used when no connection could be leased in time.
+    """
+
+    pass
@@ -0,0 +1,385 @@
+"""
+Cache of the entity fields read by callbacks.
+
+Callbacks mostly start by reading the entity their event is about, or its
+project, again and again. Every change made to these entities shows up in the
+event stream, so field values can be kept until an event says they changed.
+The callbacks' Shotgun connections are wrapped by L{CachedShotgun}, which
+serves reads of single entities by id from an L{EntityCache} and only queries
+Shotgun for the fields it doesn't hold.
+
+Cached values are as fresh as the events the engine has fetched. A change
+made since the last fetch is only seen once its event is fetched, as if the
+callback had run a little earlier.
+"""
+
+import collections
+import copy
+import numbers
+import threading
+
+
+class EntityCache(object):
+    """
+    Field values of entities, keyed by entity type, entity id and field name.
+
+    Values are invalidated by the events fetched by the engine, see
+    L{invalidate}:
+    - a Shotgun_<Type>_Change event drops the changed field of the entity,
+    - any other Shotgun_<Type>_<Action> event, e.g. a retirement, drops all
+      the fields of the entity.
+
+    Only the fields of entity types whose change and retirement events are
+    all fetched are cached, see L{setEventTypes}. Deep fields, whose value
+    depends on other entities, and the fields of L{UNCACHED_FIELDS}, which
+    change without events, are never cached.
+
+    The least recently used values are evicted once the cache holds more
+    than maxSize values. The cache is shared by the callbacks of every
+    thread.
+    """
+
+    # Fields which change without an event telling so: the last update of an
+    # entity isn't logged, and images are served from urls which expire.
+    UNCACHED_FIELDS = ("updated_at", "updated_by", "image", "filmstrip_image")
+
+    def __init__(self, maxSize, uncachedFields=()):
+        """
+        @param maxSize: The number of field values above which the least
+            recently used ones are evicted.
+        @type maxSize: I{int}
+        @param uncachedFields: Names of other fields to never cache, e.g.
+            query or formula fields.
+        @type uncachedFields: I{list} of I{str}
+        """
+        self._maxSize = maxSize
+        self._uncachedFields = set(self.UNCACHED_FIELDS).union(uncachedFields)
+        self._eventTypes = None
+        self.reset()
+
+    def reset(self):
+        """
+        Drop every value and recreate the lock.
+
+        Used after forking, the lock may have been held by another thread of
+        the parent process.
+        """
+        self._lock = threading.Lock()
+        self._values = collections.OrderedDict()
+        self._fields = {}
+        self._reads = {}
+
+    def setEventTypes(self, eventTypes):
+        """
+        Set the types of the events fetched by the engine. Values of entity
+        types whose events may not all be fetched are dropped.
+
+        @param eventTypes: The event types, or None if events of any type are
+            fetched.
+        @type eventTypes: I{list} of I{str}
+        """
+        if eventTypes is not None:
+            eventTypes = set(eventTypes)
+        with self._lock:
+            if eventTypes == self._eventTypes:
+                return
+            self._eventTypes = eventTypes
+            for key in list(self._fields):
+                if not self._isCachedType(key[0]):
+                    self._removeEntity(key)
+
+    def get(self, entityType, entityId, fields, fetch):
+        """
+        Get fields of an entity, from the cache when they're all cached.
+
+        Otherwise the missing fields are fetched and cached, unless the
+        entity changes while they're being fetched.
+
+        @param entityType: The type of the entity.
+        @type entityType: I{str}
+        @param entityId: The id of the entity.
+        @type entityId: I{int}
+        @param fields: The names of the fields.
+        @type fields: I{list} of I{str}
+        @param fetch: Called with the names of the missing fields to fetch
+            them from Shotgun, it returns the entity dictionary or None if the
+            entity doesn't exist.
+        @type fetch: A function object.
+
+        @return: The entity dictionary, with its type, id and the fields, or
+            None if it doesn't exist.
+        @rtype: I{dict}
+        """
+        entityKey = (entityType, entityId)
+        record = {"type": entityType, "id": entityId}
+        missing = []
+        with self._lock:
+            for field in fields:
+                key = (entityType, entityId, field)
+                if key in self._values:
+                    # Move the value to the most recently used end.
+                    record[field] = self._values[key] = self._values.pop(key)
+                else:
+                    missing.append(field)
+
+            if not missing:
+                return copy.deepcopy(record)
+
+            reads = self._reads.setdefault(entityKey, [0, False])
+            reads[0] += 1
+
+        fetched = None
+        try:
+            fetched = fetch(missing)
+        finally:
+            with self._lock:
+                reads = self._reads[entityKey]
+                reads[0] -= 1
+                if reads[0] == 0:
+                    del self._reads[entityKey]
+                if fetched is not None and not reads[1]:
+                    self._store(entityKey, missing, fetched)
+
+        if fetched is None:
+            return None
+        record.update(fetched)
+        return copy.deepcopy(record)
+
+    def invalidate(self, events):
+        """
+        Drop the values changed by events.
+
+        @param events: The events fetched by the engine.
+        @type events: I{list} of Shotgun event dictionaries.
+        """
+        with self._lock:
+            for event in events:
+                eventType = event.get("event_type") or ""
+                parts = eventType.split("_")
+                if len(parts) != 3 or parts[0] != "Shotgun":
+                    continue
+
+                meta = event.get("meta") or {}
+                entity = event.get("entity") or {}
+                entityType = meta.get("entity_type") or entity.get("type")
+                entityId = meta.get("entity_id") or entity.get("id")
+                if entityType is None or entityId is None:
+                    continue
+
+                entityKey = (entityType, entityId)
+                if parts[2] == "Change" and event.get("attribute_name"):
+                    self._removeField(entityKey, event["attribute_name"])
+                else:
+                    self._removeEntity(entityKey)
+
+    def invalidateEntity(self, entityType, entityId, fields=None):
+        """
+        Drop values of an entity, e.g. after it was updated.
+
+        @param entityType: The type of the entity.
+        @type entityType: I{str}
+        @param entityId: The id of the entity.
+        @type entityId: I{int}
+        @param fields: The names of the fields to drop, or None to drop all
+            the fields of the entity.
+        @type fields: I{list} of I{str}
+        """
+        entityKey = (entityType, entityId)
+        with self._lock:
+            if fields is None:
+                self._removeEntity(entityKey)
+            else:
+                for field in fields:
+                    self._removeField(entityKey, field)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            self._fields.clear()
+            for reads in self._reads.values():
+                reads[1] = True
+
+    def __len__(self):
+        return len(self._values)
+
+    def isCacheable(self, entityType, field):
+        """
+        @return: True if values of the field can be cached.
+        @rtype: I{bool}
+        """
+        return (
+            "." not in field
+            and field not in self._uncachedFields
+            and self._isCachedType(entityType)
+        )
+
+    def _isCachedType(self, entityType):
+        if self._eventTypes is None:
+            return True
+        return (
+            "Shotgun_%s_Change" % entityType in self._eventTypes
+            and "Shotgun_%s_Retirement" % entityType in self._eventTypes
+        )
+
+    def _store(self, entityKey, fields, record):
+        entityFields = self._fields.setdefault(entityKey, set())
+        for field in fields:
+            if field not in record or not self.isCacheable(entityKey[0], field):
+                continue
+            key = entityKey + (field,)
+            self._values.pop(key, None)
+            self._values[key] = copy.deepcopy(record[field])
+            entityFields.add(field)
+        if not entityFields:
+            del self._fields[entityKey]
+
+        while len(self._values) > self._maxSize:
+            key, value = self._values.popitem(last=False)
+            self._discardField(key[:2], key[2])
+
+    def _removeField(self, entityKey, field):
+        self._markReads(entityKey)
+        self._values.pop(entityKey + (field,), None)
+        self._discardField(entityKey, field)
+
+    def _removeEntity(self, entityKey):
+        self._markReads(entityKey)
+        for field in self._fields.pop(entityKey, ()):
+            self._values.pop(entityKey + (field,), None)
+
+    def _discardField(self, entityKey, field):
+        entityFields = self._fields.get(entityKey)
+        if entityFields is not None:
+            entityFields.discard(field)
+            if not entityFields:
+                del self._fields[entityKey]
+
+    def _markReads(self, entityKey):
+        # Values being fetched may predate the change, they're not stored.
+        reads = self._reads.get(entityKey)
+        if reads is not None:
+            reads[1] = True
+
+
+class CachedShotgun(object):
+    """
+    A Shotgun connection whose reads of single entities by id go through an
+    L{EntityCache}.
+
+    find_one and find calls filtering on nothing but an id, with no other
+    option than the fields to return, are served from the cache. Any other
+    call goes to the connection. Entities updated, deleted or revived
+    through this connection are dropped from the cache.
+    """
+
+    # Default values of the options of find and find_one.
+    READ_DEFAULTS = {
+        "order": None,
+        "filter_operator": None,
+        "limit": 0,
+        "retired_only": False,
+        "page": 0,
+        "include_archived_projects": True,
+        "additional_filter_presets": None,
+    }
+
+    def __init__(self, shotgun, cache):
+        """
+        @param shotgun: The connection to wrap.
+        @type shotgun: L{shotgun_api3.Shotgun}
+        @param cache: The cache to read from.
+        @type cache: L{EntityCache}
+        """
+        self._shotgun = shotgun
+        self._cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self._shotgun, name)
+
+    def find_one(self, entity_type, filters, fields=None, *args, **kwargs):
+        entityId = self._getEntityId(entity_type, filters, fields, args, kwargs)
+        if entityId is None:
+            return self._shotgun.find_one(
+                entity_type, filters, fields, *args, **kwargs
+            )
+        return self._cache.get(
+            entity_type,
+            entityId,
+            fields or [],
+            lambda missing: self._shotgun.find_one(entity_type, filters, missing),
+        )
+
+    def find(self, entity_type, filters, fields=None, *args, **kwargs):
+        entityId = self._getEntityId(entity_type, filters, fields, args, kwargs)
+        if entityId is None:
+            return self._shotgun.find(entity_type, filters, fields, *args, **kwargs)
+        record = self._cache.get(
+            entity_type,
+            entityId,
+            fields or [],
+            lambda missing: self._shotgun.find_one(entity_type, filters, missing),
+        )
+        return [record] if record is not None else []
+
+    def update(self, entity_type, entity_id, data, *args, **kwargs):
+        try:
+            return self._shotgun.update(entity_type, entity_id, data, *args, **kwargs)
+        finally:
+            self._cache.invalidateEntity(entity_type, entity_id, list(data))
+
+    def delete(self, entity_type, entity_id):
+        try:
+            return self._shotgun.delete(entity_type, entity_id)
+        finally:
+            self._cache.invalidateEntity(entity_type, entity_id)
+
+    def revive(self, entity_type, entity_id):
+        try:
+            return self._shotgun.revive(entity_type, entity_id)
+        finally:
+            self._cache.invalidateEntity(entity_type, entity_id)
+
+    def batch(self, requests):
+        try:
+            return self._shotgun.batch(requests)
+        finally:
+            for request in requests:
+                if request.get("request_type") == "update":
+                    self._cache.invalidateEntity(
+                        request["entity_type"],
+                        request["entity_id"],
+                        list(request.get("data") or []),
+                    )
+                elif request.get("request_type") == "delete":
+                    self._cache.invalidateEntity(
+                        request["entity_type"], request["entity_id"]
+                    )
+
+    def _getEntityId(self, entityType, filters, fields, args, kwargs):
+        """
+        Get the id a read filters on, if it can be served from the cache.
+
+        @return: The id, or None if the read must go to Shotgun.
+        @rtype: I{int}
+        """
+        if args or not fields:
+            return None
+        for name, value in kwargs.items():
+            if name not in self.READ_DEFAULTS or value != self.READ_DEFAULTS[name]:
+                return None
+        if not isinstance(filters, (list, tuple)) or len(filters) != 1:
+            return None
+
+        condition = filters[0]
+        if (
+            not isinstance(condition, (list, tuple))
+            or len(condition) != 3
+            or condition[0] != "id"
+            or condition[1] != "is"
+            or not isinstance(condition[2], numbers.Integral)
+        ):
+            return None
+
+        if not all(self._cache.isCacheable(entityType, field) for field in fields):
+            return None
+        return condition[2]
@@ -0,0 +1,180 @@
+"""
+Backlog of the event ids a plugin is still waiting for.
+
+When a plugin sees a gap in the ids of the events it processes, the missing
+ids might still show up in the EventLog for a while. They are kept in a
+backlog until they are processed or they expire. A gap is kept as a single
+range of ids, so a gap of thousands of ids costs as much as a gap of one.
+"""
+
+import bisect
+import heapq
+
+
+class EventBacklog(object):
+    """
+    A set of event ids stored as sorted ranges, each with an expiration.
+
+    Looking up an id, adding or removing a range are logarithmic in the number
+    of ranges, plus moving the list of ranges around in memory. Expired ranges
+    are found through a heap ordered by expiration.
+
+    The state of a backlog is the sorted list of its (first id, last id,
+    expiration) ranges, see L{getRanges}.
+    """
+
+    def __init__(self, state=None):
+        """
+        @param state: The ranges of a backlog as returned by L{getRanges}, or
+            the {event id: expiration} dictionary older versions used.
+        @type state: I{list}, I{dict} or None
+        """
+        self._starts = []
+        self._ranges = {}
+        self._expirations = []
+        self._count = 0
+
+        for first, last, expiration in toRanges(state):
+            self.add(first, last, expiration)
+
+    def add(self, first, last, expiration):
+        """
+        Add a range of ids. Ids already in the backlog get the new expiration.
+
+        @param first: The first id of the range.
+        @type first: I{int}
+        @param last: The last id of the range, included.
+        @type last: I{int}
+        @param expiration: When the ids expire.
+        @type expiration: I{datetime.datetime}
+        """
+        if last < first:
+            return
+        self.discard(first, last)
+        self._insert(first, last, expiration)
+
+    def discard(self, first, last=None):
+        """
+        Remove a range of ids, the ids which are not in the backlog are
+        ignored.
+
+        @param first: The first id of the range.
+        @type first: I{int}
+        @param last: The last id of the range, included. Defaults to first.
+        @type last: I{int}
+        """
+        if last is None:
+            last = first
+
+        index = bisect.bisect_right(self._starts, first) - 1
+        if index < 0 or self._ranges[self._starts[index]][0] < first:
+            index += 1
+
+        while index < len(self._starts) and self._starts[index] <= last:
+            start = self._starts[index]
+            end, expiration = self._ranges[start]
+            del self._starts[index]
+            del self._ranges[start]
+            self._count -= end - start + 1
+
+            # Put back what is left of the range on either side.
+            if start < first:
+                self._insert(start, first - 1, expiration)
+                index += 1
+            if end > last:
+                self._insert(last + 1, end, expiration)
+                index += 1
+
+    def expire(self, now):
+        """
+        Remove the ranges which expired.
+
+        @param now: The current time.
+        @type now: I{datetime.datetime}
+
+        @return: The (first id, last id) of the removed ranges.
+        @rtype: I{list} of tuples
+        """
+        expired = []
+        while self._expirations and self._expirations[0][0] < now:
+            expiration, first, last = heapq.heappop(self._expirations)
+            if self._ranges.get(first) != (last, expiration):
+                # The range was changed since, its pieces have their own
+                # entries.
+                continue
+            self._starts.pop(bisect.bisect_left(self._starts, first))
+            del self._ranges[first]
+            self._count -= last - first + 1
+            expired.append((first, last))
+        return expired
+
+    def getFirstId(self):
+        """
+        @return: The lowest id in the backlog, or None if it is empty.
+        @rtype: I{int} or None
+        """
+        if self._starts:
+            return self._starts[0]
+        return None
+
+    def getLastId(self):
+        """
+        @return: The highest id in the backlog, or None if it is empty.
+        @rtype: I{int} or None
+        """
+        if self._starts:
+            return self._ranges[self._starts[-1]][0]
+        return None
+
+    def getRanges(self):
+        """
+        @return: The (first id, last id, expiration) ranges of the backlog,
+            sorted by id.
+        @rtype: I{list} of tuples
+        """
+        return [(start,) + self._ranges[start] for start in self._starts]
+
+    def __contains__(self, eventId):
+        index = bisect.bisect_right(self._starts, eventId) - 1
+        return index >= 0 and self._ranges[self._starts[index]][0] >= eventId
+
+    def __len__(self):
+        """
+        The number of ids in the backlog.
+        """
+        return self._count
+
+    def _insert(self, first, last, expiration):
+        bisect.insort(self._starts, first)
+        self._ranges[first] = (last, expiration)
+        self._count += last - first + 1
+        heapq.heappush(self._expirations, (expiration, first, last))
+
+
+def toRanges(state):
+    """
+    Get the ranges of the state of a backlog.
+
+    @param state: The ranges of a backlog as returned by
+        L{EventBacklog.getRanges}, or the {event id: expiration} dictionary
+        older versions used.
+    @type state: I{list}, I{dict} or None
+
+    @return: The (first id, last id, expiration) ranges, sorted by id.
+    @rtype: I{list} of tuples
+    """
+    if not state:
+        return []
+
+    if not isinstance(state, dict):
+        return sorted(tuple(r) for r in state)
+
+    # Merge consecutive ids which expire together.
+    ranges = []
+    for eventId in sorted(state):
+        expiration = state[eventId]
+        if ranges and ranges[-1][1] == eventId - 1 and ranges[-1][2] == expiration:
+            ranges[-1] = (ranges[-1][0], eventId, expiration)
+        else:
+            ranges.append((eventId, eventId, expiration))
+    return ranges
@@ -0,0 +1,152 @@
+"""
+Cache of the events recently fetched from Shotgun.
+
+The engine fetches events from the lowest next event id of all its plugins.
+When one plugin lags behind, because it was just added, reloaded or took long
+to process a batch, the events it needs again were most likely fetched
+moments ago for the other plugins. They are served from this cache and Shotgun
+is only queried for the ids after it.
+"""
+
+import bisect
+import collections
+import time
+
+
+class EventCache(object):
+    """
+    The events of the pages fetched recently, with the ranges of ids they
+    cover.
+
+    A page of events fetched from an id covers every id from that id to the
+    id of its last event: ids in between without an event had none of the
+    fetched types at the time. Each page is kept as a range of ids, ranges
+    next to each other are served together.
+
+    Pages are evicted oldest first once the cache holds more than maxEvents
+    events, or once they were fetched more than maxAge seconds ago.
+
+    The cache is only used from the engine's main loop, it isn't thread safe.
+    """
+
+    def __init__(self, maxEvents, maxAge):
+        """
+        @param maxEvents: The number of events above which pages are evicted.
+        @type maxEvents: I{int}
+        @param maxAge: The number of seconds pages are kept for, or 0 to keep
+            them until they're evicted for space.
+        @type maxAge: I{float}
+        """
+        self._maxEvents = maxEvents
+        self._maxAge = maxAge
+        self._starts = []
+        self._ranges = {}
+        self._pages = collections.deque()
+        self._count = 0
+
+    def add(self, firstId, events):
+        """
+        Add a page of events. Ranges overlapping the page are dropped.
+
+        @param firstId: The id the page was fetched from.
+        @type firstId: I{int}
+        @param events: The events of the page, ordered by id.
+        @type events: I{list} of Shotgun event dictionaries.
+        """
+        if not events:
+            return
+
+        lastId = events[-1]["id"]
+        index = bisect.bisect_right(self._starts, firstId) - 1
+        if index < 0 or self._ranges[self._starts[index]][0] < firstId:
+            index += 1
+        while index < len(self._starts) and self._starts[index] <= lastId:
+            self._remove(self._starts[index])
+
+        page = (firstId, time.time())
+        bisect.insort(self._starts, firstId)
+        self._ranges[firstId] = (lastId, events, page)
+        self._pages.append(page)
+        self._count += len(events)
+        self.evict()
+
+    def get(self, firstId, limit):
+        """
+        Get the cached events from an id onwards.
+
+        @param firstId: The id to start from.
+        @type firstId: I{int}
+        @param limit: The maximum number of events to return.
+        @type limit: I{int}
+
+        @return: The events, ordered by id, and the last id they cover. The
+            last id is None when the cache doesn't cover firstId.
+        @rtype: A (I{list} of Shotgun event dictionaries, I{int}) tuple.
+        """
+        self.evict()
+
+        index = bisect.bisect_right(self._starts, firstId) - 1
+        if index < 0 or self._ranges[self._starts[index]][0] < firstId:
+            return [], None
+
+        events = []
+        lastId = None
+        while index < len(self._starts):
+            start = self._starts[index]
+            if lastId is not None and start != lastId + 1:
+                break
+            rangeLast, rangeEvents, _ = self._ranges[start]
+            if start < firstId:
+                ids = [event["id"] for event in rangeEvents]
+                rangeEvents = rangeEvents[bisect.bisect_left(ids, firstId) :]
+
+            if len(events) + len(rangeEvents) >= limit:
+                # The events are only known to be complete up to the last one
+                # returned.
+                events.extend(rangeEvents[: limit - len(events)])
+                if events:
+                    return events, events[-1]["id"]
+                return events, firstId - 1
+
+            events.extend(rangeEvents)
+            lastId = rangeLast
+            index += 1
+
+        return events, lastId
+
+    def evict(self):
+        """
+        Drop the pages which are too old, then the oldest pages until the
+        cache holds at most maxEvents events.
+        """
+        if self._maxAge > 0:
+            expiration = time.time() - self._maxAge
+            while self._pages and self._pages[0][1] < expiration:
+                self._evictOldest()
+
+        while self._count > self._maxEvents:
+            self._evictOldest()
+
+    def clear(self):
+        """
+        Drop every page.
+        """
+        self._starts = []
+        self._ranges = {}
+        self._pages.clear()
+        self._count = 0
+
+    def __len__(self):
+        """
+        The number of events in the cache.
+        """
+        return self._count
+
+    def _evictOldest(self):
+        self._remove(self._pages[0][0])
+
+    def _remove(self, start):
+        lastId, events, page = self._ranges.pop(start)
+        self._starts.pop(bisect.bisect_left(self._starts, start))
+        self._pages.remove(page)
+        self._count -= len(events)
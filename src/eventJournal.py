@@ -0,0 +1,561 @@
+"""
+Local journal of the events fetched from Shotgun.
+
+Every page of events the engine fetches can be appended to a journal on the
+local disk. Events a plugin needs again, because it was just added, was set
+back to an older id or the daemon was restarted, are then read from the
+journal instead of being paged out of Shotgun again.
+"""
+
+import bisect
+import mmap
+import os
+import struct
+import time
+import traceback
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+class EventJournal(object):
+    """
+    An append-only journal of events, split in segment files.
+
+    Like a page of L{eventCache.EventCache}, a segment covers every id from
+    the id it was started at to the id of its last event. A new segment is
+    started when a segment reaches segmentSize bytes, when the events
+    appended don't follow the last segment or when the fetched event types
+    change. Consecutive segments are read as one.
+
+    The oldest segments are deleted once the journal takes more than maxSize
+    bytes or once they were last written to more than maxAge seconds ago.
+    This is checked when the journal is opened and closed, when a segment is
+    started and every RETENTION_INTERVAL seconds while events are appended.
+
+    Appended events are written to the disk by L{sync}, and when their
+    segment is sealed.
+
+    The journal is only used from the engine's main loop, it isn't thread
+    safe.
+    """
+
+    # Seconds between two checks of the retention limits while appending.
+    RETENTION_INTERVAL = 60
+
+    def __init__(self, path, segmentSize, maxSize, maxAge, logger):
+        """
+        @param path: The directory of the journal, created if needed.
+        @type path: I{str}
+        @param segmentSize: The size in bytes above which a new segment is
+            started.
+        @type segmentSize: I{int}
+        @param maxSize: The size in bytes above which the oldest segments are
+            deleted, or 0 for no limit.
+        @type maxSize: I{int}
+        @param maxAge: The number of seconds after which segments are
+            deleted, or 0 for no limit.
+        @type maxAge: I{float}
+        @param logger: The logger to report problems to.
+        @type logger: A logging.Logger instance
+
+        @raise JournalError: If the directory can't be created.
+        """
+        self.path = path
+        self._segmentSize = segmentSize
+        self._maxSize = maxSize
+        self._maxAge = maxAge
+        self._logger = logger
+        self._eventTypes = None
+        self._writable = True
+        self._segments = []
+        self._firstIds = []
+        self._lastRetention = 0
+
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError as err:
+                raise JournalError(
+                    "Can not create the event journal directory %s: %s" % (path, err)
+                )
+
+        for basename in sorted(os.listdir(path)):
+            if not basename.endswith(JournalSegment.EXTENSION):
+                continue
+            try:
+                segment = JournalSegment.open(os.path.join(path, basename), logger)
+            except (IOError, OSError, JournalError) as err:
+                logger.warning("Ignoring event journal segment %s: %s", basename, err)
+                continue
+            self._segments.append(segment)
+            self._firstIds.append(segment.firstId)
+
+        self._applyRetention()
+
+    def setEventTypes(self, eventTypes):
+        """
+        Set the event types of the events appended from now on.
+
+        @param eventTypes: The event types, or None for all event types.
+        @type eventTypes: I{list} of I{str} or None
+        """
+        self._eventTypes = eventTypes
+
+    def get(self, firstId, limit):
+        """
+        Read the journaled events from an id onwards.
+
+        Only segments holding every event of the current event types are
+        read.
+
+        @param firstId: The id to start from.
+        @type firstId: I{int}
+        @param limit: The maximum number of events to return.
+        @type limit: I{int}
+
+        @return: The events, ordered by id, and the last id they cover. The
+            last id is None when the journal doesn't cover firstId.
+        @rtype: A (I{list} of Shotgun event dictionaries, I{int}) tuple.
+        """
+        index = bisect.bisect_right(self._firstIds, firstId) - 1
+        if index < 0 or self._segments[index].lastId < firstId:
+            return [], None
+
+        events = []
+        lastId = None
+        while index < len(self._segments):
+            segment = self._segments[index]
+            if lastId is not None and segment.firstId != lastId + 1:
+                break
+            if not self._canRead(segment):
+                break
+
+            try:
+                segmentEvents = segment.read(
+                    max(firstId, segment.firstId), limit - len(events)
+                )
+            except Exception as err:
+                self._logger.warning(
+                    "Can not read event journal segment %s: %s", segment.path, err
+                )
+                break
+
+            events.extend(segmentEvents)
+            if len(events) >= limit:
+                # The events are only known to be complete up to the last one
+                # returned.
+                return events, events[-1]["id"]
+
+            lastId = segment.lastId
+            index += 1
+
+        return events, lastId
+
+    def append(self, firstId, events):
+        """
+        Append a page of events. Events the journal already covers are
+        skipped.
+
+        @param firstId: The id the page was fetched from.
+        @type firstId: I{int}
+        @param events: The events of the page, ordered by id.
+        @type events: I{list} of Shotgun event dictionaries.
+        """
+        if not events or not self._writable:
+            return
+
+        segment = self._segments[-1] if self._segments else None
+        if segment is not None and firstId <= segment.lastId:
+            events = [event for event in events if event["id"] > segment.lastId]
+            if not events:
+                return
+            firstId = segment.lastId + 1
+
+        try:
+            if (
+                segment is None
+                or firstId != segment.lastId + 1
+                or segment.eventTypes != self._eventTypes
+                or segment.size >= self._segmentSize
+            ):
+                if segment is not None:
+                    segment.seal()
+                segment = JournalSegment.create(
+                    self.path, firstId, self._eventTypes, self._logger
+                )
+                self._segments.append(segment)
+                self._firstIds.append(segment.firstId)
+                self._applyRetention()
+
+            segment.append(events)
+            if time.time() - self._lastRetention >= self.RETENTION_INTERVAL:
+                self._applyRetention()
+        except (IOError, OSError) as err:
+            self._logger.error(
+                "Can not write to the event journal at %s, journaling is "
+                "disabled until the daemon restarts.\n\n%s",
+                self.path,
+                traceback.format_exc(err),
+            )
+            self._writable = False
+
+    def sync(self):
+        """
+        Write the events appended so far to the disk.
+        """
+        if not self._segments or not self._writable:
+            return
+
+        try:
+            self._segments[-1].sync()
+        except (IOError, OSError) as err:
+            self._logger.warning(
+                "Can not sync the event journal at %s: %s", self.path, err
+            )
+
+    def close(self):
+        if self._writable:
+            self._applyRetention()
+        for segment in self._segments:
+            try:
+                segment.close()
+            except (IOError, OSError) as err:
+                self._logger.warning(
+                    "Can not close event journal segment %s: %s", segment.path, err
+                )
+
+    def _canRead(self, segment):
+        """
+        Whether a segment holds every event of the current event types.
+        """
+        if segment.eventTypes is None:
+            return True
+        if self._eventTypes is None:
+            return False
+        return set(self._eventTypes).issubset(segment.eventTypes)
+
+    def _applyRetention(self):
+        """
+        Delete the oldest segments while the journal is too big or they're
+        too old. The last segment is always kept.
+        """
+        totalSize = sum(segment.size for segment in self._segments)
+        now = time.time()
+        self._lastRetention = now
+        while len(self._segments) > 1:
+            segment = self._segments[0]
+            if not (
+                (self._maxSize > 0 and totalSize > self._maxSize)
+                or (self._maxAge > 0 and segment.getMTime() < now - self._maxAge)
+            ):
+                break
+
+            self._logger.debug("Deleting event journal segment %s.", segment.path)
+            try:
+                segment.delete()
+            except (IOError, OSError) as err:
+                self._logger.warning(
+                    "Can not delete event journal segment %s: %s", segment.path, err
+                )
+            totalSize -= segment.size
+            del self._segments[0]
+            del self._firstIds[0]
+
+
+class JournalSegment(object):
+    """
+    A segment file of an L{EventJournal}.
+
+    A segment starts with a header holding the event types it was written
+    for, followed by a record per event: the event id, the size of the
+    pickled event and the pickled event. Every INDEX_INTERVAL bytes, the id
+    and offset of a record are appended to an index file next to the segment
+    so reading from an id only scans a small part of the segment. Segments
+    are read through a memory map.
+    """
+
+    EXTENSION = ".journal"
+    INDEX_EXTENSION = ".index"
+    INDEX_INTERVAL = 64 * 1024
+    MAGIC = b"SGEJ"
+
+    _HEADER = struct.Struct("<4sI")
+    _RECORD = struct.Struct("<QI")
+    _INDEX = struct.Struct("<QQ")
+
+    def __init__(self, path, firstId, eventTypes, logger):
+        self.path = path
+        self.indexPath = os.path.splitext(path)[0] + self.INDEX_EXTENSION
+        self.firstId = firstId
+        self.lastId = firstId - 1
+        self.eventTypes = eventTypes
+        self.size = 0
+        self._logger = logger
+        self._dataOffset = 0
+        self._indexIds = []
+        self._indexOffsets = []
+        self._file = None
+        self._indexFile = None
+        self._map = None
+
+    @classmethod
+    def create(cls, directory, firstId, eventTypes, logger):
+        """
+        Create a new segment.
+
+        @param directory: The directory of the journal.
+        @type directory: I{str}
+        @param firstId: The first id the segment covers.
+        @type firstId: I{int}
+        @param eventTypes: The event types of the events of the segment, or
+            None for all event types.
+        @type eventTypes: I{list} of I{str} or None
+
+        @rtype: L{JournalSegment}
+        """
+        path = os.path.join(directory, "%020d%s" % (firstId, cls.EXTENSION))
+        segment = cls(path, firstId, eventTypes, logger)
+
+        header = pickle.dumps((firstId, eventTypes), pickle.HIGHEST_PROTOCOL)
+        segment._file = open(path, "wb")
+        segment._file.write(cls._HEADER.pack(cls.MAGIC, len(header)) + header)
+        segment._file.flush()
+        segment._indexFile = open(segment.indexPath, "wb")
+
+        segment._dataOffset = cls._HEADER.size + len(header)
+        segment.size = segment._dataOffset
+        return segment
+
+    @classmethod
+    def open(cls, path, logger):
+        """
+        Open an existing segment.
+
+        A record which was only partially written when the daemon died is
+        ignored, along with its index entries. They're truncated when events
+        are appended to the segment, opening a segment doesn't write to it.
+
+        @param path: The path of the segment file.
+        @type path: I{str}
+
+        @rtype: L{JournalSegment}
+
+        @raise JournalError: If the file is not a journal segment.
+        """
+        fh = open(path, "rb")
+        try:
+            data = fh.read(cls._HEADER.size)
+            if len(data) < cls._HEADER.size:
+                raise JournalError("the header is incomplete.")
+            magic, headerSize = cls._HEADER.unpack(data)
+            if magic != cls.MAGIC:
+                raise JournalError("not an event journal segment.")
+            try:
+                firstId, eventTypes = pickle.loads(fh.read(headerSize))
+            except Exception:
+                raise JournalError("the header is corrupted.")
+        finally:
+            fh.close()
+
+        segment = cls(path, firstId, eventTypes, logger)
+        segment._dataOffset = cls._HEADER.size + headerSize
+        segment.size = os.path.getsize(path)
+
+        if os.path.exists(segment.indexPath):
+            fh = open(segment.indexPath, "rb")
+            try:
+                data = fh.read()
+            finally:
+                fh.close()
+            for offset in range(0, len(data) - cls._INDEX.size + 1, cls._INDEX.size):
+                eventId, recordOffset = cls._INDEX.unpack_from(data, offset)
+                if recordOffset >= segment.size:
+                    break
+                segment._indexIds.append(eventId)
+                segment._indexOffsets.append(recordOffset)
+
+        segment._recover()
+        return segment
+
+    def read(self, firstId, limit):
+        """
+        Read the events of the segment from an id onwards.
+
+        @param firstId: The id to start from.
+        @type firstId: I{int}
+        @param limit: The maximum number of events to return.
+        @type limit: I{int}
+
+        @return: The events, ordered by id.
+        @rtype: I{list} of Shotgun event dictionaries.
+        """
+        if self.size <= self._dataOffset:
+            return []
+
+        if self._map is None or len(self._map) < self.size:
+            # The segment grew since it was mapped.
+            self._unmap()
+            fh = open(self.path, "rb")
+            try:
+                self._map = mmap.mmap(fh.fileno(), self.size, access=mmap.ACCESS_READ)
+            finally:
+                fh.close()
+
+        index = bisect.bisect_right(self._indexIds, firstId) - 1
+        if index >= 0:
+            offset = self._indexOffsets[index]
+        else:
+            offset = self._dataOffset
+
+        events = []
+        while offset < self.size and len(events) < limit:
+            eventId, size = self._RECORD.unpack_from(self._map, offset)
+            start = offset + self._RECORD.size
+            if eventId >= firstId:
+                events.append(pickle.loads(self._map[start : start + size]))
+            offset = start + size
+        return events
+
+    def append(self, events):
+        """
+        Append events to the segment.
+
+        @param events: The events, ordered by id, all after the last event of
+            the segment.
+        @type events: I{list} of Shotgun event dictionaries.
+        """
+        if self._file is None:
+            # Drop what is left of records and index entries which were only
+            # partially written when the daemon died.
+            self._file = open(self.path, "r+b")
+            self._file.truncate(self.size)
+            self._file.seek(self.size)
+            if os.path.exists(self.indexPath):
+                self._indexFile = open(self.indexPath, "r+b")
+            else:
+                self._indexFile = open(self.indexPath, "wb")
+            self._indexFile.truncate(len(self._indexIds) * self._INDEX.size)
+            self._indexFile.seek(len(self._indexIds) * self._INDEX.size)
+
+        lastIndexed = self._indexOffsets[-1] if self._indexOffsets else self._dataOffset
+        chunks = []
+        indexChunks = []
+        offset = self.size
+        for event in events:
+            if offset - lastIndexed >= self.INDEX_INTERVAL:
+                self._indexIds.append(event["id"])
+                self._indexOffsets.append(offset)
+                indexChunks.append(self._INDEX.pack(event["id"], offset))
+                lastIndexed = offset
+
+            data = pickle.dumps(event, pickle.HIGHEST_PROTOCOL)
+            chunks.append(self._RECORD.pack(event["id"], len(data)))
+            chunks.append(data)
+            offset += self._RECORD.size + len(data)
+
+        self._file.write(b"".join(chunks))
+        self._file.flush()
+        if indexChunks:
+            self._indexFile.write(b"".join(indexChunks))
+            self._indexFile.flush()
+
+        self.size = offset
+        self.lastId = events[-1]["id"]
+
+    def sync(self):
+        """
+        Write the appended events and index entries to the disk.
+        """
+        for fh in (self._file, self._indexFile):
+            if fh is not None:
+                os.fsync(fh.fileno())
+
+    def seal(self):
+        """
+        Stop appending to the segment, once its events are on the disk.
+        """
+        try:
+            self.sync()
+        finally:
+            for fh in (self._file, self._indexFile):
+                if fh is not None:
+                    fh.close()
+            self._file = None
+            self._indexFile = None
+
+    def close(self):
+        self.seal()
+        self._unmap()
+
+    def delete(self):
+        self.close()
+        os.remove(self.path)
+        if os.path.exists(self.indexPath):
+            os.remove(self.indexPath)
+
+    def getMTime(self):
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return 0
+
+    def _unmap(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _recover(self):
+        """
+        Find the last event of the segment, from its last index entry on.
+
+        Index entries of a record which is incomplete are dropped.
+        """
+        while True:
+            if self._indexOffsets:
+                offset = self._indexOffsets[-1]
+            else:
+                offset = self._dataOffset
+
+            fh = open(self.path, "rb")
+            try:
+                fh.seek(offset)
+                data = fh.read()
+            finally:
+                fh.close()
+
+            position = 0
+            lastId = None
+            while position + self._RECORD.size <= len(data):
+                eventId, size = self._RECORD.unpack_from(data, position)
+                end = position + self._RECORD.size + size
+                if end > len(data):
+                    break
+                lastId = eventId
+                position = end
+
+            if lastId is not None or not self._indexOffsets:
+                break
+            del self._indexIds[-1]
+            del self._indexOffsets[-1]
+
+        if lastId is not None:
+            self.lastId = lastId
+
+        if position != len(data):
+            self._logger.warning(
+                "Ignoring %d bytes of incomplete records at the end of %s.",
+                len(data) - position,
+                self.path,
+            )
+        self.size = offset + position
+
+
+class JournalError(Exception):
+    """
+    Used when the event journal can't be set up or a segment can't be read.
+    """
+
+    pass
@@ -6,7 +6,6 @@
 #
 
 import os
-import shotgun_api3
 
 """
 This plugin was created for the Shotgun Developer Learning series video titled,
@@ -53,7 +52,7 @@ def registerCallbacks(reg):
     script_key = os.environ["SGDAEMON_ESUTS_KEY"]
 
     # Grab an sg connection for the validator.
-    sg = shotgun_api3.Shotgun(server, script_name=script_name, api_key=script_key)
+    sg = reg.getShotgun(script_name, script_key, server)
 
     # Bail if our validator fails.
     if not is_valid(sg, reg.logger, args):
@@ -8,7 +8,6 @@
 # See docs folder for detailed usage info.
 
 import os
-import shotgun_api3
 
 
 def registerCallbacks(reg):
@@ -33,7 +32,7 @@ def registerCallbacks(reg):
     }
 
     # Grab an sg connection for the validator and bail if it fails.
-    sg = shotgun_api3.Shotgun(server, script_name=script_name, api_key=script_key)
+    sg = reg.getShotgun(script_name, script_key, server)
     if not is_valid(sg, reg.logger, args):
         reg.logger.warning("Plugin is not valid, will not register callback.")
         return
@@ -62,7 +62,6 @@ Plugin Args
 
 import re
 import os
-import shotgun_api3
 
 
 def registerCallbacks(reg):
@@ -85,7 +84,7 @@ def registerCallbacks(reg):
     }
 
     # Grab an sg connection for the validator.
-    sg = shotgun_api3.Shotgun(server, script_name=script_name, api_key=script_key)
+    sg = reg.getShotgun(script_name, script_key, server)
 
     # Bail if our validator fails.
     if not is_valid(sg, reg.logger, args):
@@ -0,0 +1,328 @@
+"""
+Change notifications for the plugin directories of the Shotgun event daemon.
+
+Rather than listing every plugin directory and checking the mtime of every
+plugin file at each pass of the event processing loop, the engine asks a
+watcher which directories changed and only reloads those.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+
+WATCHERS = ("auto", "inotify", "poll")
+
+
+def createWatcher(kind, paths, rescanInterval, logger, onChange=None):
+    """
+    Create a watcher for some directories.
+
+    @param kind: One of L{WATCHERS}. With "auto", inotify is used when
+        available and polling otherwise.
+    @type kind: I{str}
+    @param paths: The directories to watch.
+    @type paths: I{list} of I{str}
+    @param rescanInterval: Seconds between two rescans of every directory, see
+        L{Watcher}.
+    @type rescanInterval: I{float}
+    @param logger: The logger to report problems to.
+    @type logger: A logging.Logger instance
+    @param onChange: Called from the watcher's thread when a change is seen.
+    @type onChange: A callable or None
+
+    @return: The watcher.
+    @rtype: L{Watcher}
+    """
+    if kind in ("auto", "inotify"):
+        watcher = None
+        try:
+            watcher = InotifyWatcher(rescanInterval, logger, onChange)
+            for path in paths:
+                watcher.watch(path)
+            return watcher
+        except WatcherError as err:
+            if watcher:
+                watcher.close()
+            if kind == "inotify":
+                raise
+            logger.debug("Polling plugin directories, %s", err)
+
+    watcher = PollingWatcher(rescanInterval, logger, onChange)
+    for path in paths:
+        watcher.watch(path)
+    return watcher
+
+
+class Watcher(object):
+    """
+    Base class of the watchers.
+
+    Every directory is also reported as changed every rescanInterval seconds
+    when it is greater than 0. This catches changes a watcher can't see, like
+    files modified from another host on a network file system.
+    """
+
+    def __init__(self, rescanInterval, logger, onChange=None):
+        self._rescanInterval = rescanInterval
+        self._logger = logger
+        self._onChange = onChange
+        self._lock = threading.Lock()
+        self._paths = []
+        self._changed = set()
+        self._lastRescan = time.time()
+
+    def watch(self, path):
+        """
+        Start watching a directory.
+
+        The directory is reported as changed by the next call to
+        L{getChanges}.
+
+        @param path: The directory to watch.
+        @type path: I{str}
+        """
+        with self._lock:
+            self._paths.append(path)
+            self._changed.add(path)
+
+    def getChanges(self):
+        """
+        Get the directories which changed since the last call.
+
+        @return: The paths of the changed directories.
+        @rtype: I{set}
+        """
+        with self._lock:
+            now = time.time()
+            elapsed = now - self._lastRescan
+            if self._rescanInterval > 0 and elapsed >= self._rescanInterval:
+                self._changed.update(self._paths)
+                self._lastRescan = now
+
+            changed = self._changed
+            self._changed = set()
+        return changed
+
+    def close(self):
+        """
+        Stop watching.
+        """
+        pass
+
+    def _notify(self, paths):
+        with self._lock:
+            self._changed.update(paths)
+        if self._onChange:
+            self._onChange()
+
+
+class PollingWatcher(Watcher):
+    """
+    Reports every directory as changed every rescanInterval seconds, or at
+    every call to L{getChanges} when it is 0.
+    """
+
+    def getChanges(self):
+        if self._rescanInterval <= 0:
+            with self._lock:
+                self._changed = set()
+            return set(self._paths)
+        return super(PollingWatcher, self).getChanges()
+
+
+class InotifyWatcher(Watcher):
+    """
+    Uses the Linux inotify API to be told about changes to plugin files.
+
+    A thread reads the notifications and reports the directory of any .py
+    file which is created, modified, moved or deleted.
+
+    A directory which is deleted or moved away stops being watched. It is
+    looked for at every call to L{getChanges} and watched again, and reported
+    as changed, as soon as it exists again.
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    WATCH_MASK = (
+        IN_MODIFY
+        | IN_ATTRIB
+        | IN_CLOSE_WRITE
+        | IN_MOVED_FROM
+        | IN_MOVED_TO
+        | IN_CREATE
+        | IN_DELETE
+        | IN_DELETE_SELF
+        | IN_MOVE_SELF
+    )
+
+    _HEADER = struct.Struct("iIII")
+
+    def __init__(self, rescanInterval, logger, onChange=None):
+        super(InotifyWatcher, self).__init__(rescanInterval, logger, onChange)
+
+        if not sys.platform.startswith("linux"):
+            raise WatcherError("inotify is only available on Linux.")
+
+        libcName = ctypes.util.find_library("c")
+        if not libcName:
+            raise WatcherError("the C library could not be found.")
+        self._libc = ctypes.CDLL(libcName, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise WatcherError("the C library has no inotify support.")
+
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise WatcherError(
+                "inotify_init1 failed: %s" % os.strerror(ctypes.get_errno())
+            )
+
+        self._watches = {}
+        self._lost = set()
+        self._stopRead, self._stopWrite = os.pipe()
+        self._thread = threading.Thread(target=self._run, name="InotifyWatcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def watch(self, path):
+        self._addWatch(path)
+        super(InotifyWatcher, self).watch(path)
+
+    def getChanges(self):
+        with self._lock:
+            lost = list(self._lost)
+
+        found = set()
+        for path in lost:
+            if not os.path.isdir(path):
+                continue
+            try:
+                self._addWatch(path)
+            except WatcherError as err:
+                self._logger.debug("%s", err)
+                continue
+            self._logger.info("Plugin directory %s is watched again.", path)
+            found.add(path)
+
+        with self._lock:
+            self._lost.difference_update(found)
+            lost = set(self._lost)
+
+        # A missing directory can't be loaded, it is reported once it's back.
+        changed = super(InotifyWatcher, self).getChanges() | found
+        return changed - lost
+
+    def _addWatch(self, path):
+        encodedPath = path
+        if not isinstance(encodedPath, bytes):
+            encodedPath = path.encode(sys.getfilesystemencoding())
+
+        wd = self._libc.inotify_add_watch(self._fd, encodedPath, self.WATCH_MASK)
+        if wd < 0:
+            raise WatcherError(
+                "Can not watch %s: %s" % (path, os.strerror(ctypes.get_errno()))
+            )
+
+        with self._lock:
+            self._watches[wd] = path
+
+    def close(self):
+        if self._thread.is_alive():
+            os.write(self._stopWrite, b"x")
+            self._thread.join(5)
+        os.close(self._fd)
+        os.close(self._stopRead)
+        os.close(self._stopWrite)
+
+    def _run(self):
+        while True:
+            try:
+                readable = select.select([self._fd, self._stopRead], [], [])[0]
+            except (select.error, OSError) as err:
+                if err.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            if self._stopRead in readable:
+                return
+
+            try:
+                data = os.read(self._fd, 65536)
+            except OSError as err:
+                if err.errno in (errno.EAGAIN, errno.EINTR):
+                    continue
+                raise
+
+            changed = self._parse(data)
+            if changed:
+                self._notify(changed)
+
+    def _parse(self, data):
+        """
+        Get the directories affected by a buffer of inotify_event structures.
+        """
+        changed = set()
+        offset = 0
+        while offset + self._HEADER.size <= len(data):
+            wd, mask, cookie, length = self._HEADER.unpack_from(data, offset)
+            offset += self._HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & self.IN_Q_OVERFLOW:
+                # Some notifications were lost, rescan everything.
+                with self._lock:
+                    changed.update(self._watches.values())
+                continue
+
+            lostMask = self.IN_IGNORED | self.IN_DELETE_SELF | self.IN_MOVE_SELF
+            with self._lock:
+                path = self._watches.get(wd)
+                if path is not None and mask & lostMask:
+                    # A moved directory would still be watched at its new
+                    # place, the watch is dropped so the path can be watched
+                    # again.
+                    del self._watches[wd]
+                    self._lost.add(path)
+            if path is None:
+                continue
+
+            if mask & lostMask:
+                if not mask & self.IN_IGNORED:
+                    self._libc.inotify_rm_watch(self._fd, wd)
+                self._logger.warning(
+                    "Plugin directory %s is no longer watched, it will be "
+                    "watched again when it reappears.",
+                    path,
+                )
+            elif name.endswith(b".py") and not name.startswith(b"."):
+                changed.add(path)
+        return changed
+
+
+class WatcherError(Exception):
+    """
+    Used when a watcher can't be set up.
+    """
+
+    pass
@@ -0,0 +1,278 @@
+"""
+Memo of the read requests made while an event is processed.
+
+Several plugins registered for the same events tend to make the same reads
+for each of them: the project of the event, the entity it's about, the users
+to notify. While the engine dispatches an event, identical reads made by any
+of its callbacks are answered once from Shotgun and then from this memo,
+which is dropped once every plugin is done with the event.
+"""
+
+import copy
+import json
+import threading
+
+try:
+    STRING_TYPES = (str, unicode)
+except NameError:
+    STRING_TYPES = (str,)
+
+
+class RequestMemo(object):
+    """
+    The replies of the read requests made for each event being dispatched.
+
+    The engine opens the scope of events before dispatching them and closes
+    it afterwards, see L{open} and L{close}. Scopes are counted, an event's
+    replies are dropped when its last scope is closed. Reads made for an
+    event outside of any scope are not memoized.
+
+    A write made for an event drops the replies of that event which may be
+    affected: the reads of the entity type written to, and the reads whose
+    deep fields or filters go through it, see L{getReadTypes}.
+    """
+
+    # Read methods whose replies are memoized, with the argument holding the
+    # entity type read. Writes don't affect the schema, its reads have none.
+    READ_METHODS = {
+        "find": 0,
+        "find_one": 0,
+        "summarize": 0,
+        "schema_read": None,
+        "schema_entity_read": None,
+        "schema_field_read": None,
+    }
+
+    # Arguments of the read methods holding field paths, by position and
+    # name.
+    PATH_ARGUMENTS = {
+        "find": ((1, "filters"), (2, "fields"), (3, "order")),
+        "find_one": ((1, "filters"), (2, "fields"), (3, "order")),
+        "summarize": ((1, "filters"), (2, "summary_fields"), (4, "grouping")),
+    }
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Drop every reply and recreate the lock.
+
+        Used after forking, the lock may have been held by another thread of
+        the parent process.
+        """
+        self._lock = threading.Lock()
+        self._scopes = {}
+
+    def open(self, events):
+        """
+        Open the scope of events, reads made for them are memoized until it's
+        closed.
+
+        @param events: The events about to be dispatched.
+        @type events: I{list} of Shotgun event dictionaries.
+        """
+        with self._lock:
+            for event in events:
+                scope = self._scopes.setdefault(event["id"], [0, {}, 0])
+                scope[0] += 1
+
+    def close(self, events):
+        """
+        Close the scope of events opened with L{open}.
+
+        @param events: The events which were dispatched.
+        @type events: I{list} of Shotgun event dictionaries.
+        """
+        with self._lock:
+            for event in events:
+                scope = self._scopes.get(event["id"])
+                if scope is None:
+                    continue
+                scope[0] -= 1
+                if scope[0] <= 0:
+                    del self._scopes[event["id"]]
+
+    def get(self, eventId, key, readTypes, fetch):
+        """
+        Get the reply of a read, from the memo when the same read was already
+        made for the event.
+
+        @param eventId: The id of the event the read is made for.
+        @type eventId: I{int}
+        @param key: Identifies the read, see L{getKey}.
+        @type key: I{tuple}
+        @param readTypes: The entity types the read depends on, see
+            L{getReadTypes}.
+        @type readTypes: I{frozenset} of I{str}
+        @param fetch: Called without arguments to get the reply from Shotgun.
+        @type fetch: A function object.
+
+        @return: A copy of the reply.
+        """
+        with self._lock:
+            scope = self._scopes.get(eventId)
+            if scope is not None:
+                if key in scope[1]:
+                    return copy.deepcopy(scope[1][key][1])
+                generation = scope[2]
+
+        reply = fetch()
+        if scope is not None:
+            with self._lock:
+                # A write made meanwhile may have changed the reply.
+                if scope[2] == generation:
+                    scope[1][key] = (readTypes, copy.deepcopy(reply))
+        return reply
+
+    def invalidate(self, eventId, entityType):
+        """
+        Drop the replies of an event which a write to an entity type may
+        affect.
+
+        @param eventId: The id of the event the write is made for.
+        @type eventId: I{int}
+        @param entityType: The entity type written to.
+        @type entityType: I{str}
+        """
+        with self._lock:
+            scope = self._scopes.get(eventId)
+            if scope is None:
+                return
+            scope[2] += 1
+            replies = scope[1]
+            for key, (readTypes, reply) in list(replies.items()):
+                if entityType in readTypes:
+                    del replies[key]
+
+    @classmethod
+    def getReadTypes(cls, method, args, kwargs):
+        """
+        Get the entity types a read depends on: the one read and the ones its
+        deep fields and filters go through, like Shot for entity.Shot.code.
+
+        @return: The entity types, none for reads of the schema.
+        @rtype: I{frozenset} of I{str}
+        """
+        index = cls.READ_METHODS[method]
+        if index is None:
+            return frozenset()
+
+        readTypes = set()
+        readTypes.add(args[index] if len(args) > index else kwargs.get("entity_type"))
+        for position, name in cls.PATH_ARGUMENTS.get(method, ()):
+            value = args[position] if len(args) > position else kwargs.get(name)
+            for path in _getPaths(value):
+                # The linked entity types alternate with the fields linking to
+                # them.
+                readTypes.update(path.split(".")[1:-1:2])
+        return frozenset(readTypes)
+
+    @staticmethod
+    def getKey(shotgun, method, args, kwargs):
+        """
+        @return: A key identifying a read: the script it's made as and the
+            call.
+        @rtype: I{tuple} of (I{str}, I{str})
+        """
+        return (
+            shotgun.config.script_name,
+            json.dumps([method, args, kwargs], sort_keys=True, default=repr),
+        )
+
+
+class MemoShotgun(object):
+    """
+    A Shotgun connection used to process an event, whose reads go through a
+    L{RequestMemo}.
+    """
+
+    # Writes with the argument holding the entity type written to.
+    WRITE_METHODS = {
+        "create": 0,
+        "update": 0,
+        "delete": 0,
+        "revive": 0,
+        "upload": 0,
+        "upload_thumbnail": 0,
+        "upload_filmstrip_thumbnail": 0,
+    }
+
+    def __init__(self, shotgun, memo, eventId):
+        """
+        @param shotgun: The connection to wrap.
+        @type shotgun: L{shotgun_api3.Shotgun}
+        @param memo: The memo to read from.
+        @type memo: L{RequestMemo}
+        @param eventId: The id of the event the connection is used for.
+        @type eventId: I{int}
+        """
+        self._shotgun = shotgun
+        self._memo = memo
+        self._eventId = eventId
+
+    def __getattr__(self, name):
+        method = getattr(self._shotgun, name)
+        if name in RequestMemo.READ_METHODS:
+            return self._wrapRead(name, method)
+        if name in self.WRITE_METHODS:
+            return self._wrapWrite(name, method)
+        return method
+
+    def batch(self, requests):
+        try:
+            return self._shotgun.batch(requests)
+        finally:
+            for request in requests:
+                self._memo.invalidate(self._eventId, request.get("entity_type"))
+
+    def _wrapRead(self, name, method):
+        def read(*args, **kwargs):
+            return self._memo.get(
+                self._eventId,
+                RequestMemo.getKey(self._shotgun, name, args, kwargs),
+                RequestMemo.getReadTypes(name, args, kwargs),
+                lambda: method(*args, **kwargs),
+            )
+
+        return read
+
+    def _wrapWrite(self, name, method):
+        def write(*args, **kwargs):
+            index = self.WRITE_METHODS[name]
+            entityType = args[index] if len(args) > index else kwargs.get(
+                "entity_type"
+            )
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._memo.invalidate(self._eventId, entityType)
+
+        return write
+
+
+def _getPaths(value):
+    """
+    Get the field paths in an argument of a read: a list of fields, a list of
+    filters or of dictionaries naming fields, or a complex filter.
+
+    @rtype: I{list} of I{str}
+    """
+    if isinstance(value, dict):
+        value = [value]
+    paths = []
+    for item in value or ():
+        if isinstance(item, STRING_TYPES):
+            paths.append(item)
+        elif isinstance(item, (list, tuple)):
+            # A [path, relation, values] filter.
+            if item and isinstance(item[0], STRING_TYPES):
+                paths.append(item[0])
+        elif isinstance(item, dict):
+            for key in ("path", "field", "field_name", "column"):
+                if isinstance(item.get(key), STRING_TYPES):
+                    paths.append(item[key])
+            for key in ("filters", "conditions"):
+                if key in item:
+                    paths.extend(_getPaths(item[key]))
+    return paths
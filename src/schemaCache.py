@@ -0,0 +1,160 @@
+"""
+Cache of the Shotgun schema read by callbacks.
+
+Plugins read the schema of an entity type for every event they process, to
+find the data type or valid values of a field. The schema hardly ever
+changes, so the replies of the schema methods are kept in memory, shared by
+every callback, and served again until they expire or an event says the
+schema changed.
+"""
+
+import copy
+import threading
+import time
+
+
+class SchemaCache(object):
+    """
+    Replies of schema_read, schema_entity_read and schema_field_read, keyed
+    by the method and its arguments.
+
+    Replies expire ttl seconds after they were read. Every reply is dropped
+    when an event about a field, a DisplayColumn entity, is fetched, see
+    L{invalidate}. The engine fetches those events, of L{EVENT_TYPES}, while
+    the cache is enabled.
+    """
+
+    EVENT_TYPES = [
+        "Shotgun_DisplayColumn_New",
+        "Shotgun_DisplayColumn_Change",
+        "Shotgun_DisplayColumn_Retirement",
+        "Shotgun_DisplayColumn_Revival",
+    ]
+
+    def __init__(self, ttl):
+        """
+        @param ttl: The number of seconds replies are kept for.
+        @type ttl: I{float}
+        """
+        self._ttl = ttl
+        self.reset()
+
+    def reset(self):
+        """
+        Drop every reply and recreate the lock.
+
+        Used after forking, the lock may have been held by another thread of
+        the parent process.
+        """
+        self._lock = threading.Lock()
+        self._replies = {}
+        self._generation = 0
+
+    def get(self, key, fetch):
+        """
+        Get a reply, from the cache unless it's missing or expired.
+
+        @param key: The method and arguments of the call.
+        @type key: I{tuple}
+        @param fetch: Called without arguments to get the reply from Shotgun.
+        @type fetch: A function object.
+
+        @return: A copy of the reply.
+        """
+        now = time.time()
+        with self._lock:
+            cached = self._replies.get(key)
+            if cached is not None and now - cached[1] < self._ttl:
+                return copy.deepcopy(cached[0])
+            generation = self._generation
+
+        reply = fetch()
+        with self._lock:
+            # The schema changed while it was read, the reply may be older.
+            if generation == self._generation:
+                self._replies[key] = (copy.deepcopy(reply), now)
+        return reply
+
+    def getCached(self, key):
+        """
+        @return: The cached reply for a key, or None if there is none which
+            hasn't expired. It must not be modified.
+        """
+        with self._lock:
+            cached = self._replies.get(key)
+            if cached is not None and time.time() - cached[1] < self._ttl:
+                return cached[0]
+        return None
+
+    def invalidate(self, events):
+        """
+        Drop every reply if any event is about a field.
+
+        @param events: The events fetched by the engine.
+        @type events: I{list} of Shotgun event dictionaries.
+        """
+        for event in events:
+            if event.get("event_type") in self.EVENT_TYPES:
+                self.clear()
+                return
+
+    def clear(self):
+        with self._lock:
+            self._replies = {}
+            self._generation += 1
+
+
+class CachedSchemaShotgun(object):
+    """
+    A Shotgun connection whose schema reads go through a L{SchemaCache}.
+
+    A field read, with schema_field_read, is served from the reply cached for
+    all the fields of the entity type if there's one.
+    """
+
+    def __init__(self, shotgun, cache):
+        """
+        @param shotgun: The connection to wrap.
+        @type shotgun: L{shotgun_api3.Shotgun}
+        @param cache: The cache to read from.
+        @type cache: L{SchemaCache}
+        """
+        self._shotgun = shotgun
+        self._cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self._shotgun, name)
+
+    def schema_read(self, project_entity=None):
+        return self._cache.get(
+            ("schema_read", _getProjectId(project_entity)),
+            lambda: self._shotgun.schema_read(project_entity),
+        )
+
+    def schema_entity_read(self, project_entity=None):
+        return self._cache.get(
+            ("schema_entity_read", _getProjectId(project_entity)),
+            lambda: self._shotgun.schema_entity_read(project_entity),
+        )
+
+    def schema_field_read(self, entity_type, field_name=None, project_entity=None):
+        projectId = _getProjectId(project_entity)
+        if field_name is not None:
+            fields = self._cache.getCached(
+                ("schema_field_read", entity_type, None, projectId)
+            )
+            if fields is not None and field_name in fields:
+                return copy.deepcopy({field_name: fields[field_name]})
+
+        return self._cache.get(
+            ("schema_field_read", entity_type, field_name, projectId),
+            lambda: self._shotgun.schema_field_read(
+                entity_type, field_name, project_entity
+            ),
+        )
+
+
+def _getProjectId(project):
+    if project is None:
+        return None
+    return project.get("id")
@@ -30,26 +30,45 @@ __version_info__ = (0, 9)
 
 from ConfigParser import SafeConfigParser
 import StringIO
+import argparse
+import bisect
+import collections
+import contextlib
 import datetime
 import imp
 import logging
 import logging.handlers
+import multiprocessing
 import os
 import pprint
+import random
+import signal
 import socket
 import sys
+import threading
 import time
 import traceback
+import connectionPool
 import daemonizer
+import eventBacklog
+import entityCache
+import eventCache
+import eventJournal
+import fileWatcher
+import requestMemo
+import schemaCache
+import stateStore
+import writeBatcher
+from multiprocessing.pool import ThreadPool
 import shotgun_api3 as sg
 from shotgun_api3.lib.sgtimezone import SgTimezone
 
 from distutils.version import StrictVersion
 
 try:
-    import cPickle as pickle
+    import Queue as queue
 except ImportError:
-    import pickle
+    import queue
 
 if sys.platform == "win32":
     import win32serviceutil
@@ -63,6 +82,11 @@ PYTHON_25 = StrictVersion("2.5")
 PYTHON_26 = StrictVersion("2.6")
 PYTHON_27 = StrictVersion("2.7")
 
+DISPATCH_MODES = ("serial", "threaded", "process")
+
+# Time in minutes after which we consider a pending event won't happen.
+BACKLOG_TIMEOUT = 5
+
 if CURRENT_PYTHON_VERSION > PYTHON_25:
     EMAIL_FORMAT_STRING = """Time: %(asctime)s
 Logger: %(name)s
@@ -111,6 +135,24 @@ def _removeHandlersFromLogger(logger, handlerTypes=None):
             logger.removeHandler(handler)
 
 
+def _resetLoggingLocks():
+    """
+    Recreate the locks of the logging module and its handlers.
+
+    Used after forking, a lock held by another thread of the parent process
+    at the time of the fork would otherwise never be released in the child.
+    """
+    logging._lock = threading.RLock()
+    loggers = [logging.getLogger()] + [
+        logger
+        for logger in logging.Logger.manager.loggerDict.values()
+        if isinstance(logger, logging.Logger)
+    ]
+    for logger in loggers:
+        for handler in logger.handlers:
+            handler.createLock()
+
+
 def _addMailHandlerToLogger(
     logger,
     smtpServer,
@@ -177,15 +219,64 @@ class Config(SafeConfigParser):
         except SafeConfigParser.NoOptionError:
             return None
 
+    def getConnectionPoolSize(self):
+        if self.has_option("shotgun", "connection_pool_size"):
+            return max(0, self.getint("shotgun", "connection_pool_size"))
+        return 16
+
+    def getConnectionCheckInterval(self):
+        if self.has_option("shotgun", "connection_check_interval"):
+            return self.getfloat("shotgun", "connection_check_interval")
+        return 60.0
+
+    def getConnectionLimit(self):
+        if self.has_option("shotgun", "connection_limit"):
+            return max(0, self.getint("shotgun", "connection_limit"))
+        return 0
+
+    def getConnectionWait(self):
+        if self.has_option("shotgun", "connection_wait"):
+            return max(0.0, self.getfloat("shotgun", "connection_wait"))
+        return 60.0
+
     def getEventIdFile(self):
         return self.get("daemon", "eventIdFile")
 
+    def getStateBackend(self):
+        if not self.has_option("daemon", "state_backend"):
+            return "pickle"
+
+        backend = self.get("daemon", "state_backend").strip()
+        if backend not in stateStore.STATE_BACKENDS:
+            raise ConfigError(
+                "Invalid state_backend %s, should be one of: %s."
+                % (backend, ", ".join(stateStore.STATE_BACKENDS))
+            )
+        return backend
+
     def getEnginePIDFile(self):
         return self.get("daemon", "pidFile")
 
     def getPluginPaths(self):
         return [s.strip() for s in self.get("plugins", "paths").split(",")]
 
+    def getPluginWatcher(self):
+        if not self.has_option("plugins", "watcher"):
+            return "auto"
+
+        watcher = self.get("plugins", "watcher").strip()
+        if watcher not in fileWatcher.WATCHERS:
+            raise ConfigError(
+                "Invalid watcher %s, should be one of: %s."
+                % (watcher, ", ".join(fileWatcher.WATCHERS))
+            )
+        return watcher
+
+    def getPluginRescanInterval(self):
+        if self.has_option("plugins", "rescan_interval"):
+            return max(0.0, self.getfloat("plugins", "rescan_interval"))
+        return 0.0
+
     def getSMTPServer(self):
         return self.get("emails", "server")
 
@@ -229,6 +320,149 @@ class Config(SafeConfigParser):
             return self.getint("daemon", "max_event_batch_size")
         return 500
 
+    def getMinEventBatchSize(self):
+        if self.has_option("daemon", "min_event_batch_size"):
+            return min(
+                self.getint("daemon", "min_event_batch_size"),
+                self.getMaxEventBatchSize(),
+            )
+        return self.getMaxEventBatchSize()
+
+    def getTargetBatchTime(self):
+        if self.has_option("daemon", "target_batch_time"):
+            return self.getfloat("daemon", "target_batch_time")
+        return 10.0
+
+    def getMinFetchInterval(self):
+        if self.has_option("daemon", "min_fetch_interval"):
+            return self.getfloat("daemon", "min_fetch_interval")
+        return self.getfloat("daemon", "fetch_interval")
+
+    def getFetchBackoff(self):
+        if self.has_option("daemon", "fetch_backoff"):
+            return max(1.0, self.getfloat("daemon", "fetch_backoff"))
+        return 2.0
+
+    def getCheckpointEvents(self):
+        if self.has_option("daemon", "checkpoint_events"):
+            return max(1, self.getint("daemon", "checkpoint_events"))
+        return 100
+
+    def getCheckpointInterval(self):
+        if self.has_option("daemon", "checkpoint_interval"):
+            return self.getint("daemon", "checkpoint_interval")
+        return 1000
+
+    def getFilterEventTypes(self):
+        if self.has_option("daemon", "filter_event_types"):
+            return self.getboolean("daemon", "filter_event_types")
+        return False
+
+    def getEventCacheSize(self):
+        if self.has_option("daemon", "event_cache_size"):
+            return self.getint("daemon", "event_cache_size")
+        return 0
+
+    def getEventCacheAge(self):
+        if self.has_option("daemon", "event_cache_age"):
+            return self.getfloat("daemon", "event_cache_age")
+        return 300.0
+
+    def getEntityCacheSize(self):
+        if self.has_option("daemon", "entity_cache_size"):
+            return self.getint("daemon", "entity_cache_size")
+        return 0
+
+    def getEntityCacheUncachedFields(self):
+        if self.has_option("daemon", "entity_cache_uncached_fields"):
+            return [
+                s.strip()
+                for s in self.get("daemon", "entity_cache_uncached_fields").split(",")
+                if s.strip()
+            ]
+        return []
+
+    def getSchemaCacheTTL(self):
+        if self.has_option("daemon", "schema_cache_ttl"):
+            return self.getfloat("daemon", "schema_cache_ttl")
+        return 0.0
+
+    def getMemoizeRequests(self):
+        if self.has_option("daemon", "memoize_requests"):
+            return self.getboolean("daemon", "memoize_requests")
+        return False
+
+    def getWriteBatchSize(self):
+        if self.has_option("daemon", "write_batch_size"):
+            return self.getint("daemon", "write_batch_size")
+        return 50
+
+    def getWriteBatchInterval(self):
+        if self.has_option("daemon", "write_batch_interval"):
+            return self.getfloat("daemon", "write_batch_interval")
+        return 5.0
+
+    def getJournalPath(self):
+        if self.has_option("daemon", "journal_path"):
+            path = self.get("daemon", "journal_path").strip()
+            if path:
+                return path
+        return None
+
+    def getJournalSegmentSize(self):
+        if self.has_option("daemon", "journal_segment_size"):
+            return max(1, self.getint("daemon", "journal_segment_size"))
+        return 64
+
+    def getJournalMaxSize(self):
+        if self.has_option("daemon", "journal_max_size"):
+            return self.getint("daemon", "journal_max_size")
+        return 1024
+
+    def getJournalMaxAge(self):
+        if self.has_option("daemon", "journal_max_age"):
+            return self.getfloat("daemon", "journal_max_age")
+        return 168.0
+
+    def getPrefetchPages(self):
+        if self.has_option("daemon", "prefetch_pages"):
+            return self.getint("daemon", "prefetch_pages")
+        return 0
+
+    def getDispatchMode(self):
+        if not self.has_option("daemon", "dispatch_mode"):
+            return "serial"
+
+        mode = self.get("daemon", "dispatch_mode").strip()
+        if mode not in DISPATCH_MODES:
+            raise ConfigError(
+                "Invalid dispatch_mode %s, should be one of: %s."
+                % (mode, ", ".join(DISPATCH_MODES))
+            )
+        if mode == "process" and sys.platform == "win32":
+            raise ConfigError("The process dispatch_mode is not supported on Windows.")
+        return mode
+
+    def getDispatchQueuePages(self):
+        if self.has_option("daemon", "dispatch_queue_pages"):
+            return max(1, self.getint("daemon", "dispatch_queue_pages"))
+        return 4
+
+    def getProcessTimeout(self):
+        if self.has_option("daemon", "process_timeout"):
+            return self.getint("daemon", "process_timeout")
+        return 600
+
+    def getProcessMaxEvents(self):
+        if self.has_option("daemon", "process_max_events"):
+            return self.getint("daemon", "process_max_events")
+        return 0
+
+    def getEntityWorkers(self):
+        if self.has_option("daemon", "entity_workers"):
+            return max(1, self.getint("daemon", "entity_workers"))
+        return 1
+
     def getLogFile(self, filename=None):
         if filename is None:
             if self.has_option("daemon", "logFile"):
@@ -268,11 +502,29 @@ class Engine(object):
     The engine holds the main loop of event processing.
     """
 
+    # Fields of the events handed to the plugins.
+    EVENT_FIELDS = [
+        "id",
+        "event_type",
+        "attribute_name",
+        "meta",
+        "entity",
+        "user",
+        "project",
+        "session_uuid",
+        "created_at",
+    ]
+
+    # Number of backlog ranges looked up with a single query.
+    MAX_BACKLOG_RANGES = 50
+
     def __init__(self, configPath):
         """
         """
         self._continue = True
+        self._wakeup = threading.Event()
         self._eventIdData = {}
+        self._maxPluginStates = {}
 
         # Read/parse the config
         self.config = Config(configPath)
@@ -289,9 +541,95 @@ class Engine(object):
         )
         self._max_conn_retries = self.config.getint("daemon", "max_conn_retries")
         self._conn_retry_sleep = self.config.getint("daemon", "conn_retry_sleep")
-        self._fetch_interval = self.config.getint("daemon", "fetch_interval")
+        self._fetch_interval = self.config.getfloat("daemon", "fetch_interval")
+        self._min_fetch_interval = self.config.getMinFetchInterval()
+        self._fetch_backoff = self.config.getFetchBackoff()
+        self._poll_interval = self._min_fetch_interval
         self._use_session_uuid = self.config.getboolean("shotgun", "use_session_uuid")
 
+        # With the threaded and process dispatch modes every plugin processes
+        # events on its own L{PluginWorker}, otherwise they all run on the main
+        # thread. In process mode the worker forwards the events to the
+        # plugin's L{PluginProcess}.
+        self._dispatch_mode = self.config.getDispatchMode()
+        self._dispatch_queue_pages = self.config.getDispatchQueuePages()
+        self._pluginWorkers = {}
+        self._entity_workers = self.config.getEntityWorkers()
+
+        self._batchSizer = EventBatchSizer(self)
+        self._lastPageFull = False
+
+        # The callbacks of the loaded plugins by the events they process,
+        # rebuilt when plugins are loaded, see L{_updateRoutes}.
+        self._router = EventRouter([])
+
+        # Event types the callbacks are interested in, used to filter the
+        # events fetched from Shotgun, see L{_updateEventTypeFilter}. Ids of
+        # recent events which were filtered out are kept so plugins don't
+        # take them for missing events.
+        self._filter_event_types = self.config.getFilterEventTypes()
+        self._eventTypeFilter = None
+        self._filteredEventIds = []
+        self._filteredEventIdsLock = threading.Lock()
+
+        # The state is saved once checkpoint_events events were processed or
+        # checkpoint_interval milliseconds went by, see L{_checkpoint}.
+        self._checkpoint_events = self.config.getCheckpointEvents()
+        self._checkpoint_interval = self.config.getCheckpointInterval() / 1000.0
+        self._uncheckpointedEvents = 0
+        self._lastCheckpoint = time.time()
+
+        # Recently fetched events, served again to plugins lagging behind the
+        # others, see L{eventCache.EventCache}.
+        eventCacheSize = self.config.getEventCacheSize()
+        if eventCacheSize > 0:
+            self._eventCache = eventCache.EventCache(
+                eventCacheSize, self.config.getEventCacheAge()
+            )
+        else:
+            self._eventCache = None
+
+        # Entity fields read by the callbacks, invalidated by the fetched
+        # events, see L{entityCache.EntityCache}.
+        entityCacheSize = self.config.getEntityCacheSize()
+        if entityCacheSize > 0:
+            self._entityCache = entityCache.EntityCache(
+                entityCacheSize, self.config.getEntityCacheUncachedFields()
+            )
+        else:
+            self._entityCache = None
+
+        # Schema read by the callbacks, see L{schemaCache.SchemaCache}.
+        schemaCacheTTL = self.config.getSchemaCacheTTL()
+        if schemaCacheTTL > 0:
+            self._schemaCache = schemaCache.SchemaCache(schemaCacheTTL)
+        else:
+            self._schemaCache = None
+
+        # Replies of the reads made for the events being dispatched, shared
+        # by their callbacks, see L{requestMemo.RequestMemo}.
+        if self.config.getMemoizeRequests():
+            self._requestMemo = requestMemo.RequestMemo()
+        else:
+            self._requestMemo = None
+
+        # Writes queued by the callbacks registered with batchWrites, see
+        # L{writeBatcher.WriteBatcher}.
+        writeBatchSize = self.config.getWriteBatchSize()
+        if writeBatchSize > 1:
+            self._writeBatcher = writeBatcher.WriteBatcher(
+                self, writeBatchSize, self.config.getWriteBatchInterval()
+            )
+        else:
+            self._writeBatcher = None
+
+        # Optional background fetch stage, see L{EventPrefetcher}.
+        prefetchPages = self.config.getPrefetchPages()
+        if prefetchPages > 0:
+            self._prefetcher = EventPrefetcher(self, prefetchPages)
+        else:
+            self._prefetcher = None
+
         # Setup the loggers for the main engine
         if self.config.getLogMode() == 0:
             # Set the root logger for file output.
@@ -321,8 +659,166 @@ class Engine(object):
         else:
             self.timing_logger = None
 
+        eventIdFile = self.config.getEventIdFile()
+        if eventIdFile:
+            self._stateStore = stateStore.createStateStore(
+                self.config.getStateBackend(), eventIdFile, self.log
+            )
+        else:
+            self._stateStore = None
+
+        # Optional local copy of the fetched events, see
+        # L{eventJournal.EventJournal}.
+        journalPath = self.config.getJournalPath()
+        if journalPath:
+            try:
+                self._eventJournal = eventJournal.EventJournal(
+                    journalPath,
+                    self.config.getJournalSegmentSize() * 1024 * 1024,
+                    self.config.getJournalMaxSize() * 1024 * 1024,
+                    self.config.getJournalMaxAge() * 3600,
+                    self.log,
+                )
+            except eventJournal.JournalError as err:
+                raise EventDaemonError(str(err))
+        else:
+            self._eventJournal = None
+
+        # Connections of the callbacks and plugin registration code, shared
+        # by those using the same script, see L{connectionPool.ConnectionPool}.
+        self._connectionPool = connectionPool.ConnectionPool(
+            self.config.getConnectionPoolSize(),
+            self.config.getConnectionCheckInterval(),
+            self.log,
+            self.config.getConnectionLimit(),
+            self.config.getConnectionWait(),
+        )
+
+        # Plugin collections are only reloaded when their directory changed.
+        # Changes wake the main loop up so they're picked up right away.
+        try:
+            self._pluginWatcher = fileWatcher.createWatcher(
+                self.config.getPluginWatcher(),
+                [collection.path for collection in self._pluginCollections],
+                self.config.getPluginRescanInterval(),
+                self.log,
+                self._wakeup.set,
+            )
+        except fileWatcher.WatcherError as err:
+            raise EventDaemonError(str(err))
+
         super(Engine, self).__init__()
 
+    def acquireShotgun(self, scriptName, scriptKey, server=None):
+        """
+        Lease a connection to the Shotgun server from the connection pool.
+
+        @param scriptName: The name of the script to connect as.
+        @type scriptName: I{str}
+        @param scriptKey: The key of the script.
+        @type scriptKey: I{str}
+        @param server: The url of the Shotgun server, the one of the config
+            by default.
+        @type server: I{str}
+
+        @return: A connection for the exclusive use of the caller until it's
+            given back with L{releaseShotgun}.
+        @rtype: L{sg.Shotgun}
+        """
+        return self._connectionPool.acquire(
+            server or self.config.getShotgunURL(),
+            scriptName,
+            scriptKey,
+            self.config.getEngineProxyServer(),
+        )
+
+    def _wrapShotgun(self, shotgun, event=None, callback=None):
+        """
+        Wrap a connection leased by a plugin so its reads go through the
+        entity and schema caches, and the request memo of the event it's used
+        for, when they're enabled. The writes of callbacks registered with
+        batchWrites are queued in the write batcher.
+
+        @param shotgun: The connection.
+        @type shotgun: L{sg.Shotgun}
+        @param event: The event the connection is used to process, if any.
+        @type event: I{dict}
+        @param callback: The callback the connection is used by, if any.
+        @type callback: L{Callback}
+
+        @return: The connection or its wrapper.
+        """
+        if (
+            self._writeBatcher is not None
+            and callback is not None
+            and callback._batchWrites
+        ):
+            shotgun = writeBatcher.BatchingShotgun(
+                shotgun, self._writeBatcher, callback, event
+            )
+        if self._schemaCache is not None:
+            shotgun = schemaCache.CachedSchemaShotgun(shotgun, self._schemaCache)
+        if self._entityCache is not None:
+            shotgun = entityCache.CachedShotgun(shotgun, self._entityCache)
+        if self._requestMemo is not None and event is not None:
+            shotgun = requestMemo.MemoShotgun(shotgun, self._requestMemo, event["id"])
+        return shotgun
+
+    @contextlib.contextmanager
+    def _requestScope(self, events):
+        """
+        Memoize the reads made for events until the block is done with them,
+        see L{requestMemo.RequestMemo}.
+
+        @param events: The events about to be dispatched.
+        @type events: I{list} of Shotgun event dictionaries.
+        """
+        if self._requestMemo is None:
+            yield
+            return
+
+        self._requestMemo.open(events)
+        try:
+            yield
+        finally:
+            self._requestMemo.close(events)
+
+    def _flushWrites(self):
+        """
+        Send the writes queued by callbacks and wait for them to be
+        acknowledged, see L{writeBatcher.WriteBatcher}.
+
+        @return: The number of writes which failed so far, see
+            L{writeBatcher.WriteBatcher.flush}.
+        @rtype: I{int}
+        """
+        if self._writeBatcher is None:
+            return 0
+        return self._writeBatcher.flush()
+
+    def _flushDueWrites(self):
+        """
+        Send the writes queued by callbacks if there are enough of them or
+        they're old enough, see L{writeBatcher.WriteBatcher.flushIfDue}.
+        """
+        if self._writeBatcher is not None:
+            self._writeBatcher.flushIfDue()
+
+    def _hasQueuedWrites(self):
+        return self._writeBatcher is not None and len(self._writeBatcher) > 0
+
+    def releaseShotgun(self, shotgun, discard=False):
+        """
+        Give back a connection leased with L{acquireShotgun}.
+
+        @param shotgun: The connection.
+        @type shotgun: L{sg.Shotgun}
+        @param discard: Close the connection rather than keeping it in the
+            pool, e.g. when it was in use when an error was raised.
+        @type discard: I{bool}
+        """
+        self._connectionPool.release(shotgun, discard)
+
     def setEmailsOnLogger(self, logger, emails):
         # Configure the logger for email output
         _removeHandlersFromLogger(logger, logging.handlers.SMTPHandler)
@@ -374,10 +870,16 @@ class Engine(object):
         self.log.info("Using Shotgun version %s" % sg.__version__)
 
         try:
+            self._pluginWatcher.getChanges()
             for collection in self._pluginCollections:
                 collection.load()
 
             self._loadEventIdData()
+            self._updateRoutes()
+            self._updateEventTypeFilter()
+
+            if self._prefetcher:
+                self._prefetcher.start()
 
             self._mainLoop()
         except KeyboardInterrupt:
@@ -394,74 +896,49 @@ class Engine(object):
         deleted from disk, no id will be recoverable. In this case, we will try
         contacting Shotgun to get the latest event's id and we'll start
         processing from there.
-        """
-        eventIdFile = self.config.getEventIdFile()
 
-        if eventIdFile and os.path.exists(eventIdFile):
+        This is only done when the engine starts, the state in memory is
+        authoritative afterwards.
+        """
+        state = None
+        if self._stateStore:
             try:
-                fh = open(eventIdFile)
-                try:
-                    self._eventIdData = pickle.load(fh)
+                state = self._stateStore.load()
+            except stateStore.StateStoreError as err:
+                raise EventDaemonError(str(err))
+
+        if isinstance(state, dict):
+            self._eventIdData = state
+
+            # Index the latest state of each plugin name in the id file. It
+            # is used as a fallback for plugins of collections which have no
+            # state, in case the plugins directory has been moved.
+            self._maxPluginStates = {}
+            for colState in self._eventIdData.values():
+                for pluginName, pluginState in colState.items():
+                    self._indexPluginState(
+                        self._maxPluginStates, pluginName, pluginState
+                    )
+
+            # Provide event id info to the plugin collections. Once
+            # they've figured out what to do with it, ask them for their
+            # last processed id.
+            noStatePlugins = []
+            for collection in self._pluginCollections:
+                state = self._eventIdData.get(collection.path)
+                if state:
+                    collection.setState(state)
+                else:
+                    noStatePlugins.extend(collection)
+
+            self._setFallbackStates(noStatePlugins)
+
+        elif state is not None:
+            # The state store got an old-style id file containing a single
+            # int which is the last id properly processed.
+            for collection in self._pluginCollections:
+                collection.setState(state)
 
-                    # Provide event id info to the plugin collections. Once
-                    # they've figured out what to do with it, ask them for their
-                    # last processed id.
-                    noStateCollections = []
-                    for collection in self._pluginCollections:
-                        state = self._eventIdData.get(collection.path)
-                        if state:
-                            collection.setState(state)
-                        else:
-                            noStateCollections.append(collection)
-
-                    # If we don't have a state it means there's no match
-                    # in the id file. First we'll search to see the latest id a
-                    # matching plugin name has elsewhere in the id file. We do
-                    # this as a fallback in case the plugins directory has been
-                    # moved. If there's no match, use the latest event id
-                    # in Shotgun.
-                    if noStateCollections:
-                        maxPluginStates = {}
-                        for collection in self._eventIdData.values():
-                            for pluginName, pluginState in collection.items():
-                                if pluginName in maxPluginStates.keys():
-                                    if pluginState[0] > maxPluginStates[pluginName][0]:
-                                        maxPluginStates[pluginName] = pluginState
-                                else:
-                                    maxPluginStates[pluginName] = pluginState
-
-                        lastEventId = self._getLastEventIdFromDatabase()
-                        for collection in noStateCollections:
-                            state = collection.getState()
-                            for pluginName in state.keys():
-                                if pluginName in maxPluginStates.keys():
-                                    state[pluginName] = maxPluginStates[pluginName]
-                                else:
-                                    state[pluginName] = lastEventId
-                            collection.setState(state)
-
-                except pickle.UnpicklingError:
-                    fh.close()
-
-                    # Backwards compatibility:
-                    # Reopen the file to try to read an old-style int
-                    fh = open(eventIdFile)
-                    line = fh.readline().strip()
-                    if line.isdigit():
-                        # The _loadEventIdData got an old-style id file containing a single
-                        # int which is the last id properly processed.
-                        lastEventId = int(line)
-                        self.log.debug(
-                            "Read last event id (%d) from file.", lastEventId
-                        )
-                        for collection in self._pluginCollections:
-                            collection.setState(lastEventId)
-                fh.close()
-            except OSError as err:
-                raise EventDaemonError(
-                    "Could not load event id from file.\n\n%s"
-                    % traceback.format_exc(err)
-                )
         else:
             # No id file?
             # Get the event data from the database.
@@ -472,6 +949,53 @@ class Engine(object):
 
             self._saveEventIdData()
 
+    def _setFallbackStates(self, plugins):
+        """
+        Give a state to plugins of collections which have no state.
+
+        The latest state of a plugin with the same name in another collection
+        is used. If there's no match, use the latest event id in Shotgun.
+
+        @param plugins: The plugins without state.
+        @type plugins: I{list} of L{Plugin}
+        """
+        if not plugins:
+            return
+
+        # The index is only built from the id file, look for more recent
+        # states of the same names in the loaded collections, once for all the
+        # plugins.
+        pluginNames = set(plugin.getName() for plugin in plugins)
+        states = {}
+        for pluginName in pluginNames:
+            if pluginName in self._maxPluginStates:
+                states[pluginName] = self._maxPluginStates[pluginName]
+        for colState in self._eventIdData.values():
+            for pluginName in pluginNames.intersection(colState):
+                self._indexPluginState(states, pluginName, colState[pluginName])
+
+        lastEventId = None
+        for plugin in plugins:
+            pluginName = plugin.getName()
+            if pluginName in states:
+                state = states[pluginName]
+            else:
+                if lastEventId is None:
+                    lastEventId = self._getLastEventIdFromDatabase()
+                state = lastEventId
+            if state:
+                plugin.setState(state)
+
+    def _indexPluginState(self, index, pluginName, pluginState):
+        """
+        Keep the state with the latest event id for a plugin name.
+        """
+        if not isinstance(pluginState, tuple) or pluginState[0] is None:
+            return
+        current = index.get(pluginName)
+        if current is None or pluginState[0] > current[0]:
+            index[pluginName] = pluginState
+
     def _getLastEventIdFromDatabase(self):
 
         conn_attempts = 0
@@ -503,12 +1027,15 @@ class Engine(object):
         - Load plugins from disk - see L{load} method.
         - Get new events from Shotgun
         - Loop through events
+        - Route each event to the callbacks which can process it, see
+          L{EventRouter}
         - Loop through each plugin
-        - Loop through each callback
-        - Send the callback an event
-        - Once all callbacks are done in all plugins, save the eventId
+        - Send the plugin's callbacks the event
+        - Once all callbacks are done in all plugins, save the eventId every
+          so often, see L{_checkpoint}.
         - Go to the next event
-        - Once all events are processed, wait for the defined fetch interval time and start over.
+        - Once all events are processed, wait for the poll interval and start
+          over, see L{_getPollInterval}.
 
         Caveats:
         - If a plugin is deemed "inactive" (an error occured during
@@ -521,27 +1048,313 @@ class Engine(object):
         while self._continue:
             # Process events
             events = self._getNewEvents()
-            for event in events:
-                for collection in self._pluginCollections:
-                    collection.process(event)
-                self._saveEventIdData()
+            dispatchStart = time.time()
+            if self._dispatch_mode in ("threaded", "process"):
+                self._dispatchToWorkers(events)
+            elif self._entity_workers > 1:
+                with self._requestScope(events):
+                    for collection in self._pluginCollections:
+                        collection.processEvents(events)
+                self._checkpoint(len(events))
+            else:
+                for event in events:
+                    routes = self._router.route(event)
+                    with self._requestScope([event]):
+                        for collection in self._pluginCollections:
+                            collection.process(event, routes)
+                    self._checkpoint(1)
+            self._flushWrites()
+            self._batchSizer.recordDispatch(len(events), time.time() - dispatchStart)
 
             # if we're lagging behind Shotgun, we received a full batch of events
             # skip the sleep() call in this case
-            if len(events) < self.config.getMaxEventBatchSize():
-                time.sleep(self._fetch_interval)
+            if not self._lastPageFull:
+                # Don't keep processed events unsaved while idle.
+                self._uncheckpointedEvents += self._takeWorkerProgress()
+                if self._uncheckpointedEvents:
+                    self._checkpoint(force=True)
+                self._idle(self._getPollInterval(events))
+            else:
+                self._poll_interval = self._min_fetch_interval
 
-            # Reload plugins
+            # Reload plugins. The in-memory state is authoritative, only the
+            # plugins which are new since the last pass need a state.
+            changedPaths = self._pluginWatcher.getChanges()
             for collection in self._pluginCollections:
-                collection.load()
-
-            # Make sure that newly loaded events have proper state.
-            self._loadEventIdData()
+                if collection.path in changedPaths:
+                    hasState = bool(collection.getState())
+                    newPlugins = collection.load()
+                    if newPlugins and not hasState:
+                        self._setFallbackStates(newPlugins)
+            if changedPaths:
+                self._updateRoutes()
+                self._updateEventTypeFilter()
+
+        if self._prefetcher:
+            self._prefetcher.stop()
+
+        for worker in self._pluginWorkers.values():
+            worker.stop()
+        for worker in self._pluginWorkers.values():
+            worker.join()
+
+        for collection in self._pluginCollections:
+            collection.unload()
+
+        self._checkpoint(force=True)
+        if self._stateStore:
+            self._stateStore.close()
+        if self._eventJournal is not None:
+            self._eventJournal.close()
+        self._connectionPool.clear()
+        self._pluginWatcher.close()
 
         self.log.debug("Shuting down event processing loop.")
 
+    def _dispatchToWorkers(self, events):
+        """
+        Queue a page of events for every plugin's worker.
+
+        Each plugin sees the events in order and advances its own cursor. A
+        worker can have dispatch_queue_pages pages queued, so a slow plugin
+        doesn't hold back the other ones until its queue is full. The engine
+        then waits for room in the queue, saving the state meanwhile.
+
+        @param events: The events to process.
+        @type events: I{list} of Shotgun event dictionaries.
+        """
+        if not events:
+            return
+
+        plugins = {}
+        for collection in self._pluginCollections:
+            for plugin in collection:
+                plugins[plugin.getPath()] = plugin
+
+        # Retire the workers of plugins which are gone from disk.
+        for path in list(self._pluginWorkers.keys()):
+            worker = self._pluginWorkers[path]
+            if plugins.get(path) is not worker.plugin:
+                worker.stop()
+                del self._pluginWorkers[path]
+
+        # The reads made for the events are shared by the workers until the
+        # last one is done with them.
+        with self._requestScope(events):
+            for path, plugin in plugins.items():
+                if path not in self._pluginWorkers:
+                    self._pluginWorkers[path] = PluginWorker(
+                        plugin, self._dispatch_queue_pages
+                    )
+                worker = self._pluginWorkers[path]
+                while not worker.submit(events, min(1, self._checkpoint_interval or 1)):
+                    self._checkpoint(self._takeWorkerProgress())
+                    if not self._continue:
+                        return
+
+        self._checkpoint(self._takeWorkerProgress())
+
+    def _takeWorkerProgress(self):
+        """
+        @return: The largest number of events a plugin worker processed since
+            the last call.
+        @rtype: I{int}
+        """
+        progress = 0
+        for worker in self._pluginWorkers.values():
+            progress = max(progress, worker.takeProcessed())
+        return progress
+
+    def _getWorkersNextEventId(self, nextEventId):
+        """
+        Get the id to fetch events from when plugins run on workers: the one
+        following the events already queued for the workers, unless a plugin
+        needs older ones.
+
+        @param nextEventId: The lowest id following the plugins' cursors.
+        @type nextEventId: I{int}
+
+        @rtype: I{int}
+        """
+        if not self._pluginWorkers:
+            return nextEventId
+
+        fetchId = None
+        for collection in self._pluginCollections:
+            for plugin in collection:
+                if not plugin.isActive():
+                    continue
+                newId = plugin.getNextUnprocessedEventId()
+                worker = self._pluginWorkers.get(plugin.getPath())
+                if worker is not None and worker.plugin is plugin:
+                    workerId = worker.getNextEventId()
+                    if workerId is not None and (newId is None or workerId > newId):
+                        newId = workerId
+                if newId is not None and (fetchId is None or newId < fetchId):
+                    fetchId = newId
+        return fetchId if fetchId is not None else nextEventId
+
     def stop(self):
         self._continue = False
+        self._wakeup.set()
+        if self._prefetcher:
+            self._prefetcher.stop()
+
+    def _getPollInterval(self, events):
+        """
+        Get the time to wait before polling Shotgun for new events again.
+
+        While events keep coming in we poll again after min_fetch_interval.
+        Every poll which comes back empty multiplies the interval by
+        fetch_backoff, up to fetch_interval, so an idle site isn't polled
+        needlessly. A random jitter of up to 10% keeps the polls of several
+        daemons from lining up.
+
+        @param events: The events returned by the last poll.
+        @type events: I{list} of Shotgun event dictionaries.
+
+        @return: The number of seconds to wait.
+        @rtype: I{float}
+        """
+        if events:
+            self._poll_interval = self._min_fetch_interval
+            return self._poll_interval
+
+        interval = self._poll_interval
+        self._poll_interval = min(
+            self._poll_interval * self._fetch_backoff, self._fetch_interval
+        )
+        interval = min(interval * random.uniform(0.9, 1.1), self._fetch_interval)
+        self.log.debug("No new events, polling again in %.2f seconds.", interval)
+        return interval
+
+    def getFilteredEventIds(self, firstId, lastId):
+        """
+        Get the ids of the events known to exist but to have been filtered out
+        of the events fetched from Shotgun.
+
+        Plugins add the gaps in the ids of the events they process to their
+        backlog unless the events are old enough for the missing ids to never
+        show up, see L{Plugin._updateLastEventId}. With event types filtered
+        out of the query, the gaps also hold events which exist but were not
+        fetched. Those show up when the backlogs are fetched, see
+        L{_fetchBacklogEvents}, and are dropped from the backlogs.
+
+        @param firstId: The first id of the range to look in.
+        @type firstId: I{int}
+        @param lastId: The last id of the range to look in, included.
+        @type lastId: I{int}
+
+        @return: The sorted ids.
+        @rtype: I{list} of I{int}
+        """
+        # The list is replaced rather than modified, no lock needed to read it.
+        filteredIds = self._filteredEventIds
+        start = bisect.bisect_left(filteredIds, firstId)
+        end = bisect.bisect_right(filteredIds, lastId)
+        return filteredIds[start:end]
+
+    def _updateRoutes(self):
+        """
+        Index the callbacks of the loaded plugins by the events they process.
+        """
+        plugins = []
+        for collection in self._pluginCollections:
+            plugins.extend(collection)
+        self._router = EventRouter(plugins)
+
+    def _updateEventTypeFilter(self):
+        """
+        Compute the event types to fetch from the active plugins.
+
+        Filtering is disabled when any callback takes all event types.
+        """
+        eventTypes = None
+        if self._filter_event_types:
+            eventTypes = set()
+            for collection in self._pluginCollections:
+                for plugin in collection:
+                    if not plugin.isActive():
+                        continue
+                    pluginEventTypes = plugin.getEventTypes()
+                    if pluginEventTypes is None:
+                        eventTypes = None
+                        break
+                    eventTypes.update(pluginEventTypes)
+                if eventTypes is None:
+                    break
+
+        if eventTypes and self._entityCache is not None:
+            # Entities are only cached while their changes and retirements
+            # are fetched. Retirements are rare, they're fetched for every
+            # entity type whose changes are.
+            eventTypes.update(
+                [
+                    eventType[: -len("Change")] + "Retirement"
+                    for eventType in eventTypes
+                    if eventType.startswith("Shotgun_")
+                    and eventType.endswith("_Change")
+                ]
+            )
+
+        if eventTypes and self._schemaCache is not None:
+            eventTypes.update(schemaCache.SchemaCache.EVENT_TYPES)
+
+        if eventTypes:
+            eventTypes = sorted(eventTypes)
+        else:
+            eventTypes = None
+        if eventTypes != self._eventTypeFilter:
+            if eventTypes is None:
+                self.log.debug("Fetching events of all types.")
+            else:
+                self.log.debug("Fetching events of types: %s", ", ".join(eventTypes))
+            self._eventTypeFilter = eventTypes
+            if self._eventCache is not None:
+                # The cached events were fetched for the previous types.
+                self._eventCache.clear()
+            if self._eventJournal is not None:
+                self._eventJournal.setEventTypes(eventTypes)
+            if self._entityCache is not None:
+                self._entityCache.setEventTypes(eventTypes)
+
+    def _sleep(self, seconds):
+        """
+        Wait for a number of seconds, until the engine is stopped or a plugin
+        file changes.
+
+        @param seconds: The number of seconds to wait.
+        @type seconds: I{float}
+
+        @return: True if woken up early.
+        @rtype: I{bool}
+        """
+        woken = self._wakeup.wait(seconds)
+        if self._continue:
+            # Woken up early by a plugin change.
+            self._wakeup.clear()
+        return woken
+
+    def _idle(self, seconds):
+        """
+        Wait before polling Shotgun again, saving the progress the plugin
+        workers make meanwhile.
+
+        @param seconds: The number of seconds to wait.
+        @type seconds: I{float}
+        """
+        end = time.time() + seconds
+        while self._continue:
+            remaining = end - time.time()
+            if not self._pluginWorkers:
+                self._sleep(remaining)
+                return
+            if remaining <= 0:
+                return
+
+            if self._sleep(min(remaining, self._checkpoint_interval or 1)):
+                return
+            self._checkpoint(self._takeWorkerProgress())
 
     def _getNewEvents(self):
         """
@@ -557,31 +1370,217 @@ class Engine(object):
             if newId is not None and (nextEventId is None or newId < nextEventId):
                 nextEventId = newId
 
+        if nextEventId is None:
+            self._lastPageFull = False
+            return []
+
+        # No plugin needs to know about filtered ids before the next event.
+        with self._filteredEventIdsLock:
+            if self._filteredEventIds:
+                index = bisect.bisect_left(self._filteredEventIds, nextEventId)
+                self._filteredEventIds = self._filteredEventIds[index:]
+
+        nextEventId = self._getWorkersNextEventId(nextEventId)
+
+        # Events a lagging plugin needs again are served from the cache, then
+        # the journal. Shotgun is only queried from the first id they don't
+        # cover.
+        cached = []
+        fetchId = nextEventId
+        for name, source in (
+            ("cache", self._eventCache),
+            ("journal", self._eventJournal),
+        ):
+            if source is None or len(cached) >= self._batchSizer.getSize():
+                continue
+            sourceEvents, sourceLastId = source.get(
+                fetchId, self._batchSizer.getSize() - len(cached)
+            )
+            if sourceLastId is None:
+                continue
+            fetchId = sourceLastId + 1
+            if sourceEvents:
+                self.log.debug(
+                    "Got %d events from the %s: %d to %d.",
+                    len(sourceEvents),
+                    name,
+                    sourceEvents[0]["id"],
+                    sourceEvents[-1]["id"],
+                )
+                cached.extend(sourceEvents)
+
+        if cached and len(cached) >= self._batchSizer.getSize():
+            events = cached
+            self._lastPageFull = True
+        else:
+            if self._prefetcher:
+                events, limit = self._prefetcher.getEvents(fetchId)
+            else:
+                limit = self._batchSizer.getSize() - len(cached)
+                events = self._fetchEvents(
+                    self._sg, fetchId, limit, self._eventTypeFilter
+                )
+            if self._eventCache is not None:
+                self._eventCache.add(fetchId, events)
+            if self._eventJournal is not None:
+                self._eventJournal.append(fetchId, events)
+
+            self._lastPageFull = bool(events) and len(events) >= limit
+            events = cached + events
+
+        self._batchSizer.update(events, self._lastPageFull)
+
+        # Ids in the backlogs are below the cursor, they are looked up on their
+        # own rather than by fetching everything from the lowest one again.
+        backlogRanges = []
+        for collection in self._pluginCollections:
+            backlogRanges.extend(collection.getBacklogRanges())
+        if backlogRanges:
+            events = self._fetchBacklogEvents(backlogRanges, nextEventId) + events
+
+        if self._entityCache is not None:
+            self._entityCache.invalidate(events)
+        if self._schemaCache is not None:
+            self._schemaCache.invalidate(events)
+
+        return events
+
+    def _fetchBacklogEvents(self, backlogRanges, nextEventId):
+        """
+        Fetch the events of the plugins' backlogs which showed up.
+
+        With event types filtered out of the query, the backlogs mostly hold
+        the ids of events of other types. Only the id and type of the events
+        of the backlogs are fetched then, the events of the filtered types
+        are recorded as such, see L{getFilteredEventIds}, so plugins stop
+        waiting for them, and the other ones are fetched in full.
+
+        @param backlogRanges: The (first id, last id) ranges of the backlogs.
+        @type backlogRanges: I{list} of tuples
+        @param nextEventId: The id the page of new events starts at, the ids
+            from it onwards are already fetched.
+        @type nextEventId: I{int}
+
+        @return: The events, ordered by id.
+        @rtype: I{list} of Shotgun event dictionaries.
+        """
+        # Merge the ranges of all the plugins.
+        ranges = []
+        for first, last in sorted(backlogRanges):
+            last = min(last, nextEventId - 1)
+            if first > last:
+                continue
+            if ranges and first <= ranges[-1][1] + 1:
+                ranges[-1][1] = max(ranges[-1][1], last)
+            else:
+                ranges.append([first, last])
+
+        if not ranges:
+            return []
+
+        eventTypes = self._eventTypeFilter
+        if eventTypes is None:
+            fields = self.EVENT_FIELDS
+        else:
+            fields = ["id", "event_type"]
+
+        # Keep the queries short, the ranges are looked up MAX_BACKLOG_RANGES
+        # at a time until a page of events was found.
+        events = []
+        limit = self._batchSizer.getSize()
+        for start in range(0, len(ranges), self.MAX_BACKLOG_RANGES):
+            filters = [
+                {
+                    "filter_operator": "any",
+                    "filters": [
+                        ["id", "between", r]
+                        for r in ranges[start : start + self.MAX_BACKLOG_RANGES]
+                    ],
+                }
+            ]
+            found = self._findBacklogEvents(filters, fields, limit - len(events))
+            if found is None:
+                break
+            events.extend(found)
+            if len(events) >= limit:
+                break
+
+        if eventTypes is not None and events:
+            filteredIds = set(
+                e["id"] for e in events if e["event_type"] not in eventTypes
+            )
+            if filteredIds:
+                with self._filteredEventIdsLock:
+                    self._filteredEventIds = sorted(
+                        filteredIds.union(self._filteredEventIds)
+                    )
+
+            eventIds = [e["id"] for e in events if e["id"] not in filteredIds]
+            events = []
+            if eventIds:
+                filters = [["id", "in", eventIds]]
+                events = self._findBacklogEvents(filters, self.EVENT_FIELDS) or []
+
+        if events:
+            self.log.debug("Got %d events from the backlogs.", len(events))
+        return events
+
+    def _findBacklogEvents(self, filters, fields, limit=0):
+        """
+        Query events of the backlogs. The backlogs are looked up again at the
+        next pass if the query fails.
+
+        @return: The events, ordered by id, or None if the query failed.
+        @rtype: I{list} of Shotgun event dictionaries.
+        """
+        order = [{"column": "id", "direction": "asc"}]
+        try:
+            return self._sg.find("EventLogEntry", filters, fields, order, limit=limit)
+        except (sg.ProtocolError, sg.ResponseError, socket.error) as err:
+            self.log.warning("Could not fetch the backlog events: %s", err)
+        except Exception as err:
+            self.log.warning(
+                "Could not fetch the backlog events: Unknown error: %s", err
+            )
+        return None
+
+    def _fetchEvents(self, shotgun, nextEventId, limit, eventTypes=None, sleep=None):
+        """
+        Fetch a page of events starting at a given id.
+
+        Connection errors are retried according to the max_conn_retries and
+        conn_retry_sleep settings, until the engine is stopped.
+
+        @param shotgun: The connection to query the events with.
+        @type shotgun: L{sg.Shotgun}
+        @param nextEventId: The id of the first event to fetch.
+        @type nextEventId: I{int}
+        @param limit: The maximum number of events to fetch.
+        @type limit: I{int}
+        @param eventTypes: Only fetch events of these types.
+        @type eventTypes: I{list} of I{str} or None for all events.
+        @param sleep: Called with a number of seconds to wait between
+            retries, L{_sleep} by default.
+        @type sleep: A function object.
+
+        @return: At most limit events, ordered by id.
+        @rtype: I{list} of Shotgun event dictionaries.
+        """
         if nextEventId is not None:
             filters = [["id", "greater_than", nextEventId - 1]]
-            fields = [
-                "id",
-                "event_type",
-                "attribute_name",
-                "meta",
-                "entity",
-                "user",
-                "project",
-                "session_uuid",
-                "created_at",
-            ]
+            if eventTypes is not None:
+                filters.append(["event_type", "in", eventTypes])
+            fields = self.EVENT_FIELDS
             order = [{"column": "id", "direction": "asc"}]
 
             conn_attempts = 0
             while True:
                 try:
-                    events = self._sg.find(
-                        "EventLogEntry",
-                        filters,
-                        fields,
-                        order,
-                        limit=self.config.getMaxEventBatchSize(),
+                    fetchStart = time.time()
+                    events = shotgun.find(
+                        "EventLogEntry", filters, fields, order, limit=limit,
                     )
+                    self._batchSizer.recordFetch(time.time() - fetchStart)
                     if events:
                         self.log.debug(
                             "Got %d events: %d to %d.",
@@ -592,14 +1591,49 @@ class Engine(object):
                     return events
                 except (sg.ProtocolError, sg.ResponseError, socket.error) as err:
                     conn_attempts = self._checkConnectionAttempts(
-                        conn_attempts, str(err)
+                        conn_attempts, str(err), sleep
                     )
                 except Exception as err:
                     msg = "Unknown error: %s" % str(err)
-                    conn_attempts = self._checkConnectionAttempts(conn_attempts, msg)
+                    conn_attempts = self._checkConnectionAttempts(
+                        conn_attempts, msg, sleep
+                    )
+
+                if not self._continue:
+                    return []
 
         return []
 
+    def _checkpoint(self, processed=0, force=False):
+        """
+        Save the state once enough events were processed or enough time went
+        by since it was last saved.
+
+        If the daemon dies, at most that many events will be processed again
+        when it restarts.
+
+        @param processed: The number of events processed since the last call.
+        @type processed: I{int}
+        @param force: Save the state right away.
+        @type force: I{bool}
+        """
+        self._uncheckpointedEvents += processed
+        if not force:
+            if not self._uncheckpointedEvents:
+                return
+            if (
+                self._uncheckpointedEvents < self._checkpoint_events
+                and time.time() - self._lastCheckpoint < self._checkpoint_interval
+            ):
+                return
+
+        self._saveEventIdData()
+        # The journal covers at least the events saved as processed.
+        if self._eventJournal is not None:
+            self._eventJournal.sync()
+        self._uncheckpointedEvents = 0
+        self._lastCheckpoint = time.time()
+
     def _saveEventIdData(self):
         """
         Save an event Id to persistant storage.
@@ -607,29 +1641,28 @@ class Engine(object):
         Next time the engine is started it will try to read the event id from
         this location to know at which event it should start processing.
         """
-        eventIdFile = self.config.getEventIdFile()
-
-        if eventIdFile is not None:
-            for collection in self._pluginCollections:
-                self._eventIdData[collection.path] = collection.getState()
+        if self._stateStore:
+            # The writes queued for the events in the state are sent first, a
+            # write which fails puts its event back in its plugin's backlog.
+            # Writes queued meanwhile by plugin workers are sent afterwards,
+            # the state is collected again if one of them failed.
+            failures = self._flushWrites()
+            while True:
+                for collection in self._pluginCollections:
+                    self._eventIdData[collection.path] = collection.getState()
+                newFailures = self._flushWrites()
+                if newFailures == failures:
+                    break
+                failures = newFailures
 
             for colPath, state in self._eventIdData.items():
                 if state:
-                    try:
-                        fh = open(eventIdFile, "w")
-                        pickle.dump(self._eventIdData, fh)
-                        fh.close()
-                    except OSError as err:
-                        self.log.error(
-                            "Can not write event id data to %s.\n\n%s",
-                            eventIdFile,
-                            traceback.format_exc(err),
-                        )
+                    self._stateStore.save(self._eventIdData)
                     break
             else:
                 self.log.warning("No state was found. Not saving to disk.")
 
-    def _checkConnectionAttempts(self, conn_attempts, msg):
+    def _checkConnectionAttempts(self, conn_attempts, msg, sleep=None):
         conn_attempts += 1
         if conn_attempts == self._max_conn_retries:
             self.log.error(
@@ -639,7 +1672,7 @@ class Engine(object):
                 msg,
             )
             conn_attempts = 0
-            time.sleep(self._conn_retry_sleep)
+            (sleep or self._sleep)(self._conn_retry_sleep)
         else:
             self.log.warning(
                 "Unable to connect to Shotgun (attempt %s of %s): %s",
@@ -650,6 +1683,349 @@ class Engine(object):
         return conn_attempts
 
 
+class EventPrefetcher(object):
+    """
+    A background fetch stage that pulls the next page of events from Shotgun
+    while the engine is still dispatching the current one.
+
+    The engine keeps deciding where each page starts, the prefetcher only
+    guesses that the next request will continue right after the last event
+    of a full page. Pages that do not start where the engine asks, because of
+    a reloaded plugin for example, or which were fetched for other
+    event types, are discarded and the fetch is restarted from the requested
+    id. Every page handed to the engine is therefore exactly what a direct
+    query would have returned.
+
+    A page which failed to be fetched in the background, or which can't be
+    because the prefetch thread is gone, is logged and fetched again by the
+    engine itself.
+    """
+
+    def __init__(self, engine, maxPages):
+        """
+        @param engine: The engine this prefetcher fetches events for.
+        @type engine: L{Engine}
+        @param maxPages: The number of pages that can be fetched ahead.
+        @type maxPages: I{int}
+        """
+        self._engine = engine
+        self._maxPages = maxPages
+        self._pages = collections.deque()
+        self._nextId = None
+        self._generation = 0
+        self._running = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+        # Waited on between retries, the engine's wakeup is left to the main
+        # thread.
+        self._stopped = threading.Event()
+
+        # The connection is used from the prefetch thread only.
+        self._sg = sg.Shotgun(
+            engine.config.getShotgunURL(),
+            engine.config.getEngineScriptName(),
+            engine.config.getEngineScriptKey(),
+            http_proxy=engine.config.getEngineProxyServer(),
+        )
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="EventPrefetcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def getEvents(self, nextEventId):
+        """
+        Get the page of events starting at a given id.
+
+        @param nextEventId: The id of the first event to return.
+        @type nextEventId: I{int}
+
+        @return: The events, ordered by id, and the page size they were
+            fetched with.
+        @rtype: A (I{list} of Shotgun event dictionaries, I{int}) tuple.
+        """
+        with self._cond:
+            page = self._getPage(nextEventId)
+
+        if page is None:
+            return [], 0
+        firstId, events, limit, eventTypes, error = page
+        if error is None:
+            return events, limit
+
+        self._engine.log.error(
+            "Prefetching events from id %d failed, fetching them directly.\n\n%s",
+            nextEventId,
+            error,
+        )
+        limit = self._engine._batchSizer.getSize()
+        events = self._engine._fetchEvents(
+            self._engine._sg, nextEventId, limit, self._engine._eventTypeFilter
+        )
+        return events, limit
+
+    def _getPage(self, nextEventId):
+        """
+        Wait for the page starting at a given id. Called with the condition
+        acquired.
+
+        @return: The (first id, events, limit, event types, error) tuple of
+            the page, or None if the prefetcher is stopped.
+        @rtype: I{tuple}
+        """
+        while self._running:
+            eventTypes = self._engine._eventTypeFilter
+            while self._pages and (
+                self._pages[0][0] != nextEventId or self._pages[0][3] != eventTypes
+            ):
+                self._engine.log.debug(
+                    "Discarding prefetched events from id %d.", self._pages[0][0]
+                )
+                self._pages.popleft()
+
+            if self._pages:
+                page = self._pages.popleft()
+                self._cond.notify_all()
+                return page
+
+            if not self._thread.is_alive():
+                return (nextEventId, [], 0, eventTypes, "The thread is gone.")
+
+            if self._nextId != nextEventId:
+                # Anything being fetched right now is of no use anymore.
+                self._generation += 1
+                self._nextId = nextEventId
+                self._cond.notify_all()
+
+            self._cond.wait(1)
+
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and (
+                    self._nextId is None or len(self._pages) >= self._maxPages
+                ):
+                    self._cond.wait()
+
+                if not self._running:
+                    return
+
+                nextEventId = self._nextId
+                generation = self._generation
+                eventTypes = self._engine._eventTypeFilter
+
+            # Errors are handed to the engine, which fetches the page itself.
+            limit = 0
+            try:
+                limit = self._engine._batchSizer.getSize()
+                events = self._engine._fetchEvents(
+                    self._sg, nextEventId, limit, eventTypes, self._stopped.wait
+                )
+                error = None
+            except Exception:
+                events = []
+                error = traceback.format_exc()
+
+            with self._cond:
+                if generation != self._generation:
+                    continue
+
+                self._pages.append((nextEventId, events, limit, eventTypes, error))
+
+                # Only keep reading ahead while we are lagging behind Shotgun,
+                # once caught up wait for the engine to ask again.
+                if error is None and len(events) >= limit:
+                    self._nextId = events[-1]["id"] + 1
+                else:
+                    self._nextId = None
+
+                self._cond.notify_all()
+
+
+class EventBatchSizer(object):
+    """
+    Sizes the pages of events fetched from Shotgun.
+
+    When the engine is caught up, pages are kept small so each one is
+    processed and saved quickly. When the engine is lagging behind, pages
+    grow so that processing one takes about target_batch_time seconds, or
+    four times as long as fetching it if that is longer, which amortizes the
+    round trips to Shotgun.
+    """
+
+    # Weight of the latest measure in the moving averages.
+    SMOOTHING = 0.3
+
+    # Seconds between two queries for the latest event id while lagging.
+    LAG_CHECK_INTERVAL = 30
+
+    def __init__(self, engine):
+        """
+        @param engine: The engine this sizes pages for.
+        @type engine: L{Engine}
+        """
+        self._engine = engine
+        self._minSize = engine.config.getMinEventBatchSize()
+        self._maxSize = engine.config.getMaxEventBatchSize()
+        self._targetTime = engine.config.getTargetBatchTime()
+        self._size = self._maxSize
+        self._fetchTime = None
+        self._eventTime = None
+        self._latestEventId = None
+        self._lastLagCheck = 0
+
+    def getSize(self):
+        """
+        @return: The number of events to fetch in the next page.
+        @rtype: I{int}
+        """
+        return self._size
+
+    def recordFetch(self, seconds):
+        self._fetchTime = self._average(self._fetchTime, seconds)
+
+    def recordDispatch(self, count, seconds):
+        if count:
+            self._eventTime = self._average(self._eventTime, seconds / count)
+
+    def update(self, events, full):
+        """
+        Size the next page from the last page fetched.
+
+        @param events: The events of the last page.
+        @type events: I{list} of Shotgun event dictionaries.
+        @param full: Whether the last page was full, meaning there are more
+            events to fetch.
+        @type full: I{bool}
+        """
+        if self._minSize == self._maxSize:
+            return
+
+        if full:
+            lag = self._getLag(events[-1]["id"])
+        else:
+            lag = 0
+
+        if lag <= 0:
+            size = self._minSize
+        else:
+            size = self._maxSize
+            if self._eventTime:
+                budget = max(self._targetTime, 4 * (self._fetchTime or 0))
+                size = int(budget / self._eventTime)
+            size = min(size, lag)
+        self._size = max(self._minSize, min(size, self._maxSize))
+
+        self._engine.log.debug(
+            "Event lag is %d events, next page size is %d events.", lag, self._size
+        )
+
+    def _getLag(self, lastEventId):
+        now = time.time()
+        if (
+            self._latestEventId is None
+            or self._latestEventId <= lastEventId
+            or now - self._lastLagCheck > self.LAG_CHECK_INTERVAL
+        ):
+            self._lastLagCheck = now
+            order = [{"column": "id", "direction": "desc"}]
+            try:
+                result = self._engine._sg.find_one(
+                    "EventLogEntry", filters=[], fields=["id"], order=order
+                )
+            except Exception as err:
+                self._engine.log.warning("Could not get the latest event id: %s", err)
+                return self._maxSize
+
+            if result:
+                self._latestEventId = result["id"]
+                self._engine.log.info(
+                    "%d events behind Shotgun.", self._latestEventId - lastEventId
+                )
+
+        if self._latestEventId is None:
+            return self._maxSize
+        return max(self._latestEventId - lastEventId, 1)
+
+    def _average(self, average, value):
+        if average is None:
+            return value
+        return average + self.SMOOTHING * (value - average)
+
+
+class EventRouter(object):
+    """
+    Routes events to the callbacks which can process them.
+
+    The callbacks are indexed by the event types and attribute names they
+    process, with "*" for the ones taking any, when plugins are loaded. An
+    event is routed with a few dictionary lookups rather than by asking every
+    callback with L{Callback.canProcess}. Whether callbacks are active is left
+    to the plugins.
+    """
+
+    def __init__(self, plugins):
+        """
+        @param plugins: The plugins to route events to.
+        @type plugins: I{list} of L{Plugin}
+        """
+        # {event type: {attribute name: [(order, plugin, callback)]}}
+        self._index = {}
+        order = 0
+        for plugin in plugins:
+            for callback in plugin:
+                for eventType, attributeName in callback.getRoutes():
+                    attributes = self._index.setdefault(eventType, {})
+                    attributes.setdefault(attributeName, []).append(
+                        (order, plugin, callback)
+                    )
+                order += 1
+
+        # Routes by event type and attribute name, filled in as they're seen.
+        self._routes = {}
+
+    def route(self, event):
+        """
+        Get the callbacks which can process an event.
+
+        @param event: The Shotgun event to route.
+        @type event: I{dict}
+
+        @return: The callbacks of each plugin, in registration order. Plugins
+            with no callback for the event are left out.
+        @rtype: I{dict} of L{Plugin} to I{list} of L{Callback}
+        """
+        key = (event["event_type"], event.get("attribute_name"))
+        routes = self._routes.get(key)
+        if routes is not None:
+            return routes
+
+        entries = []
+        for eventType in (key[0], "*"):
+            attributes = self._index.get(eventType)
+            if attributes:
+                if key[1]:
+                    entries.extend(attributes.get(key[1], ()))
+                entries.extend(attributes.get("*", ()))
+        entries.sort(key=lambda entry: entry[0])
+
+        routes = {}
+        for order, plugin, callback in entries:
+            routes.setdefault(plugin, []).append(callback)
+        self._routes[key] = routes
+        return routes
+
+
 class PluginCollection(object):
     """
     A group of plugin files in a location on the disk.
@@ -692,13 +2068,32 @@ class PluginCollection(object):
                 eId = newId
         return eId
 
-    def process(self, event):
+    def getBacklogRanges(self):
+        ranges = []
+        for plugin in self:
+            if plugin.isActive():
+                ranges.extend(plugin.getBacklogRanges())
+        return ranges
+
+    def process(self, event, routes):
+        """
+        @param routes: The callbacks of each plugin for the event, see
+            L{EventRouter.route}.
+        """
         for plugin in self:
             if plugin.isActive():
-                plugin.process(event)
+                plugin.process(event, routes.get(plugin, ()))
             else:
                 plugin.logger.debug("Skipping: inactive.")
 
+    def processEvents(self, events):
+        for plugin in self:
+            plugin.processEvents(events)
+
+    def unload(self):
+        for plugin in self:
+            plugin.unload()
+
     def load(self):
         """
         Load plugins from disk.
@@ -708,8 +2103,14 @@ class PluginCollection(object):
         - Find all valid .py plugin files.
         - Loop on all plugin files.
         - For any new plugins, load them, otherwise, refresh them.
+
+        A new plugin gets the state the collection has for its name, if any.
+
+        @return: The new plugins for which the collection has no state.
+        @rtype: I{list} of L{Plugin}
         """
         newPlugins = {}
+        noStatePlugins = []
 
         for basename in os.listdir(self.path):
             if not basename.endswith(".py") or basename.startswith("."):
@@ -718,19 +2119,341 @@ class PluginCollection(object):
             if basename in self._plugins:
                 newPlugins[basename] = self._plugins[basename]
             else:
-                newPlugins[basename] = Plugin(
-                    self._engine, os.path.join(self.path, basename)
-                )
+                plugin = Plugin(self._engine, os.path.join(self.path, basename))
+                pluginState = self._stateData.get(plugin.getName())
+                if pluginState:
+                    plugin.setState(pluginState)
+                else:
+                    noStatePlugins.append(plugin)
+                newPlugins[basename] = plugin
 
             newPlugins[basename].load()
 
+        for basename, plugin in self._plugins.items():
+            if basename not in newPlugins:
+                plugin.unload()
+
         self._plugins = newPlugins
+        return noStatePlugins
 
     def __iter__(self):
         for basename in sorted(self._plugins.keys()):
             yield self._plugins[basename]
 
 
+class PluginWorker(object):
+    """
+    A thread dedicated to processing events for a single plugin.
+
+    Up to maxPages pages of events can be queued for the worker, so a plugin
+    can run ahead of slower ones while the engine keeps fetching events.
+    """
+
+    def __init__(self, plugin, maxPages):
+        """
+        @param plugin: The plugin to process events for.
+        @type plugin: L{Plugin}
+        @param maxPages: The number of pages which can be queued.
+        @type maxPages: I{int}
+        """
+        self.plugin = plugin
+        self._queue = queue.Queue(maxPages)
+
+        # Pages submitted and not processed yet, the id following their last
+        # event, whether one was skipped by an inactive plugin and the number
+        # of events processed, see L{getNextEventId} and L{takeProcessed}.
+        self._lock = threading.Lock()
+        self._pages = 0
+        self._nextEventId = None
+        self._skipped = False
+        self._processed = 0
+
+        self._thread = threading.Thread(
+            target=self._run, name="PluginWorker-%s" % plugin.getName()
+        )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, events, timeout=None):
+        """
+        Queue a page of events to be processed, in order, by the plugin.
+
+        The reads made for the events are memoized until the plugin is done
+        with them, see L{Engine._requestScope}.
+
+        @param events: The events to process, ordered by id.
+        @type events: I{list} of Shotgun event dictionaries.
+        @param timeout: The number of seconds to wait for room in the queue,
+            or None to wait as long as needed.
+        @type timeout: I{float}
+
+        @return: True if the page was queued, False if the queue was still
+            full once the timeout elapsed.
+        @rtype: I{bool}
+        """
+        memo = self.plugin._engine._requestMemo
+        if memo is not None:
+            memo.open(events)
+        with self._lock:
+            self._pages += 1
+            nextEventId = self._nextEventId
+            if nextEventId is None or events[-1]["id"] >= nextEventId:
+                self._nextEventId = events[-1]["id"] + 1
+
+        try:
+            self._queue.put(events, True, timeout)
+        except queue.Full:
+            self._pageDone(events, 0)
+            with self._lock:
+                if self._pages:
+                    self._nextEventId = nextEventId
+            return False
+        return True
+
+    def getNextEventId(self):
+        """
+        Get the id following the events submitted to the worker.
+
+        @return: The id, or None if the plugin's own cursor must be relied on:
+            the worker is done with the events it was given or skipped some
+            while the plugin was inactive.
+        @rtype: I{int}
+        """
+        with self._lock:
+            if self._skipped:
+                return None
+            return self._nextEventId
+
+    def takeProcessed(self):
+        """
+        @return: The number of events processed since the last call.
+        @rtype: I{int}
+        """
+        with self._lock:
+            processed = self._processed
+            self._processed = 0
+        return processed
+
+    def stop(self):
+        """
+        Stop the worker once it's done with the page it's processing. The
+        pages still queued are dropped.
+        """
+        while True:
+            try:
+                events = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._pageDone(events, 0)
+        self._queue.put(None)
+
+    def join(self):
+        self._thread.join()
+
+    def _pageDone(self, events, processed):
+        memo = self.plugin._engine._requestMemo
+        if memo is not None:
+            memo.close(events)
+        with self._lock:
+            self._pages -= 1
+            self._processed += processed
+            if not self._pages:
+                self._nextEventId = None
+                self._skipped = False
+
+    def _run(self):
+        while True:
+            events = self._queue.get()
+            if events is None:
+                return
+
+            try:
+                self.plugin.processEvents(events)
+                self.plugin._engine._flushWrites()
+            except:
+                self.plugin.logger.critical(
+                    "Unexpected error processing events, deactivating plugin.\n\n%s",
+                    traceback.format_exc(),
+                )
+                self.plugin.setActive(False)
+
+            # The plugin may not have processed all the events.
+            if not self.plugin.isActive():
+                with self._lock:
+                    self._skipped = True
+            self._pageDone(events, len(events))
+
+
+class PluginProcess(object):
+    """
+    A subprocess in which a plugin's callbacks are loaded and run.
+
+    This isolates the daemon from crashing, leaking or hanging plugins and
+    lets CPU heavy plugins run on their own core.
+    """
+
+    def __init__(self, plugin):
+        """
+        @param plugin: The plugin to run in the process.
+        @type plugin: L{Plugin}
+        """
+        self._plugin = plugin
+        self._timeout = plugin._engine.config.getProcessTimeout()
+        self._maxEvents = plugin._engine.config.getProcessMaxEvents()
+        self._eventCount = 0
+        self.eventTypes = None
+
+        self._conn, childConn = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=self._run,
+            args=(childConn,),
+            name="PluginProcess-%s" % plugin.getName(),
+        )
+        self._process.daemon = True
+        self._process.start()
+        childConn.close()
+
+    def getRegistration(self):
+        """
+        Wait for the plugin to be loaded in the process.
+
+        The event types the plugin's callbacks can process are then available
+        as eventTypes.
+
+        @return: True if the plugin registered its callbacks successfully.
+        @rtype: I{bool}
+
+        @raise PluginProcessError: If the process crashed or timed out.
+        """
+        active, self.eventTypes = self._receive()
+        return active
+
+    def process(self, events):
+        """
+        Send events to the process.
+
+        @param events: The events to process, ordered by id.
+        @type events: I{list} of Shotgun event dictionaries.
+
+        @return: An (event id, plugin active) tuple for each processed event.
+            Processing stops after the first event which deactivated the
+            plugin.
+        @rtype: A generator of tuples.
+
+        @raise PluginProcessError: If the process crashed or timed out.
+        """
+        # The types of the events fetched go along, the process keeps its own
+        # entity and schema caches up to date with them.
+        try:
+            self._conn.send((events, self._plugin._engine._eventTypeFilter))
+        except (IOError, OSError) as err:
+            raise PluginProcessError("Could not send events: %s" % err)
+
+        for event in events:
+            eventId, active = self._receive()
+            self._eventCount += 1
+            yield eventId, active
+            if not active:
+                return
+
+    def needsRecycling(self):
+        return self._maxEvents > 0 and self._eventCount >= self._maxEvents
+
+    def stop(self):
+        try:
+            self._conn.send(None)
+        except (IOError, OSError):
+            pass
+        self._process.join(5)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._conn.close()
+
+    def _receive(self):
+        if self._timeout > 0 and not self._conn.poll(self._timeout):
+            self._process.terminate()
+            raise PluginProcessError("No answer after %d seconds." % self._timeout)
+
+        try:
+            return self._conn.recv()
+        except (EOFError, IOError):
+            self._process.join(1)
+            raise PluginProcessError(
+                "Process exited with code %s." % self._process.exitcode
+            )
+
+    def _run(self, conn):
+        """
+        Entry point of the subprocess.
+        """
+        # Leave the daemon's shutdown handling to the parent process.
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        _resetLoggingLocks()
+        engine = self._plugin._engine
+        engine._connectionPool.reset()
+        if engine._entityCache is not None:
+            engine._entityCache.reset()
+        if engine._schemaCache is not None:
+            engine._schemaCache.reset()
+        if engine._requestMemo is not None:
+            engine._requestMemo.reset()
+        if engine._writeBatcher is not None:
+            engine._writeBatcher.reset()
+
+        plugin = self._plugin
+        plugin._pluginProcess = None
+        plugin._loadCallbacks()
+        engine._router = EventRouter([plugin])
+        conn.send((plugin.isActive(), plugin.getEventTypes()))
+
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                return
+            if message is None:
+                return
+
+            events, eventTypes = message
+            if engine._entityCache is not None:
+                engine._entityCache.setEventTypes(eventTypes)
+                engine._entityCache.invalidate(events)
+            if engine._schemaCache is not None:
+                engine._schemaCache.invalidate(events)
+
+            # Events are only acknowledged once their queued writes were sent,
+            # the parent saves them as processed. Acknowledgements aren't held
+            # for so long the parent gives up on the process.
+            processed = []
+            for event in events:
+                if not processed:
+                    heldSince = time.time()
+                with engine._requestScope([event]):
+                    active = plugin._process(event)
+                processed.append(event["id"])
+                if (
+                    active
+                    and event is not events[-1]
+                    and engine._hasQueuedWrites()
+                    and (
+                        self._timeout <= 0
+                        or time.time() - heldSince < self._timeout / 2.0
+                    )
+                ):
+                    continue
+
+                engine._flushWrites()
+                active = plugin.isActive()
+                for eventId in processed:
+                    conn.send((eventId, active))
+                    if not active:
+                        break
+                processed = []
+                if not active:
+                    break
+
+
 class Plugin(object):
     """
     The plugin class represents a file on disk which contains one or more
@@ -757,7 +2480,19 @@ class Plugin(object):
         self._callbacks = []
         self._mtime = None
         self._lastEventId = None
-        self._backlog = {}
+        self._backlog = eventBacklog.EventBacklog()
+
+        # Guards the cursor and backlog when events are processed by a
+        # L{PluginWorker} or the entity thread pool while the engine saves
+        # the state.
+        self._stateLock = threading.RLock()
+        self._entityPool = None
+        self._entityPoolLock = threading.Lock()
+        self._pluginProcess = None
+
+        # Connections leased by the registration function, only while it
+        # runs, see L{getShotgun}.
+        self._registrationShotguns = None
 
         # Setup the plugin's logger
         self.logger = logging.getLogger("plugin." + self.getName())
@@ -772,34 +2507,71 @@ class Plugin(object):
     def getName(self):
         return self._pluginName
 
+    def getPath(self):
+        return self._path
+
     def setState(self, state):
-        if isinstance(state, int):
-            self._lastEventId = state
-        elif isinstance(state, tuple):
-            self._lastEventId, self._backlog = state
-        else:
-            raise ValueError("Unknown state type: %s." % type(state))
+        with self._stateLock:
+            if isinstance(state, int):
+                self._lastEventId = state
+            elif isinstance(state, tuple):
+                self._lastEventId = state[0]
+                self._backlog = eventBacklog.EventBacklog(state[1])
+            else:
+                raise ValueError("Unknown state type: %s." % type(state))
 
     def getState(self):
-        return (self._lastEventId, self._backlog)
+        with self._stateLock:
+            return (self._lastEventId, self._backlog.getRanges())
 
     def getNextUnprocessedEventId(self):
+        """
+        Get the id of the event following the last processed one.
+
+        The ids of the backlog are fetched separately, see
+        L{getBacklogRanges}. Expired ids are dropped from the backlog.
+
+        @rtype: I{int} or None
+        """
         if self._lastEventId:
             nextId = self._lastEventId + 1
         else:
             nextId = None
 
         now = datetime.datetime.now()
-        for k in self._backlog.keys():
-            v = self._backlog[k]
-            if v < now:
-                self.logger.warning("Timeout elapsed on backlog event id %d.", k)
-                del self._backlog[k]
-            elif nextId is None or k < nextId:
-                nextId = k
+        with self._stateLock:
+            for first, last in self._backlog.expire(now):
+                if first == last:
+                    self.logger.warning(
+                        "Timeout elapsed on backlog event id %d.", first
+                    )
+                else:
+                    self.logger.warning(
+                        "Timeout elapsed on backlog event ids %d-%d.", first, last
+                    )
+
+            if self._backlog:
+                for eventId in self._engine.getFilteredEventIds(
+                    self._backlog.getFirstId(), self._backlog.getLastId()
+                ):
+                    if eventId in self._backlog:
+                        msg = "Backlog event id %d was filtered out."
+                        self.logger.debug(msg, eventId)
+                        self._backlog.discard(eventId)
 
         return nextId
 
+    def getBacklogRanges(self):
+        """
+        Get the ids the plugin is still waiting for, below its last processed
+        event id.
+
+        @return: The (first id, last id) ranges of the backlog.
+        @rtype: I{list} of tuples
+        """
+        with self._stateLock:
+            return [(first, last) for first, last, _ in self._backlog.getRanges()]
+
     def isActive(self):
         """
         Is the current plugin active. Should it's callbacks be run?
@@ -809,6 +2581,23 @@ class Plugin(object):
         """
         return self._active
 
+    def setActive(self, active):
+        self._active = active
+
+    def backlogEvent(self, event):
+        """
+        Put an event back in the backlog, so it's processed again.
+
+        Used when a write queued for an event which was processed fails, see
+        L{Callback.writeFailed}. The event stays in the backlog until it's
+        processed.
+
+        @param event: The event.
+        @type event: I{dict}
+        """
+        with self._stateLock:
+            self._addToBacklog(event["id"], event["id"], datetime.datetime.max)
+
     def setEmails(self, *emails):
         """
         Set the email addresses to whom this plugin should send errors.
@@ -846,10 +2635,20 @@ class Plugin(object):
             return
 
         # Reset values
+        self.unload()
         self._mtime = mtime
         self._callbacks = []
         self._active = True
 
+        if self._engine._dispatch_mode == "process":
+            self._startProcess()
+        else:
+            self._loadCallbacks()
+
+    def _loadCallbacks(self):
+        """
+        Load the source of the plugin and run its registration function.
+        """
         try:
             plugin = imp.load_source(self._pluginName, self._path)
         except:
@@ -863,6 +2662,7 @@ class Plugin(object):
 
         regFunc = getattr(plugin, "registerCallbacks", None)
         if callable(regFunc):
+            self._registrationShotguns = []
             try:
                 regFunc(Registrar(self))
             except:
@@ -872,12 +2672,77 @@ class Plugin(object):
                     traceback.format_exc(),
                 )
                 self._active = False
+            finally:
+                for shotgun in self._registrationShotguns:
+                    self._engine.releaseShotgun(shotgun)
+                self._registrationShotguns = None
         else:
             self._engine.log.critical(
                 "Did not find a registerCallbacks function in plugin at %s.", self._path
             )
             self._active = False
 
+    def _startProcess(self):
+        """
+        Start a new L{PluginProcess} for the plugin, stopping any previous one.
+        """
+        self.unload()
+        try:
+            self._pluginProcess = PluginProcess(self)
+            self._active = self._pluginProcess.getRegistration()
+        except PluginProcessError as err:
+            self._engine.log.critical(
+                "Could not start a process for plugin at %s: %s", self._path, err
+            )
+            self._active = False
+
+    def unload(self):
+        """
+        Stop the process the plugin runs in and the threads it processes
+        events with, if any.
+
+        The threads are stopped once done with the events being processed.
+        """
+        if self._pluginProcess is not None:
+            self._pluginProcess.stop()
+            self._pluginProcess = None
+
+        with self._entityPoolLock:
+            if self._entityPool is not None:
+                self._entityPool.close()
+                self._entityPool.join()
+                self._entityPool = None
+
+    def getShotgun(self, sgScriptName, sgScriptKey, server=None):
+        """
+        Get a connection to the Shotgun server for the registration function.
+
+        The connection is taken from the engine's connection pool and given
+        back once the registration function returns, it must not be kept for
+        later use.
+
+        @param sgScriptName: The name of the script to connect as.
+        @type sgScriptName: I{str}
+        @param sgScriptKey: The key of the script.
+        @type sgScriptKey: I{str}
+        @param server: The url of the Shotgun server, the one the daemon
+            connects to by default.
+        @type server: I{str}
+
+        @return: A connection to the Shotgun server.
+        @rtype: L{sg.Shotgun}
+
+        @raise EventDaemonError: If called outside of the registration
+            function.
+        """
+        if self._registrationShotguns is None:
+            raise EventDaemonError(
+                "Connections can only be requested while registering callbacks."
+            )
+        shotgun = self._engine.acquireShotgun(sgScriptName, sgScriptKey, server)
+        self._registrationShotguns.append(shotgun)
+        return self._engine._wrapShotgun(shotgun)
+
     def registerCallback(
         self,
         sgScriptName,
@@ -886,65 +2751,264 @@ class Plugin(object):
         matchEvents=None,
         args=None,
         stopOnError=True,
+        batchWrites=False,
     ):
         """
         Register a callback in the plugin.
         """
-        global sg
-        sgConnection = sg.Shotgun(
-            self._engine.config.getShotgunURL(),
-            sgScriptName,
-            sgScriptKey,
-            http_proxy=self._engine.config.getEngineProxyServer(),
-        )
         self._callbacks.append(
             Callback(
                 callback,
                 self,
                 self._engine,
-                sgConnection,
+                sgScriptName,
+                sgScriptKey,
                 matchEvents,
                 args,
                 stopOnError,
+                batchWrites,
             )
         )
 
-    def process(self, event):
+    def process(self, event, callbacks=None):
+        """
+        @param callbacks: The callbacks to dispatch the event to, routed by
+            the engine, see L{EventRouter.route}.
+        """
         if event["id"] in self._backlog:
-            if self._process(event):
-                self.logger.info("Processed id %d from backlog." % event["id"])
-                del self._backlog[event["id"]]
-                self._updateLastEventId(event)
+            if self._process(event, callbacks):
+                with self._stateLock:
+                    self._discardFromBacklog(event)
         elif self._lastEventId is not None and event["id"] <= self._lastEventId:
             msg = "Event %d is too old. Last event processed was (%d)."
             self.logger.debug(msg, event["id"], self._lastEventId)
         else:
-            if self._process(event):
-                self._updateLastEventId(event)
+            if self._process(event, callbacks):
+                with self._stateLock:
+                    self._updateLastEventId(event)
 
         return self._active
 
-    def _process(self, event):
-        for callback in self:
+    def processEvents(self, events):
+        """
+        Process a batch of events.
+
+        When the engine is configured with more than one entity worker, events
+        touching different entities are processed concurrently, see
+        L{_processEventsByEntity}. Otherwise they are processed one by one.
+
+        @param events: The events to process, ordered by id.
+        @type events: I{list} of Shotgun event dictionaries.
+        """
+        if self._pluginProcess is not None:
+            if self._active:
+                self._processEventsInProcess(events)
+            else:
+                self.logger.debug("Skipping: inactive.")
+            return
+
+        if self._engine._entity_workers > 1:
+            if self._active:
+                self._processEventsByEntity(events)
+            else:
+                self.logger.debug("Skipping: inactive.")
+            return
+
+        for event in events:
+            if self._active:
+                self.process(event)
+            else:
+                self.logger.debug("Skipping: inactive.")
+
+    def _processEventsByEntity(self, events):
+        """
+        Process a batch of events on a thread pool, one chain of events per
+        entity.
+
+        Events are keyed on the entity type and id from their meta data.
+        Events sharing a key are processed strictly in order, events with
+        different keys run concurrently. The cursor only moves forward once
+        every earlier event of the batch has been processed, so it never
+        skips over an event which is still in flight or has failed. An
+        unexpected error deactivates the plugin.
+
+        @param events: The events to process, ordered by id.
+        @type events: I{list} of Shotgun event dictionaries.
+        """
+        pending = self._getPendingEvents(events)
+        done = set()
+
+        chains = collections.OrderedDict()
+        for event, fromBacklog in pending:
+            meta = event.get("meta") or {}
+            key = (meta.get("entity_type"), meta.get("entity_id"))
+            chains.setdefault(key, []).append(event)
+
+        def processChain(chain):
+            for event in chain:
+                if not self._active:
+                    return
+                try:
+                    if not self._process(event):
+                        return
+                    self._commitEvent(event, pending, done)
+                except:
+                    # Like a failed callback, leave the event uncommitted.
+                    self.logger.critical(
+                        "Unexpected error processing event %d, deactivating "
+                        "plugin.\n\n%s",
+                        event["id"],
+                        traceback.format_exc(),
+                    )
+                    self._active = False
+                    return
+
+        # The pool is only stopped once done with the batch, see L{unload}.
+        with self._entityPoolLock:
+            if self._entityPool is None:
+                self._entityPool = ThreadPool(self._engine._entity_workers)
+
+            results = [
+                self._entityPool.apply_async(processChain, (chain,))
+                for chain in chains.values()
+            ]
+            for result in results:
+                result.get()
+
+    def _processEventsInProcess(self, events):
+        """
+        Process a batch of events in the plugin's L{PluginProcess}.
+
+        The events are streamed to the process which acknowledges each of
+        them once its callbacks have run. The cursor is advanced as the
+        acknowledgements come back. If the process crashes or stops
+        answering it is killed and the plugin is deactivated.
+
+        @param events: The events to process, ordered by id.
+        @type events: I{list} of Shotgun event dictionaries.
+        """
+        pending = self._getPendingEvents(events)
+        if not pending:
+            return
+
+        events = collections.OrderedDict((event["id"], event) for event, _ in pending)
+        done = set()
+        try:
+            for eventId, active in self._pluginProcess.process(events.values()):
+                if not active:
+                    self._active = False
+                    break
+                self._commitEvent(events[eventId], pending, done)
+        except PluginProcessError as err:
+            self.logger.critical("Plugin process failed, deactivating plugin: %s", err)
+            self._active = False
+            self.unload()
+            return
+
+        if self._pluginProcess.needsRecycling():
+            self._engine.log.info("Recycling process for plugin at %s", self._path)
+            self._startProcess()
+
+    def _getPendingEvents(self, events):
+        """
+        Select the events of a batch which need to be processed.
+
+        @param events: The events of the batch, ordered by id.
+        @type events: I{list} of Shotgun event dictionaries.
+
+        @return: The events to process and whether they come from the backlog.
+        @rtype: I{deque} of (event, I{bool}) tuples.
+        """
+        pending = collections.deque()
+        with self._stateLock:
+            for event in events:
+                if event["id"] in self._backlog:
+                    pending.append((event, True))
+                elif self._lastEventId is not None and event["id"] <= self._lastEventId:
+                    msg = "Event %d is too old. Last event processed was (%d)."
+                    self.logger.debug(msg, event["id"], self._lastEventId)
+                else:
+                    pending.append((event, False))
+        return pending
+
+    def _commitEvent(self, event, pending, done):
+        """
+        Record that an event was processed, moving the cursor forward over
+        every leading event of the batch which is done.
+
+        @param event: The event which was processed.
+        @type event: I{dict}
+        @param pending: The events of the batch which haven't been committed.
+        @type pending: I{deque} of (event, I{bool}) tuples.
+        @param done: The ids of the processed events.
+        @type done: I{set}
+        """
+        with self._stateLock:
+            done.add(event["id"])
+            while pending and pending[0][0]["id"] in done:
+                committed, fromBacklog = pending.popleft()
+                if fromBacklog:
+                    self._discardFromBacklog(committed)
+                else:
+                    self._updateLastEventId(committed)
+
+    def _discardFromBacklog(self, event):
+        """
+        Record that an event of the backlog was processed.
+
+        An event put back in the backlog by a failed write before the cursor
+        moved past it, see L{backlogEvent}, moves the cursor as well.
+
+        @param event: The event which was processed.
+        @type event: I{dict}
+        """
+        self.logger.info("Processed id %d from backlog." % event["id"])
+        self._backlog.discard(event["id"])
+        if self._lastEventId is not None and event["id"] > self._lastEventId:
+            self._updateLastEventId(event)
+
+    def _process(self, event, callbacks=None):
+        if callbacks is None:
+            callbacks = self._engine._router.route(event).get(self, ())
+        for callback in callbacks:
             if callback.isActive():
-                if callback.canProcess(event):
-                    msg = "Dispatching event %d to callback %s."
-                    self.logger.debug(msg, event["id"], str(callback))
-                    if not callback.process(event):
-                        # A callback in the plugin failed. Deactivate the whole
-                        # plugin.
-                        self._active = False
-                        break
+                msg = "Dispatching event %d to callback %s."
+                self.logger.debug(msg, event["id"], str(callback))
+                if not callback.process(event):
+                    # A callback in the plugin failed. Deactivate the whole
+                    # plugin.
+                    self._active = False
+                    break
             else:
                 msg = "Skipping inactive callback %s in plugin."
                 self.logger.debug(msg, str(callback))
 
+        # Writes queued for earlier events are sent once they're old enough,
+        # even when no callback queues new ones.
+        self._engine._flushDueWrites()
         return self._active
 
+    def getEventTypes(self):
+        """
+        Get the event types the active callbacks of the plugin can process.
+
+        @return: The event types, or None if a callback can process events of
+            any type.
+        @rtype: I{set} or None
+        """
+        if self._pluginProcess is not None:
+            return self._pluginProcess.eventTypes
+
+        eventTypes = set()
+        for callback in self:
+            if callback.isActive():
+                callbackEventTypes = callback.getEventTypes()
+                if callbackEventTypes is None:
+                    return None
+                eventTypes.update(callbackEventTypes)
+        return eventTypes
+
     def _updateLastEventId(self, event):
-        BACKLOG_TIMEOUT = (
-            5  # time in minutes after which we consider a pending event won't happen
-        )
         if self._lastEventId is not None and event["id"] > self._lastEventId + 1:
             event_date = event["created_at"].replace(tzinfo=None)
             if datetime.datetime.now() > (
@@ -952,7 +3016,11 @@ class Plugin(object):
             ):
                 # the event we've just processed happened more than BACKLOG_TIMEOUT minutes ago so any event
                 # with a lower id should have shown up in the EventLog by now if it actually happened
-                if event["id"] == self._lastEventId + 2:
+                if self._engine._eventTypeFilter is not None:
+                    # The gap is expected, the query left out event types no
+                    # callback is interested in.
+                    pass
+                elif event["id"] == self._lastEventId + 2:
                     self.logger.info(
                         "Event %d never happened - ignoring.", self._lastEventId + 1
                     )
@@ -969,11 +3037,24 @@ class Plugin(object):
                 expiration = datetime.datetime.now() + datetime.timedelta(
                     minutes=BACKLOG_TIMEOUT
                 )
-                for skippedId in range(self._lastEventId + 1, event["id"]):
-                    self.logger.info("Adding event id %d to backlog.", skippedId)
-                    self._backlog[skippedId] = expiration
+                first = self._lastEventId + 1
+                for filteredId in self._engine.getFilteredEventIds(
+                    first, event["id"] - 1
+                ):
+                    self._addToBacklog(first, filteredId - 1, expiration)
+                    first = filteredId + 1
+                self._addToBacklog(first, event["id"] - 1, expiration)
         self._lastEventId = event["id"]
 
+    def _addToBacklog(self, first, last, expiration):
+        if first > last:
+            return
+        if first == last:
+            self.logger.info("Adding event id %d to backlog.", first)
+        else:
+            self.logger.info("Adding event ids %d-%d to backlog.", first, last)
+        self._backlog.add(first, last, expiration)
+
     def __iter__(self):
         """
         A plugin is iterable and will iterate over all its L{Callback} objects.
@@ -1000,7 +3081,7 @@ class Registrar(object):
         Wrap a plugin so it can be passed to a user.
         """
         self._plugin = plugin
-        self._allowed = ["logger", "setEmails", "registerCallback"]
+        self._allowed = ["logger", "setEmails", "registerCallback", "getShotgun"]
 
     def getLogger(self):
         """
@@ -1030,24 +3111,35 @@ class Callback(object):
         callback,
         plugin,
         engine,
-        shotgun,
+        scriptName,
+        scriptKey,
         matchEvents=None,
         args=None,
         stopOnError=True,
+        batchWrites=False,
     ):
         """
         @param callback: The function to run when a Shotgun event occurs.
         @type callback: A function object.
         @param engine: The engine that will dispatch to this callback.
         @type engine: L{Engine}.
-        @param shotgun: The Shotgun instance that will be used to communicate
-            with your Shotgun server.
-        @type shotgun: L{sg.Shotgun}
+        @param scriptName: The name of the script the callback connects to
+            Shotgun as.
+        @type scriptName: I{str}
+        @param scriptKey: The key of the script.
+        @type scriptKey: I{str}
         @param matchEvents: The event filter to match events against before invoking callback.
         @type matchEvents: dict
         @param args: Any datastructure you would like to be passed to your
             callback function. Defaults to None.
         @type args: Any object.
+        @param stopOnError: Deactivate the callback, and its plugin, when it
+            fails.
+        @type stopOnError: I{bool}
+        @param batchWrites: Queue the update and create calls of the callback
+            and send them to Shotgun in batches, see
+            L{writeBatcher.BatchingShotgun}.
+        @type batchWrites: I{bool}
 
         @raise TypeError: If the callback is not a callable object.
         """
@@ -1057,15 +3149,23 @@ class Callback(object):
             )
 
         self._name = None
-        self._shotgun = shotgun
+        self._scriptName = scriptName
+        self._scriptKey = scriptKey
         self._callback = callback
         self._engine = engine
         self._logger = None
         self._matchEvents = matchEvents
         self._args = args
         self._stopOnError = stopOnError
+        self._batchWrites = batchWrites
+        self._plugin = plugin
         self._active = True
 
+        # Number of events processed, seconds spent processing them and
+        # number of errors, see L{getStats}.
+        self._stats = [0, 0.0, 0]
+        self._statsLock = threading.Lock()
+
         # Find a name for this object
         if hasattr(callback, "__name__"):
             self._name = callback.__name__
@@ -1080,6 +3180,42 @@ class Callback(object):
         self._logger = logging.getLogger(plugin.logger.name + "." + self._name)
         self._logger.config = self._engine.config
 
+    def getEventTypes(self):
+        """
+        Get the event types the callback can process.
+
+        @return: The event types, or None if the callback can process events of
+            any type.
+        @rtype: I{list} or None
+        """
+        if not self._matchEvents or "*" in self._matchEvents:
+            return None
+        return list(self._matchEvents.keys())
+
+    def getRoutes(self):
+        """
+        Get the event types and attribute names the callback can process.
+
+        @return: (event type, attribute name) tuples, with "*" for any event
+            type or attribute name, see L{EventRouter}.
+        @rtype: I{list} of I{tuple}
+        """
+        if not self._matchEvents:
+            return [("*", "*")]
+
+        if "*" in self._matchEvents:
+            matchEvents = {"*": self._matchEvents["*"]}
+        else:
+            matchEvents = self._matchEvents
+
+        routes = []
+        for eventType, attributes in matchEvents.items():
+            if attributes is None or "*" in attributes:
+                routes.append((eventType, "*"))
+            else:
+                routes.extend((eventType, name) for name in set(attributes))
+        return routes
+
     def canProcess(self, event):
         if not self._matchEvents:
             return True
@@ -1111,19 +3247,23 @@ class Callback(object):
         @param event: The Shotgun event to process.
         @type event: I{dict}
         """
+        shotgun = self._engine.acquireShotgun(self._scriptName, self._scriptKey)
+
         # set session_uuid for UI updates
         if self._engine._use_session_uuid:
-            self._shotgun.set_session_uuid(event["session_uuid"])
+            shotgun.set_session_uuid(event["session_uuid"])
+
+        sgHandle = self._engine._wrapShotgun(shotgun, event, self)
 
         if self._engine.timing_logger:
             start_time = datetime.datetime.now(SG_TIMEZONE.local)
 
+        processStart = time.time()
+        error = True
         try:
-            self._callback(self._shotgun, self._logger, event, self._args)
+            self._callback(sgHandle, self._logger, event, self._args)
             error = False
         except:
-            error = True
-
             # Get the local variables of the frame of our plugin
             tb = sys.exc_info()[2]
             stack = []
@@ -1137,6 +3277,15 @@ class Callback(object):
             )
             if self._stopOnError:
                 self._active = False
+        finally:
+            # A connection in use when the callback raised may be left in an
+            # unknown state, it isn't given to another callback.
+            self._engine.releaseShotgun(shotgun, discard=error)
+
+        with self._statsLock:
+            self._stats[0] += 1
+            self._stats[1] += time.time() - processStart
+            self._stats[2] += int(error)
 
         if self._engine.timing_logger:
             callback_name = self._logger.name.replace("plugin.", "")
@@ -1158,6 +3307,63 @@ class Callback(object):
 
         return self._active
 
+    def getStats(self):
+        """
+        Get statistics about the events the callback processed.
+
+        @return: The number of events processed, the number of seconds spent
+            processing them and the number of events which raised an error.
+        @rtype: A (I{int}, I{float}, I{int}) tuple.
+        """
+        with self._statsLock:
+            return tuple(self._stats)
+
+    def writeFailed(self, event, request):
+        """
+        Report a write queued by the callback which failed once it was sent,
+        see L{writeBatcher.WriteBatcher}. Called while the error is handled.
+
+        Like when the callback raises, the callback and its plugin are
+        deactivated and the event isn't saved as processed: it's put back in
+        the plugin's backlog. Without stopOnError, the event counts as
+        processed.
+
+        @param event: The event the write was made for.
+        @type event: I{dict}
+        @param request: The write, as a request of a batch call.
+        @type request: I{dict}
+        """
+        msg = "A write made processing event %d failed.\n\n%s\n\nRequest:\n\n%s"
+        self._logger.critical(
+            msg, event["id"], traceback.format_exc(), pprint.pformat(request)
+        )
+        with self._statsLock:
+            self._stats[2] += 1
+        if self._stopOnError:
+            self._active = False
+            self._plugin.setActive(False)
+            self._plugin.backlogEvent(event)
+
+    def writeNotSent(self, event, request):
+        """
+        Report a write queued by the callback which could not be sent, as the
+        engine was stopped while Shotgun could not be reached.
+
+        The event is put back in the plugin's backlog, so it's processed again
+        when the engine restarts.
+
+        @param event: The event the write was made for.
+        @type event: I{dict}
+        @param request: The write, as a request of a batch call.
+        @type request: I{dict}
+        """
+        self._logger.warning(
+            "A write made processing event %d could not be sent, the event will "
+            "be processed again.",
+            event["id"],
+        )
+        self._plugin.backlogEvent(event)
+
     def _prettyTimeDeltaFormat(self, time_delta):
         days, remainder = divmod(time_delta.total_seconds(), 86400)
         hours, remainder = divmod(remainder, 3600)
@@ -1190,6 +3396,195 @@ class Callback(object):
         return self._name
 
 
+class Replay(object):
+    """
+    Run a single plugin over a range of past events.
+
+    The plugin is loaded on its own in this process, with a state which is
+    never saved, so the cursors of a running daemon are left alone. Events
+    are read from the event journal where it covers them, otherwise they're
+    fetched from Shotgun in large pages, on a background thread while the
+    previous page is processed. Events touching different entities are
+    processed concurrently by the given number of workers, see
+    L{Plugin._processEventsByEntity}.
+    """
+
+    def __init__(
+        self, engine, pluginName, firstId, lastId, workers=1, pageSize=5000
+    ):
+        """
+        @param engine: The engine, which is never started.
+        @type engine: L{Engine}
+        @param pluginName: The name of the plugin, its file name without the
+            .py extension, looked up in the plugin paths.
+        @type pluginName: I{str}
+        @param firstId: The id of the first event to replay.
+        @type firstId: I{int}
+        @param lastId: The id of the last event to replay, included.
+        @type lastId: I{int}
+        @param workers: The number of events processed concurrently.
+        @type workers: I{int}
+        @param pageSize: The number of events fetched at once.
+        @type pageSize: I{int}
+        """
+        self._engine = engine
+        self._pluginName = pluginName
+        self._firstId = firstId
+        self._lastId = lastId
+        self._pageSize = pageSize
+        self._pages = queue.Queue(2)
+        self._running = False
+        self._plugin = None
+        self._processed = 0
+        self._elapsed = 0.0
+
+        # Run the plugin in this process, with its events grouped by entity
+        # when there are several workers.
+        self._engine._dispatch_mode = "serial"
+        self._engine._entity_workers = max(1, workers)
+
+    def run(self):
+        """
+        Replay the events.
+
+        @return: Whether the plugin processed every event without being
+            deactivated.
+        @rtype: I{bool}
+
+        @raise EventDaemonError: If the plugin can't be found or loaded.
+        """
+        self._engine._pluginWatcher.close()
+        self._plugin = self._loadPlugin()
+        self._engine._router = EventRouter([self._plugin])
+
+        eventTypes = self._plugin.getEventTypes()
+        if eventTypes:
+            self._engine._eventTypeFilter = sorted(eventTypes)
+        if self._engine._eventJournal is not None:
+            self._engine._eventJournal.setEventTypes(self._engine._eventTypeFilter)
+        self._plugin.setState(self._firstId - 1)
+
+        self._running = True
+        reader = threading.Thread(target=self._readPages, name="ReplayReader")
+        reader.daemon = True
+        reader.start()
+
+        finished = False
+        start = time.time()
+        try:
+            while True:
+                events = self._pages.get()
+                if events is None:
+                    finished = True
+                    break
+                with self._engine._requestScope(events):
+                    self._plugin.processEvents(events)
+                self._engine._flushWrites()
+                self._processed += len(events)
+                self._engine.log.info(
+                    "Replayed %d events, up to id %d.",
+                    self._processed,
+                    events[-1]["id"],
+                )
+                if not self._plugin.isActive():
+                    self._engine.log.error(
+                        "Plugin %s was deactivated, stopping the replay.",
+                        self._pluginName,
+                    )
+                    break
+        except KeyboardInterrupt:
+            self._engine.log.warning("Keyboard interrupt, stopping the replay.")
+        finally:
+            self._elapsed = time.time() - start
+            self._running = False
+            self._engine.stop()
+
+        return finished and self._plugin.isActive()
+
+    def getReport(self):
+        """
+        Get a summary of the replay: its throughput and the time spent in each
+        of the plugin's callbacks.
+
+        @rtype: I{list} of I{str}
+        """
+        rate = self._processed / self._elapsed if self._elapsed else 0.0
+        lines = [
+            "Replayed %d events of plugin %s in %.2f seconds, "
+            "%.1f events per second."
+            % (self._processed, self._pluginName, self._elapsed, rate)
+        ]
+        for callback in self._plugin or []:
+            count, seconds, errors = callback.getStats()
+            average = seconds * 1000 / count if count else 0.0
+            lines.append(
+                "  %s: %d events in %.2f seconds, %.2f ms per event, %d errors."
+                % (callback, count, seconds, average, errors)
+            )
+        return lines
+
+    def _loadPlugin(self):
+        for collection in self._engine._pluginCollections:
+            path = os.path.join(collection.path, self._pluginName + ".py")
+            if os.path.isfile(path):
+                break
+        else:
+            raise EventDaemonError(
+                "No plugin named %s was found in %s."
+                % (
+                    self._pluginName,
+                    ", ".join(c.path for c in self._engine._pluginCollections),
+                )
+            )
+
+        plugin = Plugin(self._engine, path)
+        plugin.load()
+        if not plugin.isActive():
+            raise EventDaemonError("Plugin %s could not be loaded." % path)
+        return plugin
+
+    def _readPages(self):
+        """
+        Read the pages of events to replay, from the journal where it covers
+        them and from Shotgun otherwise.
+        """
+        # The connection is used from this thread only.
+        shotgun = sg.Shotgun(
+            self._engine.config.getShotgunURL(),
+            self._engine.config.getEngineScriptName(),
+            self._engine.config.getEngineScriptKey(),
+            http_proxy=self._engine.config.getEngineProxyServer(),
+        )
+        journal = self._engine._eventJournal
+        nextId = self._firstId
+        try:
+            while self._running and nextId <= self._lastId:
+                limit = min(self._pageSize, self._lastId - nextId + 1)
+                events = []
+                coveredId = None
+                if journal is not None:
+                    events, coveredId = journal.get(nextId, limit)
+
+                if coveredId is not None:
+                    nextId = coveredId + 1
+                else:
+                    events = self._engine._fetchEvents(
+                        shotgun, nextId, limit, self._engine._eventTypeFilter
+                    )
+                    if not events:
+                        break
+                    nextId = events[-1]["id"] + 1
+
+                events = [event for event in events if event["id"] <= self._lastId]
+                if events:
+                    self._pages.put(events)
+        except Exception as err:
+            self._engine.log.critical(
+                "Could not read the events to replay.\n\n%s", traceback.format_exc(err)
+            )
+        self._pages.put(None)
+
+
 class CustomSMTPHandler(logging.handlers.SMTPHandler):
     """
     A custom SMTPHandler subclass that will adapt it's subject depending on the
@@ -1223,6 +3618,18 @@ class CustomSMTPHandler(logging.handlers.SMTPHandler):
 
         logging.handlers.SMTPHandler.__init__(self, *args)
 
+    def createLock(self):
+        """
+        Create the locks of the handler and its queue of emails to send.
+
+        This is called again after forking a plugin process, which then gets
+        a fresh queue and starts its own sending thread when needed.
+        """
+        logging.handlers.SMTPHandler.createLock(self)
+        self._queue = queue.Queue()
+        self._sender = None
+        self._senderLock = threading.Lock()
+
     def getSubject(self, record):
         subject = logging.handlers.SMTPHandler.getSubject(self, record)
         if record.levelno in self.LEVEL_SUBJECTS:
@@ -1233,13 +3640,58 @@ class CustomSMTPHandler(logging.handlers.SMTPHandler):
         """
         Emit a record.
 
-        Format the record and send it to the specified addressees.
+        Format the record and queue it to be sent to the specified addressees.
+        Talking to the SMTP server can take several seconds, it is done on a
+        separate thread so logging an error doesn't hold up the caller.
+        """
+        try:
+            msg = self.format(record)
+            subject = self.getSubject(record)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            self.handleError(record)
+            return
+
+        with self._senderLock:
+            if self._sender is None or not self._sender.is_alive():
+                self._sender = threading.Thread(
+                    target=self._runSender, name="CustomSMTPHandler"
+                )
+                self._sender.daemon = True
+                self._sender.start()
+
+        self._queue.put((record, subject, msg))
+
+    def close(self):
+        """
+        Send the queued emails, for at most a minute, and close the handler.
+        """
+        with self._senderLock:
+            if self._sender is not None and self._sender.is_alive():
+                self._queue.put(None)
+                self._sender.join(60)
+                self._sender = None
+        logging.handlers.SMTPHandler.close(self)
+
+    def _runSender(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            self._send(*item)
+
+    def _send(self, record, subject, msg):
+        """
+        Send a formatted record to the specified addressees.
         """
         # If the socket timeout isn't None, in Python 2.4 the socket read
         # following enabling starttls() will hang. The default timeout will
         # be reset to 60 later in 2 locations because Python 2.4 doesn't support
-        # except and finally in the same try block.
-        if CURRENT_PYTHON_VERSION >= PYTHON_25:
+        # except and finally in the same try block. Newer versions take a
+        # timeout for the SMTP connection only, which leaves the default
+        # timeout of the sockets other threads open alone.
+        if PYTHON_25 < CURRENT_PYTHON_VERSION < PYTHON_26:
             socket.setdefaulttimeout(None)
 
         # Mostly copied from Python 2.7 implementation.
@@ -1251,13 +3703,15 @@ class CustomSMTPHandler(logging.handlers.SMTPHandler):
             port = self.mailport
             if not port:
                 port = smtplib.SMTP_PORT
-            smtp = smtplib.SMTP()
+            if CURRENT_PYTHON_VERSION >= PYTHON_26:
+                smtp = smtplib.SMTP(timeout=60)
+            else:
+                smtp = smtplib.SMTP()
             smtp.connect(self.mailhost, port)
-            msg = self.format(record)
             msg = "From: %s\r\nTo: %s\r\nSubject: %s\r\nDate: %s\r\n\r\n%s" % (
                 self.fromaddr,
                 ",".join(self.toaddrs),
-                self.getSubject(record),
+                subject,
                 formatdate(),
                 msg,
             )
@@ -1270,12 +3724,14 @@ class CustomSMTPHandler(logging.handlers.SMTPHandler):
             smtp.sendmail(self.fromaddr, self.toaddrs, msg)
             smtp.close()
         except (KeyboardInterrupt, SystemExit):
-            socket.setdefaulttimeout(60)
+            if PYTHON_25 < CURRENT_PYTHON_VERSION < PYTHON_26:
+                socket.setdefaulttimeout(60)
             raise
         except:
             self.handleError(record)
 
-        socket.setdefaulttimeout(60)
+        if PYTHON_25 < CURRENT_PYTHON_VERSION < PYTHON_26:
+            socket.setdefaulttimeout(60)
 
 
 class EventDaemonError(Exception):
@@ -1294,6 +3750,14 @@ class ConfigError(EventDaemonError):
     pass
 
 
+class PluginProcessError(EventDaemonError):
+    """
+    Used when a plugin's process crashed or stopped answering.
+    """
+
+    pass
+
+
 if sys.platform == "win32":
 
     class WindowsService(win32serviceutil.ServiceFramework):
@@ -1374,6 +3838,9 @@ def main():
     if len(sys.argv) > 1:
         action = sys.argv[1]
 
+    if action == "replay":
+        return _replay(sys.argv[2:])
+
     if sys.platform == "win32" and action != "foreground":
         win32serviceutil.HandleCommandLine(WindowsService)
         return 0
@@ -1389,10 +3856,70 @@ def main():
 
         print("Unknown command: %s" % action)
 
-    print("usage: %s start|stop|restart|foreground" % sys.argv[0])
+    print("usage: %s start|stop|restart|foreground|replay" % sys.argv[0])
     return 2
 
 
+def _replay(args):
+    """
+    Run a plugin over a range of past events, see L{Replay}.
+
+    @param args: The command line arguments following the replay action.
+    @type args: I{list} of I{str}
+    """
+    parser = argparse.ArgumentParser(
+        prog="%s replay" % sys.argv[0],
+        description="Run a plugin over a range of past events, without "
+        "changing the last event ids of the running daemon.",
+    )
+    parser.add_argument("--plugin", required=True, help="the name of the plugin")
+    parser.add_argument(
+        "--from", dest="firstId", type=int, required=True, help="the first event id"
+    )
+    parser.add_argument(
+        "--to", dest="lastId", type=int, required=True, help="the last event id"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="the number of events processed concurrently, events of the same "
+        "entity are always processed in order (default: 1)",
+    )
+    parser.add_argument(
+        "--page-size",
+        dest="pageSize",
+        type=int,
+        default=5000,
+        help="the number of events fetched from Shotgun at once (default: 5000)",
+    )
+    options = parser.parse_args(args)
+    if options.firstId > options.lastId:
+        parser.error("--from must not be greater than --to")
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+    logging.getLogger().addHandler(handler)
+
+    try:
+        replay = Replay(
+            Engine(_getConfigPath()),
+            options.plugin,
+            options.firstId,
+            options.lastId,
+            options.workers,
+            max(1, options.pageSize),
+        )
+        success = replay.run()
+    except EventDaemonError as err:
+        print(err)
+        return 1
+
+    for line in replay.getReport():
+        print(line)
+    return 0 if success else 1
+
+
 def _getConfigPath():
     """
     Get the path of the shotgunEventDaemon configuration file.
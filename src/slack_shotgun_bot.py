@@ -1,4 +1,6 @@
 import os
+import threading
+from multiprocessing.pool import ThreadPool
 
 # import shotgun_api3
 from slackclient import SlackClient
@@ -9,6 +11,27 @@ slack_bot_user_id = os.environ["SLACK_BOT_USER_ID"]
 sc_bot = SlackClient(slack_bot_token)
 sc_user = SlackClient(slack_user_token)
 
+# Number of slack requests that can be in flight at once.
+slack_max_requests = int(os.environ.get("SLACK_MAX_REQUESTS", 8))
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """
+    Returns the thread pool slack requests are sent from.
+
+    The pool is created on first use, and again in any forked process since
+    the threads of the parent process don't exist there.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPool(slack_max_requests)
+            _pool_pid = os.getpid()
+    return _pool
+
 
 def send_message(channel, message, attachments=None):
     """
@@ -27,6 +50,55 @@ def send_message(channel, message, attachments=None):
     return slack_message
 
 
+def send_message_async(channel, message, attachments=None):
+    """
+    Sends a message as the the bot user without waiting for slack to answer,
+    so messages to several channels or users can be sent at once.
+
+    :param channel: A slack channel ID or user ID.
+    :param message: The slack message.
+    :returns: A result whose get() method waits for and returns the slack
+        response of send_message.
+    """
+    return _get_pool().apply_async(send_message, (channel, message, attachments))
+
+
+def send_user_messages(sg, users, logger, alert, message=None, attachments=None):
+    """
+    Sends a message as the bot user to several shotgun users at once, then
+    logs how each of them went.
+
+    :param sg: A shotgun connection instance.
+    :param users: The shotgun users, with their name, users without a slack
+        user ID are skipped.
+    :param logger: The logger to report to.
+    :param alert: What the message is, for the log, e.g. "New cc alert".
+    :param message: The slack message.
+    :returns: The slack responses, in the order of the users messaged.
+    """
+    results = []
+    for user in users:
+        slack_id = get_slack_user_id(sg, user["id"])
+        if slack_id:
+            results.append(
+                (user, send_message_async(slack_id, message, attachments=attachments))
+            )
+
+    slack_messages = []
+    for user, result in results:
+        slack_message = result.get()
+        if slack_message["ok"]:
+            logger.info("{} sent to {}.".format(alert, user["name"]))
+        elif slack_message["error"]:
+            logger.warning(
+                "{} to {} failed to send with error: {}".format(
+                    alert, user["name"], slack_message["error"]
+                )
+            )
+        slack_messages.append(slack_message)
+    return slack_messages
+
+
 def create_channel(channel_name, private=False):
     """
     Creates a new slack channel and returns the channel ID if successful.
@@ -0,0 +1,565 @@
+"""
+Persistent storage of the plugins' state for the Shotgun event daemon.
+
+The state of the daemon is a dictionary of plugin collection paths to
+dictionaries of plugin names to (last event id, backlog) tuples, where the
+backlog is a list of (first id, last id, expiration) ranges, see
+L{eventBacklog.EventBacklog.getRanges}. A store loads it when the daemon
+starts and saves it at every checkpoint.
+"""
+
+import datetime
+import os
+import sqlite3
+import struct
+import sys
+import traceback
+
+import eventBacklog
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+STATE_BACKENDS = ("pickle", "log", "sqlite")
+
+
+def createStateStore(backend, path, logger):
+    """
+    Create the state store for a backend.
+
+    @param backend: One of L{STATE_BACKENDS}.
+    @type backend: I{str}
+    @param path: The eventIdFile the state is stored at.
+    @type path: I{str}
+    @param logger: The logger to report problems to.
+    @type logger: A logging.Logger instance
+
+    @return: The state store.
+    @rtype: L{StateStore}
+    """
+    if backend == "log":
+        return LogStateStore(path, logger)
+    if backend == "sqlite":
+        return SqliteStateStore(path, logger)
+    return PickleStateStore(path, logger)
+
+
+class StateStore(object):
+    """
+    Base class of the state stores.
+    """
+
+    def __init__(self, path, logger):
+        """
+        @param path: The eventIdFile the state is stored at.
+        @type path: I{str}
+        @param logger: The logger to report problems to.
+        @type logger: A logging.Logger instance
+        """
+        self.path = path
+        self._logger = logger
+        self._persisted = {}
+
+    def load(self):
+        """
+        Load the state.
+
+        @return: The state, the last processed event id if an old-style id file
+            containing a single int was found, or None if there is no state.
+        @rtype: I{dict}, I{int} or None
+        """
+        raise NotImplementedError()
+
+    def save(self, state):
+        """
+        Save the state.
+
+        @param state: The state of all plugin collections.
+        @type state: I{dict}
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """
+        Release any resource held by the store.
+        """
+        pass
+
+    def _diff(self, state):
+        """
+        Compute what changed in the state since it was last persisted.
+
+        @param state: The state of all plugin collections.
+        @type state: I{dict}
+
+        @return: (kind, collection path, plugin name, value) records where kind
+            is "cursor" for a new last event id, "backlog_remove" for a list of
+            backlog ranges which changed or were removed and "backlog_add" for
+            a list of new backlog ranges, removals coming before additions. And
+            the plugin states which changed, to pass to L{_markPersisted} once
+            the records are written.
+        @rtype: A (I{list}, I{dict}) tuple.
+        """
+        records = []
+        changes = {}
+        for colPath, colState in state.items():
+            persisted = self._persisted.get(colPath, {})
+            for pluginName, pluginState in colState.items():
+                lastEventId, backlog = _splitState(pluginState)
+                backlog = eventBacklog.toRanges(backlog)
+                oldEventId, oldBacklog = persisted.get(pluginName, (None, []))
+
+                if lastEventId != oldEventId:
+                    records.append(("cursor", colPath, pluginName, lastEventId))
+
+                if backlog != oldBacklog:
+                    ranges = set(backlog)
+                    oldRanges = set(oldBacklog)
+                    removed = [r for r in oldBacklog if r not in ranges]
+                    added = [r for r in backlog if r not in oldRanges]
+                    if removed:
+                        records.append(("backlog_remove", colPath, pluginName, removed))
+                    if added:
+                        records.append(("backlog_add", colPath, pluginName, added))
+
+                if lastEventId != oldEventId or backlog != oldBacklog:
+                    changes[(colPath, pluginName)] = (lastEventId, backlog)
+        return records, changes
+
+    def _markPersisted(self, changes):
+        """
+        Consider the changes returned by L{_diff} persisted.
+        """
+        for (colPath, pluginName), pluginState in changes.items():
+            self._persisted.setdefault(colPath, {})[pluginName] = pluginState
+
+    def _remember(self, state):
+        """
+        Keep a copy of the persisted state to compute the next changes from.
+        """
+        self._persisted = {}
+        if not isinstance(state, dict):
+            return
+        for colPath, colState in state.items():
+            persisted = self._persisted[colPath] = {}
+            for pluginName, pluginState in colState.items():
+                lastEventId, backlog = _splitState(pluginState)
+                persisted[pluginName] = (lastEventId, eventBacklog.toRanges(backlog))
+
+
+class PickleStateStore(StateStore):
+    """
+    Stores the whole state as a single pickled dictionary.
+    """
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+
+        try:
+            fh = open(self.path, "rb")
+            try:
+                return pickle.load(fh)
+            except (pickle.UnpicklingError, EOFError, ValueError):
+                pass
+            finally:
+                fh.close()
+
+            # Backwards compatibility:
+            # Reopen the file to try to read an old-style int
+            fh = open(self.path)
+            try:
+                line = fh.readline().strip()
+            finally:
+                fh.close()
+        except (IOError, OSError) as err:
+            raise StateStoreError(
+                "Could not load event id from file.\n\n%s" % traceback.format_exc(err)
+            )
+
+        if line.isdigit():
+            # Got an old-style id file containing a single int which is the
+            # last id properly processed.
+            lastEventId = int(line)
+            self._logger.debug("Read last event id (%d) from file.", lastEventId)
+            return lastEventId
+
+        self._logger.warning("Could not read event id data from %s.", self.path)
+        return None
+
+    def save(self, state):
+        """
+        Save the state.
+
+        The data is written to a temporary file which then replaces the
+        previous one so a crash can't leave a truncated file behind.
+
+        @return: True if the state was written, False if it was not, the
+            error is logged.
+        @rtype: I{bool}
+        """
+        try:
+            tmpPath = self.path + ".tmp"
+            fh = open(tmpPath, "wb")
+            pickle.dump(state, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+            fh.close()
+            if sys.platform == "win32" and os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(tmpPath, self.path)
+        except (IOError, OSError) as err:
+            self._logger.error(
+                "Can not write event id data to %s.\n\n%s",
+                self.path,
+                traceback.format_exc(err),
+            )
+            return False
+        return True
+
+
+class LogStateStore(StateStore):
+    """
+    Stores the state as a snapshot plus an append-only log of changes.
+
+    The snapshot is a L{PickleStateStore} at the eventIdFile, so legacy
+    pickle and int id files are read as the initial snapshot. Every save
+    appends to the eventIdFile with a .log extension one record per plugin
+    cursor move and per batch of ranges added to or removed from a plugin's
+    backlog, so its cost depends on what changed rather than on the size of
+    the state. Once the log holds L{COMPACT_RECORDS} records, the state is
+    written as a new snapshot and the log is emptied, only once the snapshot
+    is on disk.
+
+    Records are idempotent, replaying the log over a snapshot which already
+    includes some of them is harmless.
+    """
+
+    COMPACT_RECORDS = 10000
+
+    _HEADER = struct.Struct(">I")
+
+    def __init__(self, path, logger):
+        super(LogStateStore, self).__init__(path, logger)
+        self._snapshot = PickleStateStore(path, logger)
+        self._logPath = path + ".log"
+        self._logFile = None
+        self._records = 0
+
+    def load(self):
+        state = self._snapshot.load()
+        records = self._readLog()
+
+        if not records:
+            self._remember(state)
+            return state
+
+        if not isinstance(state, dict):
+            # Records can only be applied to a state dictionary. Plugins
+            # without any record get the old-style last event id.
+            lastEventId = state
+            state = {}
+        else:
+            lastEventId = None
+
+        for record in records:
+            self._apply(state, record, lastEventId)
+
+        self._remember(state)
+        self._records = len(records)
+        return state
+
+    def save(self, state):
+        records, changes = self._diff(state)
+        if not records:
+            return
+
+        if self._records + len(records) >= self.COMPACT_RECORDS:
+            # The records are appended instead if the snapshot can't be
+            # written.
+            if self._compact(state):
+                return
+
+        size = None
+        try:
+            if self._logFile is None:
+                self._logFile = open(self._logPath, "ab")
+            size = os.fstat(self._logFile.fileno()).st_size
+            self._logFile.write("".join(self._encode(record) for record in records))
+            self._logFile.flush()
+            os.fsync(self._logFile.fileno())
+        except (IOError, OSError) as err:
+            self._logger.error(
+                "Can not write event id data to %s.\n\n%s",
+                self._logPath,
+                traceback.format_exc(err),
+            )
+            # Drop any partially written record, which would hide the records
+            # appended after it, and try a snapshot instead.
+            self._truncateLog(size)
+            self._compact(state)
+            return
+
+        self._records += len(records)
+        self._markPersisted(changes)
+
+    def close(self):
+        if self._logFile is not None:
+            self._logFile.close()
+            self._logFile = None
+
+    def _compact(self, state):
+        """
+        Write the whole state as a new snapshot and empty the log.
+
+        The log is left alone if the snapshot can't be written.
+
+        @return: True if the snapshot was written.
+        @rtype: I{bool}
+        """
+        self.close()
+        if not self._snapshot.save(state):
+            return False
+
+        self._truncateLog(0)
+        self._records = 0
+        self._remember(state)
+        return True
+
+    def _truncateLog(self, size):
+        """
+        Truncate the log to a number of bytes, if known.
+        """
+        if size is None or not os.path.exists(self._logPath):
+            return
+        self.close()
+        try:
+            fh = open(self._logPath, "r+b")
+            try:
+                fh.truncate(size)
+            finally:
+                fh.close()
+        except (IOError, OSError) as err:
+            self._logger.error(
+                "Can not truncate %s.\n\n%s", self._logPath, traceback.format_exc(err)
+            )
+
+    def _readLog(self):
+        """
+        Read the records of the log.
+
+        A record which was only partially written when the daemon died is
+        dropped, along with anything after it, and truncated from the log.
+        """
+        if not os.path.exists(self._logPath):
+            return []
+
+        try:
+            fh = open(self._logPath, "rb")
+            try:
+                data = fh.read()
+            finally:
+                fh.close()
+        except (IOError, OSError) as err:
+            raise StateStoreError(
+                "Could not read %s.\n\n%s" % (self._logPath, traceback.format_exc(err))
+            )
+
+        records = []
+        offset = 0
+        while offset + self._HEADER.size <= len(data):
+            (size,) = self._HEADER.unpack_from(data, offset)
+            start = offset + self._HEADER.size
+            if start + size > len(data):
+                break
+            try:
+                records.append(pickle.loads(data[start : start + size]))
+            except Exception:
+                break
+            offset = start + size
+
+        if offset != len(data):
+            self._logger.warning(
+                "Ignoring %d bytes of incomplete records at the end of %s.",
+                len(data) - offset,
+                self._logPath,
+            )
+            # The records appended from now on would be hidden behind them.
+            self._truncateLog(offset)
+        return records
+
+    def _apply(self, state, record, defaultEventId):
+        kind, colPath, pluginName, value = record
+        colState = state.setdefault(colPath, {})
+        lastEventId, backlog = _splitState(
+            colState.get(pluginName, (defaultEventId, []))
+        )
+        backlog = eventBacklog.EventBacklog(backlog)
+
+        if kind == "cursor":
+            lastEventId = value
+        elif kind == "backlog_add":
+            for first, last, expiration in value:
+                backlog.add(first, last, expiration)
+        elif kind == "backlog_remove":
+            for first, last, expiration in value:
+                backlog.discard(first, last)
+
+        colState[pluginName] = (lastEventId, backlog.getRanges())
+
+    def _encode(self, record):
+        data = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+        return self._HEADER.pack(len(data)) + data
+
+
+class SqliteStateStore(StateStore):
+    """
+    Stores the state in a SQLite database.
+
+    The database is the eventIdFile with a .sqlite extension. It holds one row
+    per plugin in the plugin_state table and one row per range of backlogged
+    event ids in the backlog_ranges table. A save only touches the rows which
+    changed, in a single transaction.
+
+    The database is in WAL mode so other processes, like monitoring tools,
+    can read the state while the daemon writes it, e.g.::
+
+        SELECT plugin, last_event_id, updated FROM plugin_state;
+
+    When the database is empty, a pickle or int eventIdFile is loaded instead
+    so upgrading to this backend doesn't lose the state.
+    """
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS plugin_state (
+            collection TEXT NOT NULL,
+            plugin TEXT NOT NULL,
+            last_event_id INTEGER,
+            updated TIMESTAMP,
+            PRIMARY KEY (collection, plugin)
+        )""",
+        """CREATE TABLE IF NOT EXISTS backlog_ranges (
+            collection TEXT NOT NULL,
+            plugin TEXT NOT NULL,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            expiration TIMESTAMP,
+            PRIMARY KEY (collection, plugin, first_id)
+        )""",
+    )
+
+    def __init__(self, path, logger):
+        super(SqliteStateStore, self).__init__(path, logger)
+        self._dbPath = path + ".sqlite"
+        self._connection = None
+
+    def load(self):
+        try:
+            connection = self._connect()
+            state = {}
+            for colPath, pluginName, lastEventId in connection.execute(
+                "SELECT collection, plugin, last_event_id FROM plugin_state"
+            ):
+                state.setdefault(colPath, {})[pluginName] = (lastEventId, [])
+            for colPath, pluginName, first, last, expiration in connection.execute(
+                "SELECT collection, plugin, first_id, last_id, expiration "
+                "FROM backlog_ranges ORDER BY first_id"
+            ):
+                colState = state.setdefault(colPath, {})
+                lastEventId, backlog = colState.setdefault(pluginName, (None, []))
+                backlog.append((first, last, expiration))
+        except sqlite3.Error as err:
+            raise StateStoreError(
+                "Could not load state from %s.\n\n%s"
+                % (self._dbPath, traceback.format_exc(err))
+            )
+
+        if state:
+            self._remember(state)
+            return state
+
+        # Nothing in the database yet, the next save writes every row.
+        self._persisted = {}
+        state = PickleStateStore(self.path, self._logger).load()
+        if state is not None:
+            self._logger.info("Importing state from %s.", self.path)
+        return state
+
+    def save(self, state):
+        records, changes = self._diff(state)
+        if not records:
+            return
+
+        now = datetime.datetime.now()
+        try:
+            connection = self._connect()
+            with connection:
+                for kind, colPath, pluginName, value in records:
+                    if kind == "cursor":
+                        connection.execute(
+                            "INSERT OR REPLACE INTO plugin_state "
+                            "(collection, plugin, last_event_id, updated) "
+                            "VALUES (?, ?, ?, ?)",
+                            (colPath, pluginName, value, now),
+                        )
+                    elif kind == "backlog_add":
+                        connection.executemany(
+                            "INSERT OR REPLACE INTO backlog_ranges "
+                            "(collection, plugin, first_id, last_id, expiration) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            [
+                                (colPath, pluginName, first, last, expiration)
+                                for first, last, expiration in value
+                            ],
+                        )
+                    elif kind == "backlog_remove":
+                        connection.executemany(
+                            "DELETE FROM backlog_ranges "
+                            "WHERE collection = ? AND plugin = ? AND first_id = ?",
+                            [(colPath, pluginName, r[0]) for r in value],
+                        )
+        except sqlite3.Error as err:
+            self._logger.error(
+                "Can not write event id data to %s.\n\n%s",
+                self._dbPath,
+                traceback.format_exc(err),
+            )
+            # The transaction was rolled back, the next save writes the same
+            # changes again.
+            return
+
+        self._markPersisted(changes)
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            connection = sqlite3.connect(
+                self._dbPath, detect_types=sqlite3.PARSE_DECLTYPES
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+
+def _splitState(pluginState):
+    if isinstance(pluginState, tuple):
+        return pluginState
+    return pluginState, []
+
+
+class StateStoreError(Exception):
+    """
+    Used when the state can't be read.
+    """
+
+    pass
@@ -0,0 +1,262 @@
+"""
+Batching of the writes made by callbacks.
+
+Plugins which update or create an entity for every event they process make
+one round trip to Shotgun per event, hundreds in a row when the daemon
+catches up on a backlog. Callbacks registered with batchWrites get a Shotgun
+handle, a L{BatchingShotgun}, whose update and create calls are queued in a
+L{WriteBatcher} and sent to Shotgun together with a single batch call.
+"""
+
+import copy
+import socket
+import threading
+import time
+
+import shotgun_api3 as sg
+
+import connectionPool
+
+
+class WriteBatcher(object):
+    """
+    The writes queued by callbacks, waiting to be sent to Shotgun.
+
+    The writes are sent when one is queued while there are maxSize of them or
+    the oldest was queued maxAge seconds ago. The engine also sends them at
+    the end of every page of events and before saving its state, see
+    L{flush}, so no event is saved as processed before its writes were
+    acknowledged by Shotgun.
+
+    Consecutive writes made as the same script and with the same session are
+    sent with a single batch call, in the order they were queued. Shotgun
+    runs a batch in a transaction: when it fails, each of its writes is sent
+    again on its own and those which still fail are reported to the callback
+    which queued them, see L{Callback.writeFailed}. Connection errors are
+    retried instead, until the engine is stopped. The writes still queued
+    then are reported with L{Callback.writeNotSent}.
+    """
+
+    def __init__(self, engine, maxSize, maxAge):
+        """
+        @param engine: The engine the connections to send the writes with are
+            leased from.
+        @type engine: L{Engine}
+        @param maxSize: The number of queued writes at which they're sent.
+        @type maxSize: I{int}
+        @param maxAge: The number of seconds after which a queued write is
+            sent.
+        @type maxAge: I{float}
+        """
+        self._engine = engine
+        self._maxSize = maxSize
+        self._maxAge = maxAge
+        self.reset()
+
+    def reset(self):
+        """
+        Drop every queued write and recreate the locks.
+
+        Used after forking, the locks may have been held by another thread of
+        the parent process.
+        """
+        self._lock = threading.Lock()
+        self._flushLock = threading.Lock()
+        self._writes = []
+        self._failures = 0
+
+    def add(self, callback, event, shotgun, request):
+        """
+        Queue a write, and send the queued writes if there are enough of them
+        or they're old enough.
+
+        @param callback: The callback making the write.
+        @type callback: L{Callback}
+        @param event: The event the write is made for.
+        @type event: I{dict}
+        @param shotgun: The connection the write is made with, which gives the
+            script and session to send it as.
+        @type shotgun: L{shotgun_api3.Shotgun}
+        @param request: The write, as a request of a batch call.
+        @type request: I{dict}
+        """
+        key = (
+            shotgun.config.script_name,
+            shotgun.config.api_key,
+            shotgun.config.session_uuid,
+        )
+        now = time.time()
+        with self._lock:
+            self._writes.append((key, callback, event, request, now))
+            due = self._isDue(now)
+        if due:
+            self.flush()
+
+    def flushIfDue(self):
+        """
+        Send the queued writes if there are enough of them or they're old
+        enough.
+
+        The engine calls it for every event processed, so the writes don't
+        wait for the end of the page once callbacks stop queueing new ones.
+        """
+        with self._lock:
+            due = self._isDue(time.time())
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Send the queued writes, and wait for them to be acknowledged.
+
+        Writes being sent by another thread are waited for as well.
+
+        @return: The number of writes which failed or could not be sent since
+            the batcher was created. It only changes once the failed writes
+            were reported to their callbacks.
+        @rtype: I{int}
+        """
+        with self._flushLock:
+            with self._lock:
+                writes = self._writes
+                self._writes = []
+
+            start = 0
+            for end in range(1, len(writes) + 1):
+                if end == len(writes) or writes[end][0] != writes[start][0]:
+                    self._failures += self._send(writes[start:end])
+                    start = end
+            return self._failures
+
+    def __len__(self):
+        return len(self._writes)
+
+    def _isDue(self, now):
+        return bool(self._writes) and (
+            len(self._writes) >= self._maxSize
+            or now - self._writes[0][4] >= self._maxAge
+        )
+
+    def _send(self, writes):
+        """
+        Send writes made as the same script and with the same session.
+
+        @return: The number of writes which failed or could not be sent.
+        @rtype: I{int}
+        """
+        scriptName, scriptKey, sessionUuid = writes[0][0]
+        writes = list(writes)
+        failures = 0
+        batched = len(writes) > 1
+        conn_attempts = 0
+        while writes:
+            shotgun = None
+            discard = False
+            try:
+                shotgun = self._engine.acquireShotgun(scriptName, scriptKey)
+                shotgun.set_session_uuid(sessionUuid)
+                # Drops the entities written to from the entity cache.
+                sgHandle = self._engine._wrapShotgun(shotgun)
+                if batched:
+                    try:
+                        sgHandle.batch([write[3] for write in writes])
+                        return failures
+                    except (sg.ProtocolError, socket.error):
+                        raise
+                    except Exception:
+                        # None of the writes were made, find out which ones
+                        # fail.
+                        batched = False
+
+                while writes:
+                    key, callback, event, request, queueTime = writes[0]
+                    try:
+                        sgHandle.batch([request])
+                    except (sg.ProtocolError, socket.error):
+                        raise
+                    except Exception:
+                        callback.writeFailed(event, request)
+                        failures += 1
+                    writes.pop(0)
+            except (
+                sg.ProtocolError,
+                socket.error,
+                connectionPool.ConnectionPoolError,
+            ) as err:
+                # The connection may be left in an unknown state. The pool may
+                # also have none to spare while the callback sending the writes
+                # holds the last one, that's retried the same way.
+                discard = True
+                conn_attempts = self._engine._checkConnectionAttempts(
+                    conn_attempts, str(err)
+                )
+                if not self._engine._continue:
+                    break
+            finally:
+                if shotgun is not None:
+                    self._engine.releaseShotgun(shotgun, discard)
+
+        for key, callback, event, request, queueTime in writes:
+            callback.writeNotSent(event, request)
+            failures += 1
+        return failures
+
+
+class BatchingShotgun(object):
+    """
+    A Shotgun connection used by a callback to process an event, whose update
+    and create calls are queued in a L{WriteBatcher}.
+
+    Queued calls return the data written along with the type of the entity,
+    and its id for an update. The id of a created entity isn't known until
+    the write is sent. Reads made through the connection don't see the
+    queued writes.
+    """
+
+    def __init__(self, shotgun, batcher, callback, event):
+        """
+        @param shotgun: The connection to wrap.
+        @type shotgun: L{shotgun_api3.Shotgun}
+        @param batcher: The batcher to queue writes in.
+        @type batcher: L{WriteBatcher}
+        @param callback: The callback using the connection.
+        @type callback: L{Callback}
+        @param event: The event the connection is used for.
+        @type event: I{dict}
+        """
+        self._shotgun = shotgun
+        self._batcher = batcher
+        self._callback = callback
+        self._event = event
+
+    def __getattr__(self, name):
+        return getattr(self._shotgun, name)
+
+    def update(self, entity_type, entity_id, data, multi_entity_update_modes=None):
+        request = {
+            "request_type": "update",
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "data": copy.deepcopy(data),
+        }
+        if multi_entity_update_modes:
+            request["multi_entity_update_modes"] = multi_entity_update_modes
+        self._batcher.add(self._callback, self._event, self._shotgun, request)
+
+        record = copy.deepcopy(data)
+        record.update({"type": entity_type, "id": entity_id})
+        return record
+
+    def create(self, entity_type, data, return_fields=None):
+        request = {
+            "request_type": "create",
+            "entity_type": entity_type,
+            "data": copy.deepcopy(data),
+        }
+        if return_fields:
+            request["return_fields"] = return_fields
+        self._batcher.add(self._callback, self._event, self._shotgun, request)
+
+        record = copy.deepcopy(data)
+        record["type"] = entity_type
+        return record
@@ -0,0 +1,431 @@
+"""
+A fake Shotgun site for the tests, and a base class for the tests running an
+engine against it.
+
+The site keeps its entities in memory. Every connection created while a test
+runs, by the engine or its connection pool, talks to the site of the test
+through L{FakeShotgun}. Plugins report the events they process by appending
+to a file, so processes forked by the process dispatch mode can report them
+too.
+"""
+
+import copy
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import unittest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.insert(0, SRC)
+
+import shotgun_api3 as sg  # noqa: E402
+
+import shotgunEventDaemon  # noqa: E402
+
+
+class FakeSite(object):
+    """
+    The entities of a fake Shotgun site and the calls made to it.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.tables = {}
+        self.calls = []
+        self.failures = []
+        self.latency = 0
+
+    def addEvents(self, events):
+        for event in events:
+            self.add("EventLogEntry", event)
+
+    def add(self, entityType, record):
+        with self.lock:
+            record = dict(record, type=entityType)
+            self.tables.setdefault(entityType, {})[record["id"]] = record
+            return record
+
+    def get(self, entityType, entityId):
+        return self.tables.get(entityType, {}).get(entityId)
+
+    def getCalls(self, method=None, entityType=None):
+        """
+        @return: The (method, entity type, filters, fields, limit, row count)
+            of the calls made to the site, of a method and entity type.
+        @rtype: I{list} of tuples
+        """
+        with self.lock:
+            return [
+                call
+                for call in self.calls
+                if (method is None or call[0] == method)
+                and (entityType is None or call[1] == entityType)
+            ]
+
+    def call(self, method, entityType, filters=None, fields=None, limit=0):
+        """
+        Record a call, and raise the next failure if any.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            if self.failures:
+                raise self.failures.pop(0)
+            call = [method, entityType, copy.deepcopy(filters), fields, limit, 0]
+            self.calls.append(call)
+            return call
+
+    def find(self, entityType, filters, fields, order, limit):
+        call = self.call("find", entityType, filters, fields, limit)
+        with self.lock:
+            records = [
+                record
+                for record in self.tables.get(entityType, {}).values()
+                if _match(record, filters)
+            ]
+            for sort in reversed(order or [{"field_name": "id"}]):
+                field = sort.get("field_name", sort.get("column"))
+                records.sort(
+                    key=lambda record: record.get(field),
+                    reverse=sort.get("direction") == "desc",
+                )
+            if limit:
+                records = records[:limit]
+            call[5] = len(records)
+            return [_project(record, fields) for record in records]
+
+    def update(self, entityType, entityId, data):
+        self.call("update", entityType, [["id", "is", entityId]], list(data))
+        with self.lock:
+            record = self.get(entityType, entityId)
+            if record is None:
+                raise sg.Fault("%s %s does not exist." % (entityType, entityId))
+            record.update(copy.deepcopy(data))
+            return _project(record, list(data))
+
+    def create(self, entityType, data, returnFields):
+        self.call("create", entityType, None, list(data))
+        with self.lock:
+            ids = self.tables.get(entityType, {})
+            record = dict(copy.deepcopy(data), id=max(ids or [0]) + 1)
+            self.add(entityType, record)
+            return _project(record, list(data) + list(returnFields or []))
+
+
+class FakeShotgun(object):
+    """
+    A connection to the site of the running test, in place of
+    L{sg.Shotgun}.
+    """
+
+    site = None
+
+    def __init__(self, base_url, script_name=None, api_key=None, **kwargs):
+        self.base_url = base_url
+        self.config = _FakeConfig(script_name, api_key)
+        self.closed = False
+
+    def set_session_uuid(self, session_uuid):
+        self.config.session_uuid = session_uuid
+
+    def close(self):
+        self.closed = True
+
+    def info(self):
+        self.site.call("info", None)
+        return {"version": [8, 0, 0]}
+
+    def find(self, entity_type, filters, fields=None, order=None, limit=0, **kwargs):
+        return self.site.find(entity_type, filters, fields, order, limit)
+
+    def find_one(self, entity_type, filters, fields=None, order=None, **kwargs):
+        records = self.site.find(entity_type, filters, fields, order, 1)
+        return records[0] if records else None
+
+    def update(self, entity_type, entity_id, data, **kwargs):
+        return self.site.update(entity_type, entity_id, data)
+
+    def create(self, entity_type, data, return_fields=None):
+        return self.site.create(entity_type, data, return_fields)
+
+    def batch(self, requests):
+        self.site.call("batch", None, None, None, len(requests))
+        results = []
+        for request in requests:
+            if request["request_type"] == "update":
+                results.append(
+                    self.update(
+                        request["entity_type"], request["entity_id"], request["data"]
+                    )
+                )
+            else:
+                results.append(
+                    self.create(
+                        request["entity_type"],
+                        request["data"],
+                        request.get("return_fields"),
+                    )
+                )
+        return results
+
+
+class _FakeConfig(object):
+    def __init__(self, script_name, api_key):
+        self.script_name = script_name
+        self.api_key = api_key
+        self.session_uuid = None
+
+
+def _match(record, filters):
+    for condition in filters:
+        if isinstance(condition, dict):
+            results = [_match(record, [c]) for c in condition["filters"]]
+            if condition["filter_operator"] == "any":
+                if not any(results):
+                    return False
+            elif not all(results):
+                return False
+            continue
+
+        field, relation, values = condition[0], condition[1], condition[2:]
+        value = record.get(field)
+        if isinstance(value, dict):
+            value = (value.get("type"), value.get("id"))
+        if relation == "is":
+            if isinstance(values[0], dict):
+                values = [(values[0].get("type"), values[0].get("id"))]
+            if value != values[0]:
+                return False
+        elif relation == "in":
+            if value not in values[0]:
+                return False
+        elif relation == "not_in":
+            if value in values[0]:
+                return False
+        elif relation == "greater_than":
+            if value is None or value <= values[0]:
+                return False
+        elif relation == "between":
+            if value is None or not values[0][0] <= value <= values[0][1]:
+                return False
+        else:
+            raise sg.Fault("Unsupported filter relation %s." % relation)
+    return True
+
+
+def _project(record, fields):
+    result = {"type": record["type"], "id": record["id"]}
+    for field in fields or []:
+        result[field] = copy.deepcopy(record.get(field))
+    return result
+
+
+def makeEvents(firstId, lastId, eventType="Shotgun_Task_Change", age=3600, **fields):
+    """
+    Make events about Tasks, one Task per event unless an entity id is given.
+
+    @param age: The number of seconds since the events were created.
+    """
+    createdAt = datetime.datetime.now() - datetime.timedelta(seconds=age)
+    events = []
+    for eventId in range(firstId, lastId + 1):
+        entityId = fields.get("entity_id", eventId)
+        event = {
+            "id": eventId,
+            "event_type": eventType,
+            "attribute_name": "sg_status_list",
+            "meta": {
+                "type": "attribute_change",
+                "entity_type": "Task",
+                "entity_id": entityId,
+            },
+            "entity": {"type": "Task", "id": entityId},
+            "user": None,
+            "project": {"type": "Project", "id": 1},
+            "session_uuid": None,
+            "created_at": createdAt,
+        }
+        event.update(fields)
+        event.pop("entity_id", None)
+        events.append(event)
+    return events
+
+
+CONFIG = """
+[daemon]
+pidFile: %(directory)s/shotgunEventDaemon.pid
+eventIdFile: %(directory)s/shotgunEventDaemon.id
+logMode: 1
+logPath: %(directory)s/logs
+logFile: shotgunEventDaemon
+logging: 10
+timing_log: off
+conn_retry_sleep = 1
+max_conn_retries = 5
+fetch_interval = 0.1
+min_fetch_interval = 0.05
+max_event_batch_size = 10
+%(daemon)s
+
+[shotgun]
+server: https://shotgun.test
+name: engine
+key: engineKey
+proxy_server:
+use_session_uuid: False
+%(shotgun)s
+
+[plugins]
+paths: %(directory)s/plugins
+watcher: poll
+
+[emails]
+server:
+from:
+to:
+subject:
+"""
+
+RECORDING_PLUGIN = """
+import os
+import time
+
+def registerCallbacks(reg):
+    reg.registerCallback(
+        "script", "scriptKey", record, %(matchEvents)r, None, %(options)s
+    )
+
+def record(sg, logger, event, args):
+    time.sleep(%(sleep)r)
+    %(body)s
+    fh = open(%(recordPath)r, "a")
+    fh.write("%(name)s %%d\\n" %% event["id"])
+    fh.close()
+"""
+
+
+class EngineTestCase(unittest.TestCase):
+    """
+    Runs an engine against a L{FakeSite}.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.pluginsPath = os.path.join(self.directory, "plugins")
+        os.mkdir(self.pluginsPath)
+        self.recordPath = os.path.join(self.directory, "record")
+        self.site = FakeSite()
+        FakeShotgun.site = self.site
+        self._shotgun = sg.Shotgun
+        sg.Shotgun = FakeShotgun
+        self.engine = None
+
+    def tearDown(self):
+        sg.Shotgun = self._shotgun
+        FakeShotgun.site = None
+        shutil.rmtree(self.directory)
+
+    def createEngine(self, daemon="", shotgun="", lastEventId=None):
+        """
+        Create an engine, with extra lines for the daemon and shotgun sections
+        of its config.
+
+        @param lastEventId: The id of the last processed event, saved as an
+            old-style id file.
+        """
+        path = os.path.join(self.directory, "shotgunEventDaemon.conf")
+        fh = open(path, "w")
+        fh.write(
+            CONFIG
+            % {
+                "directory": self.directory,
+                "daemon": textwrap.dedent(daemon),
+                "shotgun": textwrap.dedent(shotgun),
+            }
+        )
+        fh.close()
+        if lastEventId is not None:
+            fh = open(os.path.join(self.directory, "shotgunEventDaemon.id"), "w")
+            fh.write("%d\n" % lastEventId)
+            fh.close()
+        self.engine = shotgunEventDaemon.Engine(path)
+        return self.engine
+
+    def writePlugin(
+        self, name, matchEvents=None, sleep=0, body="", options="", source=None
+    ):
+        """
+        Write a plugin whose callback records the events it processes.
+
+        @param body: Code run by the callback before recording the event,
+            with sg, logger, event and args defined, and os and time
+            imported.
+        @param options: Extra arguments of registerCallback.
+        @param source: The source of the plugin, instead of a recording one.
+        """
+        if source is None:
+            source = RECORDING_PLUGIN % {
+                "name": name,
+                "matchEvents": matchEvents,
+                "sleep": sleep,
+                "body": body or "pass",
+                "options": options,
+                "recordPath": self.recordPath,
+            }
+        path = os.path.join(self.pluginsPath, name + ".py")
+        fh = open(path, "w")
+        fh.write(textwrap.dedent(source))
+        fh.close()
+        return path
+
+    def getRecord(self, name=None):
+        """
+        @return: The ids of the events processed by a plugin, in the order
+            they were processed.
+        @rtype: I{list} of I{int}
+        """
+        if not os.path.exists(self.recordPath):
+            return []
+        fh = open(self.recordPath)
+        try:
+            lines = [line.split() for line in fh if line.endswith("\n")]
+        finally:
+            fh.close()
+        return [int(eventId) for plugin, eventId in lines if name in (None, plugin)]
+
+    def runEngine(self, until, timeout=10):
+        """
+        Run the engine until a condition is met or a timeout elapsed.
+
+        @param until: Called until it returns True.
+        @type until: A function object.
+
+        @return: Whether the condition was met.
+        @rtype: I{bool}
+        """
+        thread = threading.Thread(target=self.engine.start)
+        thread.daemon = True
+        thread.start()
+        end = time.time() + timeout
+        while time.time() < end and not until():
+            time.sleep(0.01)
+        self.engine.stop()
+        thread.join(timeout)
+        self.assertFalse(thread.is_alive(), "The engine did not stop.")
+        return until()
+
+    def getState(self):
+        """
+        @return: The state of the plugins, by plugin name.
+        @rtype: I{dict}
+        """
+        state = {}
+        for collection in self.engine._pluginCollections:
+            for plugin in collection:
+                state[plugin.getName()] = plugin.getState()
+        return state
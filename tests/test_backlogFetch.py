@@ -0,0 +1,81 @@
+import shotgun_api3 as sg
+
+import fakeShotgun
+
+
+class TestBacklogFetch(fakeShotgun.EngineTestCase):
+    def getBacklogCalls(self):
+        return [
+            call
+            for call in self.site.getCalls("find", "EventLogEntry")
+            if isinstance(call[2][0], dict)
+        ]
+
+    def test_backlogEventShowsUp(self):
+        # Recent events, the missing one may still show up.
+        self.site.addEvents(fakeShotgun.makeEvents(100, 104, age=0))
+        self.site.addEvents(fakeShotgun.makeEvents(106, 110, age=0))
+        self.writePlugin("plugin")
+        self.createEngine(lastEventId=99)
+
+        def until():
+            record = self.getRecord()
+            if len(record) == 10 and not self.site.get("EventLogEntry", 105):
+                self.site.addEvents(fakeShotgun.makeEvents(105, 105, age=0))
+            return len(record) == 11
+
+        self.assertTrue(self.runEngine(until))
+        self.assertEqual(self.getRecord()[-1], 105)
+        self.assertEqual(self.getState(), {"plugin": (110, [])})
+
+        # The page of new events keeps moving forward from the cursor.
+        for call in self.site.getCalls("find", "EventLogEntry"):
+            if call in self.getBacklogCalls():
+                self.assertEqual(call[2][0]["filters"], [["id", "between", [105, 105]]])
+            else:
+                self.assertIn(call[2][0][2], (99, 104, 110))
+
+    def test_manyRanges(self):
+        # Odd ids are backlogged, the lowest one never shows up.
+        ranges = [(eventId, eventId) for eventId in range(101, 301, 2)]
+        self.site.addEvents(fakeShotgun.makeEvents(102, 300))
+        engine = self.createEngine()
+
+        fetched = []
+        for _ in range(20):
+            events = engine._fetchBacklogEvents(ranges, 301)
+            if not events:
+                break
+            fetched.extend(event["id"] for event in events)
+            ranges = [r for r in ranges if r[0] not in fetched]
+
+        self.assertEqual(fetched, list(range(103, 301, 2)))
+        self.assertEqual(ranges, [(101, 101)])
+        # Only the backlogged events were transferred, and at most
+        # MAX_BACKLOG_RANGES ranges were looked up at once.
+        calls = self.getBacklogCalls()
+        self.assertEqual(sum(call[5] for call in calls), len(fetched))
+        for call in calls:
+            self.assertLessEqual(
+                len(call[2][0]["filters"]), engine.MAX_BACKLOG_RANGES
+            )
+
+    def test_rangesBeyondNextEventId(self):
+        self.site.addEvents(fakeShotgun.makeEvents(100, 120))
+        engine = self.createEngine()
+
+        events = engine._fetchBacklogEvents([(105, 106), (110, 115)], 112)
+
+        self.assertEqual([event["id"] for event in events], [105, 106, 110, 111])
+
+    def test_errors(self):
+        self.site.addEvents(fakeShotgun.makeEvents(100, 120))
+        engine = self.createEngine()
+
+        for error in (sg.Fault("API read() failed."), ValueError("Bad filter")):
+            self.site.failures.append(error)
+            self.assertEqual(engine._fetchBacklogEvents([(105, 106)], 121), [])
+
+        # The backlogs are looked up again at the next pass.
+        events = engine._fetchBacklogEvents([(105, 106)], 121)
+        self.assertEqual([event["id"] for event in events], [105, 106])
@@ -0,0 +1,80 @@
+import os
+
+import fakeShotgun
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+class TestCheckpoint(fakeShotgun.EngineTestCase):
+    def countSaves(self, engine):
+        """
+        Count the saves of the state of an engine.
+        """
+        saves = []
+        saveEventIdData = engine._saveEventIdData
+
+        def countingSave():
+            saves.append(engine._uncheckpointedEvents)
+            saveEventIdData()
+
+        engine._saveEventIdData = countingSave
+        return saves
+
+    def loadState(self):
+        fh = open(os.path.join(self.directory, "shotgunEventDaemon.id"), "rb")
+        try:
+            return pickle.load(fh)
+        finally:
+            fh.close()
+
+    def test_groupCommit(self):
+        self.writePlugin("plugin")
+        self.site.addEvents(fakeShotgun.makeEvents(100, 129))
+        engine = self.createEngine(
+            "checkpoint_events = 10\ncheckpoint_interval = 60000", lastEventId=99
+        )
+        saves = self.countSaves(engine)
+
+        self.assertTrue(self.runEngine(lambda: len(self.getRecord()) == 30))
+
+        # One save per 10 events, and the one made on shutdown.
+        self.assertEqual(saves[:3], [10, 10, 10])
+        self.assertLessEqual(len(saves), 5)
+        self.assertEqual(self.loadState()[self.pluginsPath]["plugin"][0], 129)
+
+    def test_interval(self):
+        self.writePlugin("plugin", sleep=0.2)
+        self.site.addEvents(fakeShotgun.makeEvents(100, 104))
+        engine = self.createEngine(
+            "checkpoint_events = 1000\ncheckpoint_interval = 100", lastEventId=99
+        )
+        saves = self.countSaves(engine)
+
+        self.assertTrue(self.runEngine(lambda: len(self.getRecord()) == 5))
+
+        # The events take longer than the interval to process.
+        self.assertGreaterEqual(len(saves), 5)
+        self.assertEqual(saves[:4], [1, 1, 1, 1])
+
+    def test_atomicWrite(self):
+        self.writePlugin("plugin")
+        self.site.addEvents(fakeShotgun.makeEvents(100, 104))
+        self.createEngine(lastEventId=99)
+        path = os.path.join(self.directory, "shotgunEventDaemon.id")
+
+        self.assertTrue(self.runEngine(lambda: len(self.getRecord()) == 5))
+
+        self.assertEqual(self.loadState()[self.pluginsPath]["plugin"][0], 104)
+        self.assertFalse(os.path.exists(path + ".tmp"))
+
+        # The state can't be written over a directory, the previous one is
+        # left untouched.
+        os.mkdir(path + ".tmp")
+        self.site.addEvents(fakeShotgun.makeEvents(105, 109))
+        self.createEngine()
+        self.assertTrue(self.runEngine(lambda: len(self.getRecord()) == 10))
+
+        self.assertEqual(self.loadState()[self.pluginsPath]["plugin"][0], 104)
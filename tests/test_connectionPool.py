@@ -0,0 +1,113 @@
+import logging
+import threading
+import time
+import unittest
+
+import fakeShotgun
+import shotgun_api3 as sg
+
+import connectionPool
+
+
+SERVER = "https://shotgun.test"
+
+
+def getLogger():
+    logger = logging.getLogger("test_connectionPool")
+    if not logger.handlers:
+        logger.addHandler(logging.NullHandler())
+        logger.propagate = False
+    return logger
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.site = fakeShotgun.FakeSite()
+        fakeShotgun.FakeShotgun.site = self.site
+        self._shotgun = sg.Shotgun
+        sg.Shotgun = fakeShotgun.FakeShotgun
+
+    def tearDown(self):
+        sg.Shotgun = self._shotgun
+        fakeShotgun.FakeShotgun.site = None
+
+    def createPool(self, maxIdle=4, checkInterval=0, maxConnections=0, timeout=0):
+        return connectionPool.ConnectionPool(
+            maxIdle, checkInterval, getLogger(), maxConnections, timeout
+        )
+
+    def test_reuse(self):
+        pool = self.createPool()
+        connection = pool.acquire(SERVER, "script", "key")
+        connection.set_session_uuid("uuid")
+        pool.release(connection)
+
+        self.assertIs(pool.acquire(SERVER, "script", "key"), connection)
+        self.assertIsNone(connection.config.session_uuid)
+        self.assertIsNot(pool.acquire(SERVER, "other", "key"), connection)
+
+    def test_maxIdle(self):
+        pool = self.createPool(maxIdle=1)
+        first = pool.acquire(SERVER, "script", "key")
+        second = pool.acquire(SERVER, "script", "key")
+        pool.release(first)
+        pool.release(second)
+
+        self.assertFalse(first.closed)
+        self.assertTrue(second.closed)
+
+    def test_checkIdle(self):
+        pool = self.createPool(checkInterval=0.01)
+        connection = pool.acquire(SERVER, "script", "key")
+        pool.release(connection)
+        time.sleep(0.02)
+        self.site.failures.append(sg.ProtocolError(SERVER, 502, "Bad Gateway", {}))
+
+        newConnection = pool.acquire(SERVER, "script", "key")
+
+        self.assertIsNot(newConnection, connection)
+        self.assertTrue(connection.closed)
+
+    def test_limit(self):
+        pool = self.createPool(maxConnections=1, timeout=0.1)
+        connection = pool.acquire(SERVER, "script", "key")
+
+        start = time.time()
+        self.assertRaises(
+            connectionPool.ConnectionPoolError, pool.acquire, SERVER, "script", "key"
+        )
+        self.assertGreaterEqual(time.time() - start, 0.1)
+        # The limit is per script.
+        pool.release(pool.acquire(SERVER, "other", "key"))
+
+        # Discarded connections don't count either.
+        pool.release(connection, discard=True)
+        self.assertIsNot(pool.acquire(SERVER, "script", "key"), connection)
+
+    def test_limitWaits(self):
+        pool = self.createPool(maxConnections=1)
+        connection = pool.acquire(SERVER, "script", "key")
+        timer = threading.Timer(0.05, pool.release, (connection,))
+        timer.start()
+
+        self.assertIs(pool.acquire(SERVER, "script", "key"), connection)
+        timer.join()
+
+    def test_connectFailed(self):
+        pool = self.createPool(maxConnections=1, timeout=0.1)
+        shotgun = sg.Shotgun
+
+        def fail(*args, **kwargs):
+            raise ValueError("Bad url")
+
+        sg.Shotgun = fail
+        try:
+            self.assertRaises(ValueError, pool.acquire, SERVER, "script", "key")
+        finally:
+            sg.Shotgun = shotgun
+
+        pool.acquire(SERVER, "script", "key")
+
+
+if __name__ == "__main__":
+    unittest.main()
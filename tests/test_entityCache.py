@@ -0,0 +1,161 @@
+import os
+import sys
+import threading
+import unittest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.insert(0, SRC)
+
+import entityCache  # noqa: E402
+
+
+class FakeShotgun(object):
+    """
+    Serves the Tasks of a dictionary, and records the calls made.
+    """
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self.calls = []
+
+    def find_one(self, entity_type, filters, fields=None, **kwargs):
+        self.calls.append(("find_one", filters, fields, kwargs))
+        task = self.tasks.get(filters[0][2])
+        if task is None:
+            return None
+        record = {"type": entity_type, "id": filters[0][2]}
+        for field in fields or []:
+            record[field] = task.get(field)
+        return record
+
+    def update(self, entity_type, entity_id, data):
+        self.calls.append(("update", entity_id, data))
+        self.tasks[entity_id].update(data)
+        return dict(data, type=entity_type, id=entity_id)
+
+
+def makeEvent(eventType, entityId, attributeName=None):
+    return {
+        "event_type": eventType,
+        "attribute_name": attributeName,
+        "meta": {"entity_type": "Task", "entity_id": entityId},
+        "entity": {"type": "Task", "id": entityId},
+    }
+
+
+class TestEntityCache(unittest.TestCase):
+    def setUp(self):
+        self.shotgun = FakeShotgun(
+            {
+                1: {"content": "Anim", "sg_status_list": "ip"},
+                2: {"content": "Comp", "sg_status_list": "wtg"},
+            }
+        )
+        self.cache = entityCache.EntityCache(100)
+        self.cached = entityCache.CachedShotgun(self.shotgun, self.cache)
+
+    def read(self, entityId, fields):
+        return self.cached.find_one("Task", [["id", "is", entityId]], fields)
+
+    def getFetched(self):
+        return [call[2] for call in self.shotgun.calls if call[0] == "find_one"]
+
+    def test_cached(self):
+        self.assertEqual(
+            self.read(1, ["content"]), {"type": "Task", "id": 1, "content": "Anim"}
+        )
+        self.read(1, ["content", "sg_status_list"])
+        record = self.read(1, ["sg_status_list", "content"])
+
+        self.assertEqual(record["sg_status_list"], "ip")
+        # Only the fields which weren't cached were fetched.
+        self.assertEqual(self.getFetched(), [["content"], ["sg_status_list"]])
+
+    def test_copies(self):
+        self.read(1, ["content"])["content"] = "Changed"
+
+        self.assertEqual(self.read(1, ["content"])["content"], "Anim")
+
+    def test_uncachedReads(self):
+        self.cached.find_one("Task", [["id", "is", 1]], ["project.Project.name"])
+        self.cached.find_one("Task", [["id", "is", 1]], ["updated_at"])
+        self.cached.find_one("Task", [["content", "is", "Anim"]], ["content"])
+        self.cached.find_one("Task", [["id", "is", 1]], ["content"], order=[{}])
+
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(len(self.getFetched()), 4)
+
+    def test_changeEvent(self):
+        self.read(1, ["content", "sg_status_list"])
+        self.read(2, ["sg_status_list"])
+        self.shotgun.tasks[1]["sg_status_list"] = "fin"
+        self.cache.invalidate([makeEvent("Shotgun_Task_Change", 1, "sg_status_list")])
+
+        self.assertEqual(self.read(1, ["sg_status_list"])["sg_status_list"], "fin")
+        self.read(1, ["content"])
+        self.read(2, ["sg_status_list"])
+        self.assertEqual(len(self.getFetched()), 3)
+
+    def test_retirementEvent(self):
+        self.read(1, ["content", "sg_status_list"])
+        self.cache.invalidate([makeEvent("Shotgun_Task_Retirement", 1)])
+
+        self.assertEqual(len(self.cache), 0)
+
+    def test_update(self):
+        self.read(1, ["content", "sg_status_list"])
+        self.cached.update("Task", 1, {"sg_status_list": "fin"})
+
+        self.assertEqual(self.read(1, ["sg_status_list"])["sg_status_list"], "fin")
+        self.assertEqual(len(self.getFetched()), 2)
+
+    def test_eventTypes(self):
+        self.cache.setEventTypes(["Shotgun_Task_Change", "Shotgun_Task_Retirement"])
+        self.read(1, ["content"])
+
+        self.assertEqual(len(self.cache), 1)
+
+        # Some Task changes may not be fetched anymore.
+        self.cache.setEventTypes(["Shotgun_Task_Change"])
+
+        self.assertEqual(len(self.cache), 0)
+        self.read(1, ["content"])
+        self.assertEqual(len(self.cache), 0)
+
+    def test_eviction(self):
+        self.cache = entityCache.EntityCache(2)
+        self.cached = entityCache.CachedShotgun(self.shotgun, self.cache)
+        self.read(1, ["content"])
+        self.read(2, ["content"])
+        # Task 1 becomes the most recently used.
+        self.read(1, ["content"])
+        self.read(2, ["sg_status_list"])
+
+        self.assertEqual(len(self.cache), 2)
+        self.read(1, ["content"])
+        self.assertEqual(len(self.getFetched()), 3)
+
+    def test_changedWhileFetching(self):
+        fetching = threading.Event()
+        changed = threading.Event()
+
+        def fetch(missing):
+            fetching.set()
+            changed.wait(5)
+            return {"type": "Task", "id": 1, "sg_status_list": "ip"}
+
+        thread = threading.Thread(
+            target=self.cache.get, args=("Task", 1, ["sg_status_list"], fetch)
+        )
+        thread.start()
+        fetching.wait(5)
+        self.cache.invalidate([makeEvent("Shotgun_Task_Change", 1, "sg_status_list")])
+        changed.set()
+        thread.join(5)
+
+        # The value fetched may predate the change, it wasn't cached.
+        self.assertEqual(len(self.cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
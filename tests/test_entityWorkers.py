@@ -0,0 +1,78 @@
+import threading
+
+import fakeShotgun
+
+
+class TestEntityWorkers(fakeShotgun.EngineTestCase):
+    def addEvents(self, firstId, lastId, entities):
+        """
+        Add events about a few Tasks, in turn.
+        """
+        for eventId in range(firstId, lastId + 1):
+            self.site.addEvents(
+                fakeShotgun.makeEvents(
+                    eventId, eventId, entity_id=eventId % entities + 1
+                )
+            )
+
+    def test_orderPerEntity(self):
+        self.addEvents(100, 129, 3)
+        self.writePlugin("plugin", sleep=0.01)
+        self.createEngine("entity_workers = 4", lastEventId=99)
+
+        self.assertTrue(self.runEngine(lambda: len(self.getRecord()) == 30))
+
+        record = self.getRecord()
+        self.assertEqual(sorted(record), list(range(100, 130)))
+        for entity in range(3):
+            events = [eventId for eventId in record if eventId % 3 == entity]
+            self.assertEqual(events, sorted(events))
+        self.assertEqual(self.getState(), {"plugin": (129, [])})
+
+    def test_cursorStopsAtFailure(self):
+        self.addEvents(100, 109, 5)
+        body = "if event['id'] == 104: raise ValueError('Bad event')"
+        self.writePlugin("plugin", body=body)
+        self.createEngine("entity_workers = 4", lastEventId=99)
+
+        def until():
+            plugins = list(self.engine._pluginCollections[0])
+            return plugins and not plugins[0].isActive()
+
+        self.assertTrue(self.runEngine(until))
+
+        # Events of the other Tasks may have been processed by other threads,
+        # but the cursor doesn't move past the failed one.
+        self.assertNotIn(104, self.getRecord())
+        self.assertNotIn(109, self.getRecord())
+        self.assertLess(self.getState()["plugin"][0], 104)
+
+    def test_threadsStopped(self):
+        threads = threading.active_count()
+        self.addEvents(100, 109, 5)
+        path = self.writePlugin("plugin")
+        self.createEngine("entity_workers = 4", lastEventId=99)
+
+        plugin = []
+
+        def until():
+            if len(self.getRecord()) < 10:
+                return False
+            if not plugin:
+                plugin.extend(self.engine._pluginCollections[0])
+                # The plugin is unloaded when its file goes away.
+                fakeShotgun.os.remove(path)
+            return plugin[0]._entityPool is None
+
+        self.assertTrue(self.runEngine(until))
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_threadsStoppedWithEngine(self):
+        threads = threading.active_count()
+        self.addEvents(100, 109, 5)
+        self.writePlugin("plugin")
+        self.createEngine("entity_workers = 4", lastEventId=99)
+
+        self.assertTrue(self.runEngine(lambda: len(self.getRecord()) == 10))
+
+        self.assertEqual(threading.active_count(), threads)
@@ -0,0 +1,130 @@
+import datetime
+import os
+import sys
+import unittest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.insert(0, SRC)
+
+import eventBacklog  # noqa: E402
+
+
+NOW = datetime.datetime(2020, 1, 1)
+SOON = NOW + datetime.timedelta(minutes=1)
+LATER = NOW + datetime.timedelta(minutes=5)
+AFTER_SOON = SOON + datetime.timedelta(seconds=1)
+
+
+class TestEventBacklog(unittest.TestCase):
+    def test_add(self):
+        backlog = eventBacklog.EventBacklog()
+        backlog.add(10, 19, SOON)
+        backlog.add(30, 30, SOON)
+
+        self.assertEqual(len(backlog), 11)
+        self.assertEqual(backlog.getRanges(), [(10, 19, SOON), (30, 30, SOON)])
+        self.assertEqual(backlog.getFirstId(), 10)
+        self.assertEqual(backlog.getLastId(), 30)
+        self.assertIn(10, backlog)
+        self.assertIn(19, backlog)
+        self.assertNotIn(20, backlog)
+        self.assertNotIn(9, backlog)
+
+    def test_addEmptyRange(self):
+        backlog = eventBacklog.EventBacklog()
+        backlog.add(10, 9, SOON)
+
+        self.assertEqual(len(backlog), 0)
+        self.assertEqual(backlog.getRanges(), [])
+        self.assertIsNone(backlog.getFirstId())
+        self.assertIsNone(backlog.getLastId())
+
+    def test_addOverlapping(self):
+        backlog = eventBacklog.EventBacklog()
+        backlog.add(10, 19, SOON)
+        backlog.add(15, 24, LATER)
+
+        self.assertEqual(len(backlog), 15)
+        self.assertEqual(backlog.getRanges(), [(10, 14, SOON), (15, 24, LATER)])
+
+    def test_discard(self):
+        backlog = eventBacklog.EventBacklog()
+        backlog.add(10, 19, SOON)
+        backlog.discard(12)
+        backlog.discard(15, 16)
+
+        self.assertEqual(len(backlog), 7)
+        self.assertEqual(
+            backlog.getRanges(),
+            [(10, 11, SOON), (13, 14, SOON), (17, 19, SOON)],
+        )
+        self.assertNotIn(12, backlog)
+        self.assertNotIn(16, backlog)
+
+    def test_discardAcrossRanges(self):
+        backlog = eventBacklog.EventBacklog()
+        backlog.add(10, 19, SOON)
+        backlog.add(30, 39, LATER)
+        backlog.discard(15, 34)
+
+        self.assertEqual(len(backlog), 10)
+        self.assertEqual(backlog.getRanges(), [(10, 14, SOON), (35, 39, LATER)])
+
+    def test_discardMissing(self):
+        backlog = eventBacklog.EventBacklog()
+        backlog.add(10, 19, SOON)
+        backlog.discard(5)
+        backlog.discard(20, 25)
+
+        self.assertEqual(backlog.getRanges(), [(10, 19, SOON)])
+
+    def test_expire(self):
+        backlog = eventBacklog.EventBacklog()
+        backlog.add(10, 19, SOON)
+        backlog.add(30, 39, LATER)
+
+        self.assertEqual(backlog.expire(NOW), [])
+        self.assertEqual(backlog.expire(AFTER_SOON), [(10, 19)])
+        self.assertEqual(backlog.getRanges(), [(30, 39, LATER)])
+        self.assertEqual(len(backlog), 10)
+
+    def test_expireSplitRange(self):
+        backlog = eventBacklog.EventBacklog()
+        backlog.add(10, 19, SOON)
+        backlog.discard(15)
+
+        expired = backlog.expire(LATER)
+
+        self.assertEqual(sorted(expired), [(10, 14), (16, 19)])
+        self.assertEqual(backlog.getRanges(), [])
+        self.assertEqual(len(backlog), 0)
+
+    def test_expireChangedRange(self):
+        backlog = eventBacklog.EventBacklog()
+        backlog.add(10, 19, SOON)
+        backlog.add(10, 19, LATER)
+
+        self.assertEqual(backlog.expire(AFTER_SOON), [])
+        self.assertEqual(backlog.getRanges(), [(10, 19, LATER)])
+
+    def test_state(self):
+        backlog = eventBacklog.EventBacklog()
+        backlog.add(10, 19, SOON)
+        backlog.add(30, 30, LATER)
+
+        copy = eventBacklog.EventBacklog(backlog.getRanges())
+
+        self.assertEqual(copy.getRanges(), backlog.getRanges())
+        self.assertEqual(len(copy), len(backlog))
+
+    def test_toRangesFromDict(self):
+        state = {10: SOON, 11: SOON, 12: LATER, 14: LATER}
+
+        self.assertEqual(
+            eventBacklog.toRanges(state),
+            [(10, 11, SOON), (12, 12, LATER), (14, 14, LATER)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
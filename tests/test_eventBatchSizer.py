@@ -0,0 +1,66 @@
+import fakeShotgun
+import shotgunEventDaemon
+
+
+class TestEventBatchSizer(fakeShotgun.EngineTestCase):
+    def createSizer(self, latestEventId):
+        self.site.addEvents(fakeShotgun.makeEvents(latestEventId, latestEventId))
+        engine = self.createEngine(
+            "min_event_batch_size = 10\n"
+            "max_event_batch_size = 100\n"
+            "target_batch_time = 1"
+        )
+        return shotgunEventDaemon.EventBatchSizer(engine)
+
+    def test_caughtUp(self):
+        sizer = self.createSizer(1000)
+
+        self.assertEqual(sizer.getSize(), 100)
+
+        sizer.update(fakeShotgun.makeEvents(995, 1000), False)
+
+        self.assertEqual(sizer.getSize(), 10)
+
+    def test_lagging(self):
+        sizer = self.createSizer(1000)
+
+        # Processing an event takes 50ms, a page of 20 takes a second.
+        sizer.recordFetch(0.01)
+        sizer.recordDispatch(10, 0.5)
+        sizer.update(fakeShotgun.makeEvents(101, 110), True)
+
+        self.assertEqual(sizer.getSize(), 20)
+
+        # Much faster events, the page size is capped.
+        for _ in range(20):
+            sizer.recordDispatch(10, 0.0)
+        sizer.update(fakeShotgun.makeEvents(111, 130), True)
+
+        self.assertEqual(sizer.getSize(), 100)
+
+    def test_slowFetches(self):
+        sizer = self.createSizer(1000)
+
+        # Pages take four times as long to process as to fetch.
+        sizer.recordFetch(1)
+        sizer.recordDispatch(10, 0.5)
+        sizer.update(fakeShotgun.makeEvents(101, 110), True)
+
+        self.assertEqual(sizer.getSize(), 80)
+
+    def test_almostCaughtUp(self):
+        sizer = self.createSizer(115)
+
+        sizer.recordDispatch(10, 0.0)
+        sizer.update(fakeShotgun.makeEvents(101, 110), True)
+
+        # The 5 events left, but at least a minimal page.
+        self.assertEqual(sizer.getSize(), 10)
+
+    def test_latestIdCached(self):
+        sizer = self.createSizer(1000)
+
+        sizer.update(fakeShotgun.makeEvents(101, 110), True)
+        sizer.update(fakeShotgun.makeEvents(111, 120), True)
+
+        self.assertEqual(len(self.site.getCalls("find", "EventLogEntry")), 1)
@@ -0,0 +1,112 @@
+import os
+import sys
+import time
+import unittest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.insert(0, SRC)
+
+import eventCache  # noqa: E402
+
+
+def makeEvents(*ids):
+    return [{"id": eventId} for eventId in ids]
+
+
+def getIds(events):
+    return [event["id"] for event in events]
+
+
+class TestEventCache(unittest.TestCase):
+    def test_get(self):
+        cache = eventCache.EventCache(100, 0)
+        # Ids 13 and 14 had no event of the fetched types.
+        cache.add(10, makeEvents(10, 11, 12, 15))
+
+        events, lastId = cache.get(11, 10)
+
+        self.assertEqual(getIds(events), [11, 12, 15])
+        self.assertEqual(lastId, 15)
+
+        events, lastId = cache.get(13, 10)
+
+        self.assertEqual(getIds(events), [15])
+        self.assertEqual(lastId, 15)
+
+    def test_notCovered(self):
+        cache = eventCache.EventCache(100, 0)
+        cache.add(10, makeEvents(10, 11))
+
+        self.assertEqual(cache.get(9, 10), ([], None))
+        self.assertEqual(cache.get(12, 10), ([], None))
+
+    def test_adjacentPages(self):
+        cache = eventCache.EventCache(100, 0)
+        cache.add(10, makeEvents(10, 12))
+        cache.add(13, makeEvents(14, 15))
+        # A gap between 15 and 20.
+        cache.add(20, makeEvents(20, 21))
+
+        events, lastId = cache.get(11, 10)
+
+        self.assertEqual(getIds(events), [12, 14, 15])
+        self.assertEqual(lastId, 15)
+
+    def test_limit(self):
+        cache = eventCache.EventCache(100, 0)
+        cache.add(10, makeEvents(10, 11, 12))
+        cache.add(13, makeEvents(13, 14))
+
+        events, lastId = cache.get(10, 4)
+
+        # The events are only complete up to the last one returned.
+        self.assertEqual(getIds(events), [10, 11, 12, 13])
+        self.assertEqual(lastId, 13)
+
+    def test_overlappingPage(self):
+        cache = eventCache.EventCache(100, 0)
+        cache.add(10, makeEvents(10, 11))
+        cache.add(12, makeEvents(12, 13))
+        cache.add(14, makeEvents(14, 15))
+        # Fetched again from 11, 12 is gone. The pages it overlaps are
+        # dropped.
+        cache.add(11, makeEvents(11, 13))
+
+        self.assertEqual(len(cache), 4)
+        self.assertEqual(cache.get(10, 10), ([], None))
+        events, lastId = cache.get(11, 10)
+
+        self.assertEqual(getIds(events), [11, 13, 14, 15])
+        self.assertEqual(lastId, 15)
+
+    def test_evictForSpace(self):
+        cache = eventCache.EventCache(4, 0)
+        cache.add(10, makeEvents(10, 11))
+        cache.add(12, makeEvents(12, 13))
+        cache.add(14, makeEvents(14, 15))
+
+        self.assertEqual(len(cache), 4)
+        self.assertEqual(cache.get(10, 10), ([], None))
+        self.assertEqual(getIds(cache.get(12, 10)[0]), [12, 13, 14, 15])
+
+    def test_evictForAge(self):
+        cache = eventCache.EventCache(100, 0.2)
+        cache.add(10, makeEvents(10, 11))
+        time.sleep(0.3)
+        cache.add(12, makeEvents(12, 13))
+
+        self.assertEqual(cache.get(10, 10), ([], None))
+        self.assertEqual(getIds(cache.get(12, 10)[0]), [12, 13])
+        self.assertEqual(len(cache), 2)
+
+    def test_clear(self):
+        cache = eventCache.EventCache(100, 0)
+        cache.add(10, makeEvents(10, 11))
+        cache.clear()
+
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get(10, 10), ([], None))
+
+
+if __name__ == "__main__":
+    unittest.main()
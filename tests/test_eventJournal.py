@@ -0,0 +1,205 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.insert(0, SRC)
+
+import eventJournal  # noqa: E402
+
+
+MEGABYTE = 1024 * 1024
+
+
+def getLogger():
+    logger = logging.getLogger("test_eventJournal")
+    if not logger.handlers:
+        logger.addHandler(logging.NullHandler())
+        logger.propagate = False
+    return logger
+
+
+def makeEvents(firstId, lastId):
+    return [
+        {"id": eventId, "event_type": "Shotgun_Task_Change", "meta": {"n": eventId}}
+        for eventId in range(firstId, lastId + 1)
+    ]
+
+
+class TestEventJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.journals = []
+        self.indexInterval = eventJournal.JournalSegment.INDEX_INTERVAL
+
+    def tearDown(self):
+        eventJournal.JournalSegment.INDEX_INTERVAL = self.indexInterval
+        for journal in self.journals:
+            journal.close()
+        shutil.rmtree(self.directory)
+
+    def createJournal(self, maxAge=0):
+        journal = eventJournal.EventJournal(
+            self.directory, 64 * MEGABYTE, 0, maxAge, getLogger()
+        )
+        self.journals.append(journal)
+        return journal
+
+    def getSegmentPath(self, firstId):
+        return os.path.join(
+            self.directory, "%020d%s" % (firstId, eventJournal.JournalSegment.EXTENSION)
+        )
+
+    def age(self, path, seconds):
+        mtime = time.time() - seconds
+        os.utime(path, (mtime, mtime))
+
+    def truncate(self, path, count):
+        """
+        Drop the last count bytes of a file, like a write interrupted when the
+        daemon died.
+        """
+        fh = open(path, "r+b")
+        try:
+            fh.truncate(os.path.getsize(path) - count)
+        finally:
+            fh.close()
+
+    def test_get(self):
+        journal = self.createJournal()
+        journal.append(1, makeEvents(1, 10))
+        journal.append(11, makeEvents(11, 20))
+
+        self.assertEqual(journal.get(5, 100), (makeEvents(5, 20), 20))
+        self.assertEqual(journal.get(5, 3), (makeEvents(5, 7), 7))
+        self.assertEqual(journal.get(21, 100), ([], None))
+
+    def test_reopen(self):
+        journal = self.createJournal()
+        journal.append(1, makeEvents(1, 10))
+        journal.close()
+
+        journal = self.createJournal()
+
+        self.assertEqual(journal.get(1, 100), (makeEvents(1, 10), 10))
+
+    def test_recoverTruncatedSegment(self):
+        journal = self.createJournal()
+        journal.append(1, makeEvents(1, 10))
+        journal.close()
+        self.truncate(self.getSegmentPath(1), 5)
+
+        journal = self.createJournal()
+
+        self.assertEqual(journal.get(1, 100), (makeEvents(1, 9), 9))
+
+        # The incomplete record is replaced by the events appended next.
+        journal.append(10, makeEvents(10, 15))
+        journal.close()
+        journal = self.createJournal()
+
+        self.assertEqual(journal.get(1, 100), (makeEvents(1, 15), 15))
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_recoverTruncatedRecordHeader(self):
+        journal = self.createJournal()
+        journal.append(1, makeEvents(1, 10))
+        journal.close()
+        path = self.getSegmentPath(1)
+        size = os.path.getsize(path)
+
+        journal.append(11, makeEvents(11, 11))
+        journal.close()
+        self.truncate(path, os.path.getsize(path) - size - 3)
+
+        journal = self.createJournal()
+
+        self.assertEqual(journal.get(1, 100), (makeEvents(1, 10), 10))
+
+    def test_recoverTruncatedIndex(self):
+        # Index every record.
+        eventJournal.JournalSegment.INDEX_INTERVAL = 1
+        journal = self.createJournal()
+        journal.append(1, makeEvents(1, 10))
+        journal.close()
+        self.truncate(self.getSegmentPath(1), 5)
+
+        journal = self.createJournal()
+
+        self.assertEqual(journal.get(1, 100), (makeEvents(1, 9), 9))
+        self.assertEqual(journal.get(9, 100), (makeEvents(9, 9), 9))
+
+        journal.append(10, makeEvents(10, 15))
+        journal.close()
+        journal = self.createJournal()
+
+        self.assertEqual(journal.get(1, 100), (makeEvents(1, 15), 15))
+        self.assertEqual(journal.get(12, 100), (makeEvents(12, 15), 15))
+
+    def test_ignoreCorruptedSegment(self):
+        path = self.getSegmentPath(1)
+        fh = open(path, "wb")
+        fh.write(b"SG")
+        fh.close()
+
+        journal = self.createJournal()
+
+        self.assertEqual(journal.get(1, 100), ([], None))
+        journal.append(1, makeEvents(1, 10))
+        self.assertEqual(journal.get(1, 100), (makeEvents(1, 10), 10))
+
+    def test_retentionWhileAppending(self):
+        journal = self.createJournal(maxAge=3600)
+        journal.append(1, makeEvents(1, 10))
+        # Events which don't follow the last segment start a new one.
+        journal.append(21, makeEvents(21, 30))
+        self.age(self.getSegmentPath(1), 7200)
+
+        journal.append(31, makeEvents(31, 40))
+
+        self.assertTrue(os.path.exists(self.getSegmentPath(1)))
+
+        journal._lastRetention -= journal.RETENTION_INTERVAL
+        journal.append(41, makeEvents(41, 50))
+
+        self.assertFalse(os.path.exists(self.getSegmentPath(1)))
+        self.assertEqual(journal.get(1, 100), ([], None))
+        self.assertEqual(journal.get(21, 100), (makeEvents(21, 50), 50))
+
+    def test_retentionWhenOpened(self):
+        journal = self.createJournal()
+        journal.append(1, makeEvents(1, 10))
+        journal.append(21, makeEvents(21, 30))
+        journal.close()
+        self.age(self.getSegmentPath(1), 7200)
+
+        journal = self.createJournal(maxAge=3600)
+
+        self.assertFalse(os.path.exists(self.getSegmentPath(1)))
+        self.assertEqual(journal.get(21, 100), (makeEvents(21, 30), 30))
+
+    def test_sync(self):
+        synced = []
+        fsync = os.fsync
+        os.fsync = synced.append
+        try:
+            journal = self.createJournal()
+            journal.append(1, makeEvents(1, 10))
+            journal.sync()
+
+            self.assertEqual(len(synced), 2)
+
+            # The segment is synced when sealed for a new one.
+            journal.append(21, makeEvents(21, 30))
+
+            self.assertEqual(len(synced), 4)
+        finally:
+            os.fsync = fsync
+
+
+if __name__ == "__main__":
+    unittest.main()
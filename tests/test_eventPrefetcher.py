@@ -0,0 +1,39 @@
+import socket
+
+import fakeShotgun
+
+
+class TestEventPrefetcher(fakeShotgun.EngineTestCase):
+    def getFetchedIds(self):
+        """
+        @return: The ids the pages of new events were fetched from.
+        """
+        return [
+            call[2][0][2] + 1
+            for call in self.site.getCalls("find", "EventLogEntry")
+            if call[2] and call[2][0][:2] == ["id", "greater_than"]
+        ]
+
+    def test_order(self):
+        self.site.addEvents(fakeShotgun.makeEvents(100, 134))
+        self.writePlugin("plugin", sleep=0.005)
+        engine = self.createEngine("prefetch_pages = 2", lastEventId=99)
+
+        self.assertTrue(self.runEngine(lambda: len(self.getRecord()) == 35))
+
+        self.assertEqual(self.getRecord(), list(range(100, 135)))
+        self.assertEqual(self.getState(), {"plugin": (134, [])})
+        # Every page was fetched once, by the prefetcher.
+        fetchedIds = [i for i in self.getFetchedIds() if i <= 134]
+        self.assertEqual(fetchedIds, [100, 110, 120, 130])
+        self.assertFalse(engine._prefetcher._thread.is_alive())
+
+    def test_fetchErrorRetried(self):
+        self.site.addEvents(fakeShotgun.makeEvents(100, 124))
+        self.site.failures.append(socket.error("Connection reset"))
+        self.writePlugin("plugin")
+        self.createEngine("prefetch_pages = 2\nconn_retry_sleep = 0", lastEventId=99)
+
+        self.assertTrue(self.runEngine(lambda: len(self.getRecord()) == 25))
+
+        self.assertEqual(self.getRecord(), list(range(100, 125)))
@@ -0,0 +1,82 @@
+import fakeShotgun
+
+
+TASK_CHANGE = "Shotgun_Task_Change"
+NOTE_CHANGE = "Shotgun_Note_Change"
+
+MATCH_EVENTS = {
+    "all": None,
+    "any": {"*": None},
+    "anyStatus": {"*": ["sg_status_list"]},
+    "tasks": {TASK_CHANGE: None},
+    "taskStatus": {TASK_CHANGE: ["sg_status_list", "sg_status_list"]},
+    "taskAny": {TASK_CHANGE: ["*"], NOTE_CHANGE: ["content"]},
+    "notes": {NOTE_CHANGE: ["content", "subject"]},
+}
+
+
+class TestEventRouter(fakeShotgun.EngineTestCase):
+    def loadPlugins(self):
+        for name, matchEvents in MATCH_EVENTS.items():
+            self.writePlugin(name, matchEvents)
+        engine = self.createEngine()
+        for collection in engine._pluginCollections:
+            collection.load()
+        engine._updateRoutes()
+        return engine
+
+    def test_route(self):
+        engine = self.loadPlugins()
+        plugins = list(engine._pluginCollections[0])
+
+        for eventType in (TASK_CHANGE, NOTE_CHANGE, "Shotgun_Shot_New"):
+            for attributeName in ("sg_status_list", "content", None):
+                event = fakeShotgun.makeEvents(
+                    1, 1, eventType, attribute_name=attributeName
+                )[0]
+                expected = {}
+                for plugin in plugins:
+                    callbacks = [c for c in plugin if c.canProcess(event)]
+                    if callbacks:
+                        expected[plugin] = callbacks
+
+                self.assertEqual(engine._router.route(event), expected)
+                # Routed again from the table.
+                self.assertIs(engine._router.route(event), engine._router.route(event))
+
+    def test_dispatch(self):
+        self.site.addEvents(fakeShotgun.makeEvents(100, 104))
+        self.site.addEvents(
+            fakeShotgun.makeEvents(105, 109, NOTE_CHANGE, attribute_name="content")
+        )
+        self.writePlugin("tasks", {TASK_CHANGE: None})
+        self.writePlugin("notes", {NOTE_CHANGE: ["content"]})
+        self.createEngine(lastEventId=99)
+
+        self.assertTrue(self.runEngine(lambda: len(self.getRecord()) == 10))
+
+        self.assertEqual(self.getRecord("tasks"), list(range(100, 105)))
+        self.assertEqual(self.getRecord("notes"), list(range(105, 110)))
+        # Plugins move past the events they have no callback for.
+        self.assertEqual(self.getState(), {"tasks": (109, []), "notes": (109, [])})
+
+    def test_reload(self):
+        self.site.addEvents(fakeShotgun.makeEvents(100, 104))
+        self.writePlugin("plugin", {NOTE_CHANGE: None})
+        engine = self.createEngine(lastEventId=99)
+
+        def until():
+            if engine._router.route({"event_type": TASK_CHANGE}):
+                # New events only show up once the routes were rebuilt.
+                if not self.site.get("EventLogEntry", 105):
+                    self.site.addEvents(fakeShotgun.makeEvents(105, 109))
+                return len(self.getRecord()) == 5
+            state = self.getState()
+            if state and state["plugin"][0] == 104:
+                # The file changes, the routes are rebuilt.
+                path = self.writePlugin("plugin", {TASK_CHANGE: None})
+                fakeShotgun.os.utime(path, (0, fakeShotgun.time.time() + 10))
+            return False
+
+        self.assertTrue(self.runEngine(until))
+        self.assertEqual(self.getRecord(), list(range(105, 110)))
@@ -0,0 +1,72 @@
+import fakeShotgun
+
+
+TASK_CHANGE = "Shotgun_Task_Change"
+NOTE_CHANGE = "Shotgun_Note_Change"
+
+
+class TestEventTypeFilter(fakeShotgun.EngineTestCase):
+    def addEvents(self, firstId, lastId, age):
+        """
+        Add Task changes with even ids and Note changes with odd ids.
+        """
+        for eventId in range(firstId, lastId + 1):
+            eventType = TASK_CHANGE if eventId % 2 == 0 else NOTE_CHANGE
+            self.site.addEvents(
+                fakeShotgun.makeEvents(eventId, eventId, eventType, age)
+            )
+
+    def test_filter(self):
+        self.writePlugin("tasks", {TASK_CHANGE: None})
+        self.writePlugin("all")
+        self.addEvents(100, 119, 3600)
+        self.createEngine("filter_event_types = True", lastEventId=99)
+
+        self.assertTrue(self.runEngine(lambda: len(self.getRecord("all")) == 20))
+
+        # Filtering is disabled by the callback taking every event type.
+        for call in self.site.getCalls("find", "EventLogEntry"):
+            self.assertEqual(len(call[2]), 1)
+        self.assertEqual(self.getRecord("tasks"), list(range(100, 120, 2)))
+
+    def test_oldGaps(self):
+        self.writePlugin("tasks", {TASK_CHANGE: None})
+        self.addEvents(100, 119, 3600)
+        self.createEngine("filter_event_types = True", lastEventId=99)
+
+        self.assertTrue(self.runEngine(lambda: len(self.getRecord()) == 10))
+
+        self.assertEqual(self.getRecord(), list(range(100, 120, 2)))
+        self.assertEqual(self.getState(), {"tasks": (118, [])})
+        for call in self.site.getCalls("find", "EventLogEntry"):
+            self.assertIn(["event_type", "in", [TASK_CHANGE]], call[2])
+            self.assertTrue(call[5] == 0 or call[3] == self.engine.EVENT_FIELDS)
+
+    def test_recentGapsSettled(self):
+        self.writePlugin("tasks", {TASK_CHANGE: None})
+        self.addEvents(100, 119, 0)
+        # A Task change which shows up late.
+        del self.site.tables["EventLogEntry"][110]
+        self.createEngine("filter_event_types = True", lastEventId=99)
+
+        def until():
+            record = self.getRecord()
+            if len(record) == 9 and not self.site.get("EventLogEntry", 110):
+                self.addEvents(110, 110, 0)
+            return len(record) == 10 and not self.getState()["tasks"][1]
+
+        self.assertTrue(self.runEngine(until))
+
+        self.assertEqual(sorted(self.getRecord()), list(range(100, 120, 2)))
+        self.assertEqual(self.getState(), {"tasks": (118, [])})
+
+        # The Note changes were only transferred with their id and type to
+        # settle the gaps, never in full.
+        fullIds = []
+        for call in self.site.getCalls("find", "EventLogEntry"):
+            if call[3] == self.engine.EVENT_FIELDS:
+                fullIds.append(call)
+            else:
+                self.assertEqual(call[3], ["id", "event_type"])
+        transferred = sum(call[5] for call in fullIds)
+        self.assertEqual(transferred, 10)
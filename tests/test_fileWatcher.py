@@ -0,0 +1,128 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.insert(0, SRC)
+
+import fileWatcher  # noqa: E402
+
+
+def getLogger():
+    logger = logging.getLogger("test_fileWatcher")
+    if not logger.handlers:
+        logger.addHandler(logging.NullHandler())
+        logger.propagate = False
+    return logger
+
+
+def writeFile(path):
+    fh = open(path, "w")
+    fh.write("pass\n")
+    fh.close()
+
+
+class TestPollingWatcher(unittest.TestCase):
+    def setUp(self):
+        self.paths = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+
+    def tearDown(self):
+        for path in self.paths:
+            shutil.rmtree(path)
+
+    def test_everyCall(self):
+        watcher = fileWatcher.createWatcher("poll", self.paths, 0, getLogger())
+
+        self.assertIsInstance(watcher, fileWatcher.PollingWatcher)
+        self.assertEqual(watcher.getChanges(), set(self.paths))
+        self.assertEqual(watcher.getChanges(), set(self.paths))
+
+    def test_rescanInterval(self):
+        watcher = fileWatcher.createWatcher("poll", self.paths, 0.2, getLogger())
+
+        # Watched directories are reported once, then every interval.
+        self.assertEqual(watcher.getChanges(), set(self.paths))
+        self.assertEqual(watcher.getChanges(), set())
+        time.sleep(0.3)
+        self.assertEqual(watcher.getChanges(), set(self.paths))
+        self.assertEqual(watcher.getChanges(), set())
+
+
+class TestInotifyWatcher(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.paths = [
+            os.path.join(self.directory, "plugins"),
+            os.path.join(self.directory, "otherPlugins"),
+        ]
+        for path in self.paths:
+            os.mkdir(path)
+        self.notified = threading.Event()
+        try:
+            self.watcher = fileWatcher.createWatcher(
+                "inotify", self.paths, 0, getLogger(), self.notified.set
+            )
+        except fileWatcher.WatcherError as err:
+            shutil.rmtree(self.directory)
+            self.skipTest(str(err))
+        # Directories are reported as changed once watched.
+        self.assertEqual(self.watcher.getChanges(), set(self.paths))
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.directory)
+
+    def waitForChanges(self, timeout=5):
+        """
+        Get the changes once the watcher was notified of some.
+        """
+        self.assertTrue(self.notified.wait(timeout), "No change was notified.")
+        self.notified.clear()
+        # Let the watcher parse the rest of the notifications.
+        time.sleep(0.1)
+        return self.watcher.getChanges()
+
+    def test_pluginChanges(self):
+        path = os.path.join(self.paths[0], "plugin.py")
+        writeFile(path)
+
+        self.assertEqual(self.waitForChanges(), set(self.paths[:1]))
+
+        os.remove(path)
+
+        self.assertEqual(self.waitForChanges(), set(self.paths[:1]))
+        self.assertEqual(self.watcher.getChanges(), set())
+
+    def test_otherFilesIgnored(self):
+        writeFile(os.path.join(self.paths[0], "notes.txt"))
+        writeFile(os.path.join(self.paths[0], ".plugin.py"))
+        writeFile(os.path.join(self.paths[1], "plugin.py"))
+
+        # Only the plugin file was reported.
+        self.assertEqual(self.waitForChanges(), set(self.paths[1:]))
+
+    def test_directoryReappears(self):
+        shutil.rmtree(self.paths[0])
+        time.sleep(0.2)
+
+        # A missing directory isn't reported.
+        self.assertEqual(self.watcher.getChanges(), set())
+
+        os.mkdir(self.paths[0])
+
+        self.assertEqual(self.watcher.getChanges(), set(self.paths[:1]))
+
+        # It is watched again.
+        self.notified.clear()
+        writeFile(os.path.join(self.paths[0], "plugin.py"))
+
+        self.assertEqual(self.waitForChanges(), set(self.paths[:1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import logging
+import smtplib
+import threading
+import time
+import unittest
+
+import fakeShotgun
+import shotgunEventDaemon
+
+
+class FakeSMTP(object):
+    """
+    An SMTP server taking its time to answer, in place of L{smtplib.SMTP}.
+    """
+
+    sent = []
+    delay = 0
+
+    def __init__(self, host="", port=0, timeout=None):
+        pass
+
+    def connect(self, host, port):
+        time.sleep(self.delay)
+
+    def sendmail(self, fromAddr, toAddrs, msg):
+        self.sent.append((fromAddr, toAddrs, msg))
+
+    def close(self):
+        pass
+
+
+class TestEngineSleep(fakeShotgun.EngineTestCase):
+    def test_stopWhileIdle(self):
+        self.writePlugin("plugin")
+        engine = self.createEngine(
+            "fetch_interval = 60\nmin_fetch_interval = 60", lastEventId=99
+        )
+        thread = threading.Thread(target=engine.start)
+        thread.daemon = True
+        thread.start()
+        while not self.site.getCalls("find", "EventLogEntry"):
+            time.sleep(0.01)
+        time.sleep(0.1)
+
+        start = time.time()
+        engine.stop()
+        thread.join(5)
+
+        self.assertFalse(thread.is_alive())
+        self.assertLess(time.time() - start, 2)
+
+
+class TestCustomSMTPHandler(unittest.TestCase):
+    def setUp(self):
+        self._smtp = smtplib.SMTP
+        smtplib.SMTP = FakeSMTP
+        FakeSMTP.sent = []
+        FakeSMTP.delay = 0.2
+        self.handler = shotgunEventDaemon.CustomSMTPHandler(
+            "smtp.test", "daemon@test", ["admin@test"], "Daemon"
+        )
+        self.logger = logging.getLogger("test_nonBlockingIO")
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+        smtplib.SMTP = self._smtp
+
+    def test_emitDoesNotWait(self):
+        start = time.time()
+        self.logger.error("First error.")
+        self.logger.critical("Second error.")
+
+        self.assertLess(time.time() - start, FakeSMTP.delay)
+
+        # The emails are sent by the time the handler is closed.
+        self.handler.close()
+
+        self.assertEqual(len(FakeSMTP.sent), 2)
+        self.assertIn("First error.", FakeSMTP.sent[0][2])
+        self.assertIn(
+            "Subject: Daemon CRITICAL - Shotgun event daemon.", FakeSMTP.sent[1][2]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+
+import fakeShotgun
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+class TestPluginReload(fakeShotgun.EngineTestCase):
+    def test_stateNotReloaded(self):
+        self.writePlugin("plugin")
+        self.site.addEvents(fakeShotgun.makeEvents(100, 109))
+        engine = self.createEngine(lastEventId=99)
+        loads = []
+        loadEventIdData = engine._loadEventIdData
+
+        def countingLoad():
+            loads.append(len(self.getRecord("plugin")))
+            loadEventIdData()
+
+        engine._loadEventIdData = countingLoad
+
+        def until():
+            record = self.getRecord("plugin")
+            if len(record) == 10:
+                # The plugins directory changes.
+                self.writePlugin("other")
+                self.site.addEvents(fakeShotgun.makeEvents(110, 119))
+            return len(record) == 20
+
+        self.assertTrue(self.runEngine(until))
+
+        # The state was only read when the engine started.
+        self.assertEqual(loads, [0])
+        self.assertEqual(self.getRecord("plugin"), list(range(100, 120)))
+
+    def test_pluginReadded(self):
+        path = self.writePlugin("plugin")
+        self.writePlugin("other")
+        self.site.addEvents(fakeShotgun.makeEvents(100, 109))
+        self.createEngine(lastEventId=99)
+
+        def until():
+            if len(self.getRecord("other")) == 10 and os.path.exists(path):
+                os.remove(path)
+                self.site.addEvents(fakeShotgun.makeEvents(110, 119))
+            elif len(self.getRecord("other")) == 20 and not os.path.exists(path):
+                self.writePlugin("plugin")
+            return len(self.getRecord("plugin")) == 20
+
+        self.assertTrue(self.runEngine(until))
+
+        # The plugin caught up with the events which came while it was gone.
+        self.assertEqual(self.getRecord("plugin"), list(range(100, 120)))
+        self.assertEqual(self.getState()["plugin"], (119, []))
+
+    def test_movedCollection(self):
+        self.writePlugin("plugin")
+        self.site.addEvents(fakeShotgun.makeEvents(100, 109))
+        # The plugins were processed from another directory.
+        fh = open(os.path.join(self.directory, "shotgunEventDaemon.id"), "wb")
+        pickle.dump({"/old/plugins": {"plugin": (104, []), "gone": (108, [])}}, fh)
+        fh.close()
+        self.createEngine()
+
+        self.assertTrue(self.runEngine(lambda: len(self.getRecord()) == 5))
+
+        self.assertEqual(self.getRecord(), list(range(105, 110)))
@@ -0,0 +1,41 @@
+import fakeShotgun
+
+
+class TestPollInterval(fakeShotgun.EngineTestCase):
+    def createEngine(self):
+        return fakeShotgun.EngineTestCase.createEngine(
+            self,
+            "fetch_interval = 8\nmin_fetch_interval = 0.5\nfetch_backoff = 2",
+            lastEventId=99,
+        )
+
+    def assertAbout(self, interval, expected):
+        self.assertTrue(
+            expected * 0.9 <= interval <= min(expected * 1.1, 8),
+            "%s is not about %s" % (interval, expected),
+        )
+
+    def test_backoff(self):
+        engine = self.createEngine()
+        events = fakeShotgun.makeEvents(100, 100)
+
+        self.assertEqual(engine._getPollInterval(events), 0.5)
+        for expected in (0.5, 1, 2, 4, 8, 8):
+            self.assertAbout(engine._getPollInterval([]), expected)
+
+        # Polled again quickly as soon as events come in.
+        self.assertEqual(engine._getPollInterval(events), 0.5)
+        self.assertAbout(engine._getPollInterval([]), 0.5)
+
+    def test_idlePolls(self):
+        self.site.addEvents(fakeShotgun.makeEvents(100, 100))
+        self.writePlugin("plugin")
+        engine = self.createEngine()
+        engine._fetch_interval = 0.4
+        engine._min_fetch_interval = engine._poll_interval = 0.05
+
+        self.assertFalse(self.runEngine(lambda: False, timeout=1.2))
+
+        # An event, then 0.05, 0.1, 0.2, 0.4 and 0.4 seconds apart.
+        polls = len(self.site.getCalls("find", "EventLogEntry"))
+        self.assertTrue(4 <= polls <= 7, polls)
@@ -0,0 +1,74 @@
+import os
+
+import fakeShotgun
+
+
+class TestProcessDispatch(fakeShotgun.EngineTestCase):
+    def writePidPlugin(self, name, **kwargs):
+        """
+        Write a plugin which also records the ids of the processes it runs
+        in.
+        """
+        self.pidPath = os.path.join(self.directory, "pids")
+        body = "fh = open(%r, 'a'); fh.write('%%d\\n' %% os.getpid()); fh.close()"
+        return self.writePlugin(name, body=body % self.pidPath, **kwargs)
+
+    def getPids(self):
+        fh = open(self.pidPath)
+        try:
+            return set(int(line) for line in fh if line.endswith("\n"))
+        finally:
+            fh.close()
+
+    def test_process(self):
+        self.site.addEvents(fakeShotgun.makeEvents(100, 119))
+        self.writePidPlugin("plugin")
+        self.createEngine("dispatch_mode = process", lastEventId=99)
+
+        self.assertTrue(self.runEngine(lambda: len(self.getRecord()) == 20))
+
+        self.assertEqual(self.getRecord(), list(range(100, 120)))
+        self.assertEqual(self.getState(), {"plugin": (119, [])})
+        self.assertEqual(len(self.getPids()), 1)
+        self.assertNotIn(os.getpid(), self.getPids())
+
+    def test_crash(self):
+        self.site.addEvents(fakeShotgun.makeEvents(100, 119))
+        self.writePlugin("good")
+        # Errors don't deactivate the plugin, crashes do.
+        self.writePlugin(
+            "bad", body="if event['id'] == 105: os._exit(3)", options="False"
+        )
+        self.createEngine("dispatch_mode = process", lastEventId=99)
+
+        self.assertTrue(self.runEngine(lambda: len(self.getRecord("good")) == 20))
+
+        # The daemon survives, the plugin is deactivated.
+        self.assertEqual(self.getRecord("bad"), list(range(100, 105)))
+        self.assertEqual(self.getState(), {"good": (119, []), "bad": (104, [])})
+
+    def test_timeout(self):
+        self.site.addEvents(fakeShotgun.makeEvents(100, 109))
+        self.writePlugin("plugin", body="if event['id'] == 105: time.sleep(10)")
+        self.createEngine(
+            "dispatch_mode = process\nprocess_timeout = 1", lastEventId=99
+        )
+
+        def until():
+            plugins = list(self.engine._pluginCollections[0])
+            return len(self.getRecord()) == 5 and not plugins[0].isActive()
+
+        self.assertTrue(self.runEngine(until))
+        self.assertEqual(self.getState(), {"plugin": (104, [])})
+
+    def test_recycle(self):
+        self.site.addEvents(fakeShotgun.makeEvents(100, 129))
+        self.writePidPlugin("plugin")
+        self.createEngine(
+            "dispatch_mode = process\nprocess_max_events = 10", lastEventId=99
+        )
+
+        self.assertTrue(self.runEngine(lambda: len(self.getRecord()) == 30))
+
+        self.assertEqual(self.getRecord(), list(range(100, 130)))
+        self.assertEqual(len(self.getPids()), 3)
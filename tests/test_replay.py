@@ -0,0 +1,64 @@
+import os
+
+import fakeShotgun
+import shotgunEventDaemon
+
+
+class TestReplay(fakeShotgun.EngineTestCase):
+    def setUp(self):
+        fakeShotgun.EngineTestCase.setUp(self)
+        self.site.addEvents(fakeShotgun.makeEvents(100, 149))
+        self.idPath = os.path.join(self.directory, "shotgunEventDaemon.id")
+
+    def test_replay(self):
+        self.writePlugin("plugin")
+        self.writePlugin("other")
+        replay = shotgunEventDaemon.Replay(
+            self.createEngine(lastEventId=140), "plugin", 110, 130, pageSize=7
+        )
+
+        self.assertTrue(replay.run())
+
+        self.assertEqual(self.getRecord(), list(range(110, 131)))
+        fetches = self.site.getCalls("find", "EventLogEntry")
+        self.assertEqual([call[4] for call in fetches], [7, 7, 7])
+        self.assertTrue(replay.getReport()[0].startswith("Replayed 21 events"))
+
+        # The state of the daemon was left alone.
+        fh = open(self.idPath)
+        self.assertEqual(fh.read(), "140\n")
+        fh.close()
+
+    def test_workers(self):
+        self.site.addEvents(fakeShotgun.makeEvents(150, 179, entity_id=1))
+        self.writePlugin("plugin", sleep=0.01)
+        replay = shotgunEventDaemon.Replay(
+            self.createEngine(), "plugin", 140, 179, workers=4
+        )
+
+        self.assertTrue(replay.run())
+
+        record = self.getRecord()
+        self.assertEqual(sorted(record), list(range(140, 180)))
+        # The events of a single Task were processed in order.
+        self.assertEqual([i for i in record if i >= 150], list(range(150, 180)))
+
+    def test_deactivated(self):
+        self.writePlugin(
+            "plugin",
+            body="assert event['id'] != 115",
+            options="stopOnError=True",
+        )
+        replay = shotgunEventDaemon.Replay(
+            self.createEngine(), "plugin", 110, 130, pageSize=10
+        )
+
+        self.assertFalse(replay.run())
+
+        self.assertEqual(self.getRecord(), list(range(110, 115)))
+
+    def test_unknownPlugin(self):
+        self.writePlugin("plugin")
+        replay = shotgunEventDaemon.Replay(self.createEngine(), "other", 110, 130)
+
+        self.assertRaises(shotgunEventDaemon.EventDaemonError, replay.run)
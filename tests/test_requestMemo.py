@@ -0,0 +1,139 @@
+import os
+import sys
+import unittest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.insert(0, SRC)
+
+import requestMemo  # noqa: E402
+
+
+class FakeConfig(object):
+    def __init__(self, scriptName):
+        self.script_name = scriptName
+
+
+class FakeShotgun(object):
+    """
+    Answers every read with a new record, and records the calls made.
+    """
+
+    def __init__(self, scriptName="script"):
+        self.config = FakeConfig(scriptName)
+        self.calls = []
+
+    def find_one(self, entity_type, filters, fields=None):
+        self.calls.append(("find_one", entity_type, filters, fields))
+        return {"type": entity_type, "id": filters[0][2], "call": len(self.calls)}
+
+    def update(self, entity_type, entity_id, data):
+        self.calls.append(("update", entity_type, entity_id))
+        return dict(data, type=entity_type, id=entity_id)
+
+    def batch(self, requests):
+        self.calls.append(("batch", len(requests)))
+        return requests
+
+
+class TestRequestMemo(unittest.TestCase):
+    def setUp(self):
+        self.memo = requestMemo.RequestMemo()
+        self.shotgun = FakeShotgun()
+        self.events = [{"id": 1}, {"id": 2}]
+
+    def getShotgun(self, eventId, shotgun=None):
+        return requestMemo.MemoShotgun(shotgun or self.shotgun, self.memo, eventId)
+
+    def readShot(self, eventId, shotgun=None):
+        return self.getShotgun(eventId, shotgun).find_one(
+            "Shot", [["id", "is", 10]], ["code"]
+        )
+
+    def test_memoized(self):
+        self.memo.open(self.events)
+        first = self.readShot(1)
+        first["code"] = "changed"
+
+        self.assertEqual(self.readShot(1), {"type": "Shot", "id": 10, "call": 1})
+        # Reads are memoized per event, and per script.
+        self.readShot(2)
+        self.readShot(1, FakeShotgun("other"))
+        self.assertEqual(len(self.shotgun.calls), 2)
+
+    def test_outsideScope(self):
+        self.readShot(1)
+        self.readShot(1)
+
+        self.assertEqual(len(self.shotgun.calls), 2)
+
+    def test_closed(self):
+        self.memo.open(self.events)
+        # Opened again by another dispatch of the events.
+        self.memo.open(self.events[:1])
+        self.readShot(1)
+        self.memo.close(self.events)
+        self.readShot(1)
+
+        self.assertEqual(len(self.shotgun.calls), 1)
+
+        self.memo.close(self.events[:1])
+        self.readShot(1)
+
+        self.assertEqual(len(self.shotgun.calls), 2)
+
+    def test_write(self):
+        self.memo.open(self.events)
+        self.readShot(1)
+        self.readShot(2)
+        shotgun = self.getShotgun(1)
+        shotgun.find_one("Task", [["id", "is", 5]], ["content"])
+        shotgun.update("Shot", 10, {"code": "new"})
+
+        self.readShot(1)
+        self.readShot(2)
+        shotgun.find_one("Task", [["id", "is", 5]], ["content"])
+
+        # Only the Shot read made for the event written for was dropped.
+        self.assertEqual(len(self.shotgun.calls), 5)
+
+    def test_writeThroughDeepFields(self):
+        self.memo.open(self.events)
+        shotgun = self.getShotgun(1)
+        shotgun.find_one("Task", [["id", "is", 5]], ["entity.Shot.code"])
+        shotgun.find_one("Task", [["entity.Shot.code", "is", "A"]], ["content"])
+        shotgun.batch(
+            [
+                {
+                    "request_type": "update",
+                    "entity_type": "Shot",
+                    "entity_id": 10,
+                    "data": {"code": "B"},
+                }
+            ]
+        )
+        shotgun.find_one("Task", [["id", "is", 5]], ["entity.Shot.code"])
+        shotgun.find_one("Task", [["entity.Shot.code", "is", "A"]], ["content"])
+
+        self.assertEqual(len(self.shotgun.calls), 5)
+
+    def test_getReadTypes(self):
+        readTypes = requestMemo.RequestMemo.getReadTypes(
+            "find",
+            ("Task", [["entity.Shot.sg_sequence.Sequence.code", "is", "A"]]),
+            {
+                "fields": ["content", "project.Project.name"],
+                "order": [{"field_name": "step.Step.code"}],
+            },
+        )
+
+        self.assertEqual(
+            readTypes, frozenset(["Task", "Shot", "Sequence", "Project", "Step"])
+        )
+        self.assertEqual(
+            requestMemo.RequestMemo.getReadTypes("schema_field_read", ("Task",), {}),
+            frozenset(),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
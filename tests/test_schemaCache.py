@@ -0,0 +1,93 @@
+import copy
+import os
+import sys
+import time
+import unittest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.insert(0, SRC)
+
+import schemaCache  # noqa: E402
+
+
+SCHEMA = {
+    "content": {"data_type": {"value": "text"}},
+    "sg_status_list": {"data_type": {"value": "status_list"}},
+}
+
+
+class FakeShotgun(object):
+    def __init__(self):
+        self.calls = []
+
+    def schema_field_read(self, entity_type, field_name=None, project_entity=None):
+        self.calls.append((entity_type, field_name, project_entity))
+        if field_name is None:
+            return copy.deepcopy(SCHEMA)
+        return copy.deepcopy({field_name: SCHEMA[field_name]})
+
+
+class TestSchemaCache(unittest.TestCase):
+    def setUp(self):
+        self.shotgun = FakeShotgun()
+        self.cache = schemaCache.SchemaCache(3600)
+        self.cached = schemaCache.CachedSchemaShotgun(self.shotgun, self.cache)
+
+    def test_cached(self):
+        self.assertEqual(self.cached.schema_field_read("Task"), SCHEMA)
+        self.assertEqual(self.cached.schema_field_read("Task"), SCHEMA)
+        self.cached.schema_field_read("Task", project_entity={"id": 2})
+
+        self.assertEqual(
+            self.shotgun.calls,
+            [("Task", None, None), ("Task", None, {"id": 2})],
+        )
+
+    def test_copies(self):
+        self.cached.schema_field_read("Task")["content"]["data_type"] = None
+
+        self.assertEqual(self.cached.schema_field_read("Task"), SCHEMA)
+
+    def test_fieldFromEntityType(self):
+        self.cached.schema_field_read("Task")
+        field = self.cached.schema_field_read("Task", "content")
+
+        self.assertEqual(field, {"content": SCHEMA["content"]})
+        # The field was served from the reply for every field.
+        self.assertEqual(len(self.shotgun.calls), 1)
+
+    def test_expired(self):
+        self.cache = schemaCache.SchemaCache(0.1)
+        self.cached = schemaCache.CachedSchemaShotgun(self.shotgun, self.cache)
+        self.cached.schema_field_read("Task", "content")
+        time.sleep(0.2)
+        self.cached.schema_field_read("Task", "content")
+
+        self.assertEqual(len(self.shotgun.calls), 2)
+
+    def test_fieldEvent(self):
+        self.cached.schema_field_read("Task")
+        self.cache.invalidate([{"event_type": "Shotgun_Task_Change"}])
+        self.cached.schema_field_read("Task")
+
+        self.assertEqual(len(self.shotgun.calls), 1)
+
+        self.cache.invalidate([{"event_type": "Shotgun_DisplayColumn_New"}])
+        self.cached.schema_field_read("Task")
+
+        self.assertEqual(len(self.shotgun.calls), 2)
+
+    def test_changedWhileReading(self):
+        def fetch():
+            # The schema changes while it's read.
+            self.cache.clear()
+            return SCHEMA
+
+        self.cache.get(("schema_field_read", "Task", None, None), fetch)
+        self.cached.schema_field_read("Task")
+
+        self.assertEqual(len(self.shotgun.calls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
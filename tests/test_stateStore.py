@@ -0,0 +1,269 @@
+import datetime
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.insert(0, SRC)
+
+import stateStore  # noqa: E402
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+SOON = datetime.datetime(2020, 1, 1, 0, 1)
+LATER = datetime.datetime(2020, 1, 1, 0, 5)
+
+
+def getLogger():
+    logger = logging.getLogger("test_stateStore")
+    if not logger.handlers:
+        logger.addHandler(logging.NullHandler())
+        logger.propagate = False
+    return logger
+
+
+class TestLogStateStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "shotgunEventDaemon.id")
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+        shutil.rmtree(self.directory)
+
+    def createStore(self):
+        store = stateStore.LogStateStore(self.path, getLogger())
+        self.stores.append(store)
+        return store
+
+    def reload(self):
+        return self.createStore().load()
+
+    def test_loadNothing(self):
+        self.assertIsNone(self.createStore().load())
+
+    def test_replay(self):
+        store = self.createStore()
+        store.load()
+        store.save({"/plugins": {"a": (10, [(5, 7, SOON)]), "b": (20, [])}})
+        store.save({"/plugins": {"a": (12, [(5, 5, SOON)]), "b": (20, [])}})
+        backlog = [(5, 5, SOON), (13, 14, LATER)]
+        state = {"/plugins": {"a": (15, backlog), "b": (21, [])}}
+        store.save(state)
+
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(self.reload(), state)
+
+    def test_replayOnlyChanges(self):
+        store = self.createStore()
+        store.load()
+        state = {"/plugins": {"a": (10, []), "b": (20, [])}}
+        store.save(state)
+        size = os.path.getsize(self.path + ".log")
+        store.save(state)
+
+        self.assertEqual(os.path.getsize(self.path + ".log"), size)
+
+        state["/plugins"]["b"] = (21, [])
+        store.save(state)
+
+        self.assertGreater(os.path.getsize(self.path + ".log"), size)
+        self.assertEqual(self.reload(), state)
+
+    def test_replayOverLegacyEventId(self):
+        fh = open(self.path, "w")
+        fh.write("42\n")
+        fh.close()
+
+        store = self.createStore()
+        self.assertEqual(store.load(), 42)
+        store.save({"/plugins": {"a": (50, [])}})
+        state = self.reload()
+
+        self.assertEqual(state, {"/plugins": {"a": (50, [])}})
+
+    def test_replayIncompleteRecord(self):
+        store = self.createStore()
+        store.load()
+        state = {"/plugins": {"a": (10, [(5, 7, SOON)])}}
+        store.save(state)
+        store.close()
+
+        # A record whose write was interrupted.
+        fh = open(self.path + ".log", "ab")
+        fh.write(b"\x00\x00\x01\x00partial")
+        fh.close()
+
+        store = self.createStore()
+        self.assertEqual(store.load(), state)
+
+        # Records saved after it aren't hidden by it.
+        state = {"/plugins": {"a": (11, [])}}
+        store.save(state)
+        self.assertEqual(self.reload(), state)
+
+    def test_compaction(self):
+        store = self.createStore()
+        store.COMPACT_RECORDS = 4
+        store.load()
+        store.save({"/plugins": {"a": (10, [(5, 7, SOON)])}})
+        store.save({"/plugins": {"a": (11, [(5, 7, SOON)])}})
+
+        self.assertFalse(os.path.exists(self.path))
+
+        state = {"/plugins": {"a": (12, [(6, 7, SOON)])}}
+        store.save(state)
+
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(os.path.getsize(self.path + ".log"), 0)
+        self.assertEqual(self.reload(), state)
+
+        state = {"/plugins": {"a": (13, [(6, 7, SOON)])}}
+        store.save(state)
+
+        self.assertGreater(os.path.getsize(self.path + ".log"), 0)
+        self.assertEqual(self.reload(), state)
+
+    def test_compactionFailed(self):
+        store = self.createStore()
+        store.COMPACT_RECORDS = 3
+        store.load()
+        store.save({"/plugins": {"a": (10, [])}})
+
+        # The snapshot can't be written over a directory.
+        os.mkdir(self.path + ".tmp")
+        state = {"/plugins": {"a": (11, [(5, 5, SOON)])}}
+        store.save(state)
+
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(self.reload(), state)
+
+        # The snapshot is tried again at the next save.
+        os.rmdir(self.path + ".tmp")
+        state = {"/plugins": {"a": (12, [])}}
+        store.save(state)
+
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(os.path.getsize(self.path + ".log"), 0)
+        self.assertEqual(self.reload(), state)
+
+
+class TestSqliteStateStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "shotgunEventDaemon.id")
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+        shutil.rmtree(self.directory)
+
+    def createStore(self):
+        store = stateStore.SqliteStateStore(self.path, getLogger())
+        self.stores.append(store)
+        return store
+
+    def reload(self):
+        return self.createStore().load()
+
+    def query(self, sql):
+        """
+        Read the database from another connection, as monitoring tools do.
+        """
+        connection = sqlite3.connect(self.path + ".sqlite")
+        try:
+            return connection.execute(sql).fetchall()
+        finally:
+            connection.close()
+
+    def test_loadNothing(self):
+        self.assertIsNone(self.createStore().load())
+
+    def test_saveAndLoad(self):
+        store = self.createStore()
+        store.load()
+        store.save({"/plugins": {"a": (10, [(5, 7, SOON)]), "b": (20, [])}})
+        backlog = [(5, 5, SOON), (13, 14, LATER)]
+        state = {"/plugins": {"a": (15, backlog), "b": (20, [])}}
+        store.save(state)
+
+        self.assertEqual(self.reload(), state)
+        self.assertEqual(
+            self.query(
+                "SELECT plugin, last_event_id FROM plugin_state ORDER BY plugin"
+            ),
+            [("a", 15), ("b", 20)],
+        )
+        self.assertEqual(
+            self.query(
+                "SELECT first_id, last_id FROM backlog_ranges ORDER BY first_id"
+            ),
+            [(5, 5), (13, 14)],
+        )
+
+    def test_onlyChangedRows(self):
+        store = self.createStore()
+        store.load()
+        store.save({"/plugins": {"a": (10, []), "b": (20, [])}})
+        updated = dict(self.query("SELECT plugin, updated FROM plugin_state"))
+        store.save({"/plugins": {"a": (11, []), "b": (20, [])}})
+
+        rows = dict(self.query("SELECT plugin, updated FROM plugin_state"))
+        self.assertNotEqual(rows["a"], updated["a"])
+        self.assertEqual(rows["b"], updated["b"])
+
+    def test_importPickle(self):
+        state = {"/plugins": {"a": (10, [(5, 7, SOON)])}}
+        fh = open(self.path, "wb")
+        pickle.dump(state, fh)
+        fh.close()
+
+        store = self.createStore()
+        self.assertEqual(store.load(), state)
+
+        # The imported state is written to the database at the first save.
+        store.save(state)
+        os.remove(self.path)
+        self.assertEqual(self.reload(), state)
+
+    def test_importLegacyEventId(self):
+        fh = open(self.path, "w")
+        fh.write("42\n")
+        fh.close()
+
+        self.assertEqual(self.createStore().load(), 42)
+
+    def test_saveFailed(self):
+        store = self.createStore()
+        store.load()
+        store.save({"/plugins": {"a": (10, [])}})
+
+        # Another process holds a write lock on the database.
+        blocker = sqlite3.connect(self.path + ".sqlite", timeout=0)
+        blocker.execute("BEGIN IMMEDIATE")
+        store._connect().execute("PRAGMA busy_timeout = 0")
+        state = {"/plugins": {"a": (11, [(5, 5, SOON)])}}
+        store.save(state)
+        blocker.rollback()
+        blocker.close()
+
+        self.assertEqual(self.reload(), {"/plugins": {"a": (10, [])}})
+
+        # The changes are written again at the next save.
+        store.save(state)
+        self.assertEqual(self.reload(), state)
+
+
+if __name__ == "__main__":
+    unittest.main()
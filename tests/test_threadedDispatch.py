@@ -0,0 +1,61 @@
+import threading
+
+import fakeShotgun
+
+
+class TestThreadedDispatch(fakeShotgun.EngineTestCase):
+    def test_order(self):
+        self.site.addEvents(fakeShotgun.makeEvents(100, 139))
+        self.writePlugin("fast")
+        self.writePlugin("slow", sleep=0.005)
+        self.createEngine("dispatch_mode = threaded", lastEventId=99)
+
+        self.assertTrue(self.runEngine(lambda: len(self.getRecord()) == 80))
+
+        self.assertEqual(self.getRecord("fast"), list(range(100, 140)))
+        self.assertEqual(self.getRecord("slow"), list(range(100, 140)))
+        self.assertEqual(self.getState(), {"fast": (139, []), "slow": (139, [])})
+
+    def test_fastPluginRunsAhead(self):
+        self.site.addEvents(fakeShotgun.makeEvents(100, 139))
+        self.writePlugin("fast")
+        self.writePlugin("slow", sleep=0.02)
+        self.createEngine(
+            "dispatch_mode = threaded\ndispatch_queue_pages = 4", lastEventId=99
+        )
+
+        slowRecord = []
+
+        def until():
+            if not slowRecord and len(self.getRecord("fast")) == 40:
+                slowRecord.append(len(self.getRecord("slow")))
+            return len(self.getRecord("slow")) == 40
+
+        self.assertTrue(self.runEngine(until))
+
+        # The fast plugin wasn't held back by the slow one.
+        self.assertLess(slowRecord[0], 20)
+
+    def test_failedPlugin(self):
+        self.site.addEvents(fakeShotgun.makeEvents(100, 119))
+        self.writePlugin("good")
+        self.writePlugin(
+            "bad", body="if event['id'] == 105: raise ValueError('Bad event')"
+        )
+        self.createEngine("dispatch_mode = threaded", lastEventId=99)
+
+        self.assertTrue(self.runEngine(lambda: len(self.getRecord("good")) == 20))
+
+        self.assertEqual(self.getRecord("bad"), list(range(100, 105)))
+        self.assertEqual(self.getState(), {"good": (119, []), "bad": (104, [])})
+
+    def test_workersStopped(self):
+        threads = threading.active_count()
+        self.site.addEvents(fakeShotgun.makeEvents(100, 109))
+        self.writePlugin("first")
+        self.writePlugin("second")
+        self.createEngine("dispatch_mode = threaded", lastEventId=99)
+
+        self.assertTrue(self.runEngine(lambda: len(self.getRecord()) == 20))
+
+        self.assertEqual(threading.active_count(), threads)
@@ -0,0 +1,249 @@
+import os
+import socket
+import sys
+import unittest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.insert(0, SRC)
+
+import shotgun_api3 as sg  # noqa: E402
+
+import connectionPool  # noqa: E402
+import writeBatcher  # noqa: E402
+
+
+class FakeConfig(object):
+    def __init__(self, scriptName, scriptKey):
+        self.script_name = scriptName
+        self.api_key = scriptKey
+        self.session_uuid = None
+
+
+class FakeShotgun(object):
+    """
+    A connection to a L{FakeServer}.
+    """
+
+    def __init__(self, server, scriptName, scriptKey):
+        self.server = server
+        self.config = FakeConfig(scriptName, scriptKey)
+
+    def set_session_uuid(self, sessionUuid):
+        self.config.session_uuid = sessionUuid
+
+    def batch(self, requests):
+        return self.server.batch(self, requests)
+
+
+class FakeServer(object):
+    """
+    Runs the batch calls, as a transaction like Shotgun does.
+
+    Writes to the entity ids in rejected fail, and the next unreachable calls
+    fail with a connection error.
+    """
+
+    def __init__(self):
+        self.rejected = set()
+        self.unreachable = []
+        self.calls = []
+        self.written = []
+
+    def batch(self, shotgun, requests):
+        if self.unreachable:
+            raise self.unreachable.pop(0)
+        self.calls.append((shotgun.config.script_name, len(requests)))
+        for request in requests:
+            if request["entity_id"] in self.rejected:
+                raise sg.Fault("API batch() request with index 0 failed.")
+        self.written.extend(request["entity_id"] for request in requests)
+        return requests
+
+
+class FakeEngine(object):
+    def __init__(self, server):
+        self.server = server
+        self.discarded = 0
+        self.unavailable = []
+        self.connAttempts = []
+        self.stopAfterAttempts = None
+        self._continue = True
+
+    def acquireShotgun(self, scriptName, scriptKey):
+        if self.unavailable:
+            raise self.unavailable.pop(0)
+        return FakeShotgun(self.server, scriptName, scriptKey)
+
+    def releaseShotgun(self, shotgun, discard=False):
+        if discard:
+            self.discarded += 1
+
+    def _wrapShotgun(self, shotgun):
+        return shotgun
+
+    def _checkConnectionAttempts(self, conn_attempts, msg):
+        self.connAttempts.append(msg)
+        if len(self.connAttempts) == self.stopAfterAttempts:
+            self._continue = False
+        return conn_attempts + 1
+
+
+class FakeCallback(object):
+    def __init__(self):
+        self.failed = []
+        self.notSent = []
+
+    def writeFailed(self, event, request):
+        self.failed.append((event["id"], request["entity_id"]))
+
+    def writeNotSent(self, event, request):
+        self.notSent.append((event["id"], request["entity_id"]))
+
+
+class TestWriteBatcher(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeServer()
+        self.engine = FakeEngine(self.server)
+        self.batcher = writeBatcher.WriteBatcher(self.engine, 100, 3600)
+        self.callback = FakeCallback()
+
+    def update(self, eventId, entityId, scriptName="script"):
+        """
+        Queue an update made processing an event.
+        """
+        shotgun = FakeShotgun(self.server, scriptName, "key")
+        handle = writeBatcher.BatchingShotgun(
+            shotgun, self.batcher, self.callback, {"id": eventId}
+        )
+        return handle.update("Task", entityId, {"sg_status_list": "ip"})
+
+    def test_queue(self):
+        record = self.update(1, 10)
+
+        self.assertEqual(record, {"type": "Task", "id": 10, "sg_status_list": "ip"})
+        self.assertEqual(len(self.batcher), 1)
+        self.assertEqual(self.server.calls, [])
+
+    def test_flush(self):
+        self.update(1, 10)
+        self.update(2, 11)
+        self.update(3, 12, scriptName="other")
+        self.update(4, 13)
+
+        self.assertEqual(self.batcher.flush(), 0)
+        self.assertEqual(
+            self.server.calls, [("script", 2), ("other", 1), ("script", 1)]
+        )
+        self.assertEqual(self.server.written, [10, 11, 12, 13])
+        self.assertEqual(len(self.batcher), 0)
+
+    def test_flushWhenFull(self):
+        self.batcher = writeBatcher.WriteBatcher(self.engine, 2, 3600)
+        self.update(1, 10)
+
+        self.assertEqual(self.server.written, [])
+
+        self.update(2, 11)
+
+        self.assertEqual(self.server.written, [10, 11])
+
+    def test_flushIfDue(self):
+        self.update(1, 10)
+        self.batcher.flushIfDue()
+
+        self.assertEqual(self.server.written, [])
+
+        # The write is now old enough.
+        self.batcher._maxAge = 0
+        self.batcher.flushIfDue()
+
+        self.assertEqual(self.server.written, [10])
+
+    def test_failureAttribution(self):
+        self.server.rejected.add(11)
+        self.update(1, 10)
+        self.update(2, 11)
+        self.update(3, 12)
+
+        self.assertEqual(self.batcher.flush(), 1)
+        # The batch fails as a whole, then every write is sent on its own.
+        self.assertEqual(
+            self.server.calls,
+            [("script", 3), ("script", 1), ("script", 1), ("script", 1)],
+        )
+        self.assertEqual(self.server.written, [10, 12])
+        self.assertEqual(self.callback.failed, [(2, 11)])
+        self.assertEqual(self.callback.notSent, [])
+
+    def test_failuresAddUp(self):
+        self.server.rejected.update([10, 11])
+        self.update(1, 10)
+
+        self.assertEqual(self.batcher.flush(), 1)
+
+        self.update(2, 11)
+
+        self.assertEqual(self.batcher.flush(), 2)
+        self.assertEqual(self.batcher.flush(), 2)
+
+    def test_connectionErrorRetried(self):
+        self.server.unreachable = [
+            socket.error("Connection refused"),
+            sg.ProtocolError("https://shotgun", 502, "Bad Gateway", {}),
+        ]
+        self.update(1, 10)
+        self.update(2, 11)
+
+        self.assertEqual(self.batcher.flush(), 0)
+        self.assertEqual(len(self.engine.connAttempts), 2)
+        self.assertEqual(self.engine.discarded, 2)
+        self.assertEqual(self.server.written, [10, 11])
+        self.assertEqual(self.callback.failed, [])
+
+    def test_noConnectionRetried(self):
+        self.engine.unavailable = [
+            connectionPool.ConnectionPoolError("No connection was released.")
+        ]
+        self.update(1, 10)
+
+        self.assertEqual(self.batcher.flush(), 0)
+        self.assertEqual(len(self.engine.connAttempts), 1)
+        self.assertEqual(self.engine.discarded, 0)
+        self.assertEqual(self.server.written, [10])
+
+    def test_connectionErrorWhileSendingOneByOne(self):
+        self.server.rejected.add(10)
+        self.update(1, 10)
+        self.update(2, 11)
+        # The batch and the first write are rejected, then Shotgun can't be
+        # reached.
+        server = self.server
+        batch = server.batch
+
+        def unreachableAfterFailure(shotgun, requests):
+            if len(server.calls) == 2 and not self.engine.connAttempts:
+                server.unreachable.append(socket.error("Connection reset"))
+            return batch(shotgun, requests)
+
+        server.batch = unreachableAfterFailure
+
+        self.assertEqual(self.batcher.flush(), 1)
+        self.assertEqual(self.callback.failed, [(1, 10)])
+        self.assertEqual(len(self.engine.connAttempts), 1)
+        self.assertEqual(server.written, [11])
+
+    def test_notSentWhenStopped(self):
+        self.engine.stopAfterAttempts = 3
+        self.server.unreachable = [socket.error("Connection refused")] * 10
+        self.update(1, 10)
+        self.update(2, 11)
+
+        self.assertEqual(self.batcher.flush(), 2)
+        self.assertEqual(len(self.engine.connAttempts), 3)
+        self.assertEqual(self.callback.failed, [])
+        self.assertEqual(self.callback.notSent, [(1, 10), (2, 11)])
+        self.assertEqual(self.server.written, [])
+
+
+if __name__ == "__main__":
+    unittest.main()